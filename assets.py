@@ -0,0 +1,74 @@
+import json
+import logging
+import mimetypes
+import os
+
+logger = logging.getLogger("chat-service")
+
+# Older mimetypes tables predate these
+mimetypes.add_type("image/avif", ".avif")
+mimetypes.add_type("image/webp", ".webp")
+
+# Hashed names never change content, so caches may keep them for a year
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+# Preference order when the client accepts several encodings
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def _accepts(header, coding):
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        if name.strip().lower() == coding:
+            return params.replace(" ", "") not in ("q=0", "q=0.0")
+    return False
+
+
+class AssetManifest:
+    """
+    Maps source names under static/ to the fingerprinted files written by
+    build_assets.py. Without a manifest every lookup falls back to the plain
+    static file, so a checkout runs without a build step.
+    """
+
+    def __init__(self, directory, prefix="/assets"):
+        self.directory = directory
+        self.prefix    = prefix
+        self.assets    = {}
+        self._files    = {}
+        path = os.path.join(directory, "manifest.json")
+        try:
+            with open(path) as f:
+                self.assets = json.load(f)["assets"]
+        except FileNotFoundError:
+            logger.info("No asset manifest at %s; serving unhashed static files", path)
+            return
+        for entry in self.assets.values():
+            self._files[entry["file"]] = entry.get("encodings", [])
+            for variants in entry.get("variants", {}).values():
+                for _, name in variants:
+                    self._files[name] = []
+
+    def url(self, name, fallback):
+        """URL of the hashed copy of `name`, or `fallback(name)` when there is none."""
+        entry = self.assets.get(name)
+        return f"{self.prefix}/{entry['file']}" if entry else fallback(name)
+
+    def srcset(self, name, fmt):
+        """`srcset` value listing the `fmt` ("avif", "webp") widths of image `name`."""
+        variants = self.assets.get(name, {}).get("variants", {}).get(fmt, [])
+        return ", ".join(f"{self.prefix}/{file} {width}w" for width, file in variants)
+
+    def resolve(self, filename, accept_encoding):
+        """
+        `(file on disk, content encoding or None)` for a request of
+        `filename`, preferring a precompressed copy the client accepts.
+        None when `filename` is not a build output.
+        """
+        encodings = self._files.get(filename)
+        if encodings is None:
+            return None
+        for coding, suffix in ENCODINGS:
+            if coding in encodings and _accepts(accept_encoding, coding):
+                return filename + suffix, coding
+        return filename, None
@@ -0,0 +1,303 @@
+"""
+Load test for the chat service.
+
+By default the app runs in-process on the SQL store (throwaway SQLite) with
+the fake LLM, so no network or credentials are needed:
+
+    python benchmark.py --users 20 --concurrency 8 --output bench.json
+    python benchmark.py --output new.json --compare bench.json
+
+Point it at a running instance (e.g. one started with LLM_BACKEND=fake and
+FIRESTORE_EMULATOR_HOST set) with --url. Results hold throughput and
+p50/p95/p99 latency per operation, plus the per-stage timings the service
+reports in its Server-Timing header.
+"""
+import argparse
+import io
+import json
+import math
+import os
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+TABS  = ["Rainmaker", "Insight-Magus", "Voice Sculptor", "ROI Architect"]
+WORDS = ("pipeline revenue partner launch pricing audience brand proof budget quarter "
+         "campaign retention churn funnel narrative pitch offer segment margin forecast").split()
+
+_TIMING_RE = re.compile(r"([\w-]+)(?:;[^,]*?dur=([\d.]+))?")
+
+
+def sentence(rng, n):
+    return " ".join(rng.choice(WORDS) for _ in range(n)).capitalize() + "."
+
+
+def parse_server_timing(header):
+    """{stage: milliseconds} from a Server-Timing header."""
+    return {name: float(dur) for name, dur in _TIMING_RE.findall(header or "") if dur}
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+# ─── Clients ────────────────────────────────────────────────────────────────────
+class InProcessClient:
+    """Flask test client; one per simulated user (it carries the login cookie)."""
+
+    def __init__(self, app):
+        self._client = app.test_client()
+
+    def request(self, method, path, headers=None, json_body=None, data=None):
+        response = self._client.open(path, method=method, headers=headers, json=json_body,
+                                     data=data, base_url="https://localhost")
+        try:
+            body = response.get_data()
+            return response.status_code, response.headers, body
+        finally:
+            response.close()
+
+
+class HTTPClient:
+    def __init__(self, url):
+        import httpx
+        self._client = httpx.Client(base_url=url, timeout=120.0, follow_redirects=False)
+
+    def request(self, method, path, headers=None, json_body=None, data=None):
+        files = None
+        if data and "file" in data:
+            data = dict(data)
+            stream, filename = data.pop("file")
+            files = {"file": (filename, stream)}
+        response = self._client.request(method, path, headers=headers, json=json_body,
+                                        data=data, files=files)
+        return response.status_code, response.headers, response.content
+
+
+# ─── Scenario ───────────────────────────────────────────────────────────────────
+class Recorder:
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self._lock   = threading.Lock()
+
+    def call(self, client, op, method, path, **kwargs):
+        start = time.perf_counter()
+        status, headers, body = client.request(method, path, **kwargs)
+        elapsed = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self.samples[op].append({
+                "ms":     elapsed,
+                "ok":     status < 400,
+                "status": status,
+                "stages": parse_server_timing(headers.get("Server-Timing"))
+            })
+        return status, body
+
+
+def seed_history(store, username, tab, chat_id, messages, rng):
+    """Write `messages` old messages straight into the store, in one turn."""
+    start = datetime.utcnow() - timedelta(days=1)
+    entries = [{
+        "role":      "user" if i % 2 == 0 else "assistant",
+        "content":   sentence(rng, rng.randint(8, 60)),
+        "timestamp": (start + timedelta(seconds=i)).isoformat()
+    } for i in range(messages)]
+    store.commit_turn({
+        "username": username, "tab": tab, "chat_id": chat_id, "messages": entries,
+        "session":  {"created_at": entries[0]["timestamp"], "last_message_at": entries[-1]["timestamp"],
+                     "title": entries[0]["content"][:60]},
+        "usage":    {"turns": 0, "prompt_tokens": 0, "completion_tokens": 0},
+        "at":       entries[-1]["timestamp"]
+    })
+
+
+def run_user(index, args, make_client, recorder, store):
+    rng      = random.Random(args.seed + index)
+    client   = make_client()
+    username = f"bench-{args.run_id}-{index}"
+    stream   = {"Accept": "text/event-stream"}
+
+    recorder.call(client, "login", "POST", "/", data={"username": username, "password": "bench"})
+
+    for s in range(args.sessions):
+        tab     = TABS[(index + s) % len(TABS)]
+        chat_id = f"{tab}_bench_{index}_{s}"
+        if store is not None and args.history:
+            seed_history(store, username, tab, chat_id, args.history, rng)
+        elif args.history:
+            for _ in range(args.history // 2):
+                recorder.call(client, "seed", "POST", "/chat",
+                              json_body={"message": sentence(rng, 20), "tab": tab, "chat_id": chat_id})
+
+        recorder.call(client, "sessions", "GET", f"/sessions/{tab}?limit=20")
+        recorder.call(client, "history", "GET", f"/history/{tab}/{chat_id}?limit=50")
+
+        for t in range(args.turns):
+            body = {"message": sentence(rng, rng.randint(5, 30)), "tab": tab, "chat_id": chat_id}
+            if args.stream and t % 2:
+                recorder.call(client, "chat_stream", "POST", "/chat", headers=stream, json_body=body)
+            else:
+                recorder.call(client, "chat", "POST", "/chat", json_body=body)
+
+        if args.upload_kb:
+            text = " ".join(sentence(rng, 15) for _ in range(args.upload_kb * 1024 // 120))
+            upload = (io.BytesIO(text.encode()), f"brief-{index}-{s}.txt")
+            recorder.call(client, "chat_with_file", "POST", "/chat_with_file",
+                          headers=stream if args.stream else None,
+                          data={"message": "Summarize the budget section", "tab": tab,
+                                "chat_id": chat_id, "file": upload})
+
+        recorder.call(client, "history_delta", "GET",
+                      f"/history/{tab}/{chat_id}?since={datetime.utcnow() - timedelta(minutes=5):%Y-%m-%dT%H:%M:%S}")
+
+    # Drop the last session, as a user tidying up would
+    tab = TABS[(index + args.sessions - 1) % len(TABS)]
+    recorder.call(client, "delete_chat", "DELETE", f"/delete_chat/{tab}/{tab}_bench_{index}_{args.sessions - 1}")
+
+
+# ─── Reporting ──────────────────────────────────────────────────────────────────
+def summarize(samples, duration):
+    ops = {}
+    for op, rows in sorted(samples.items()):
+        ms = [r["ms"] for r in rows]
+        stages = defaultdict(list)
+        for r in rows:
+            for name, dur in r["stages"].items():
+                stages[name].append(dur)
+        statuses = defaultdict(int)
+        for r in rows:
+            statuses[str(r["status"])] += 1
+        ops[op] = {
+            "count":      len(rows),
+            "errors":     sum(not r["ok"] for r in rows),
+            "statuses":   dict(statuses),
+            "throughput": round(len(rows) / duration, 2),
+            "mean_ms":    round(sum(ms) / len(ms), 2),
+            "p50_ms":     round(percentile(ms, 50), 2),
+            "p95_ms":     round(percentile(ms, 95), 2),
+            "p99_ms":     round(percentile(ms, 99), 2),
+            "stages":     {name: {"p50_ms": round(percentile(d, 50), 2), "p95_ms": round(percentile(d, 95), 2)}
+                           for name, d in sorted(stages.items())}
+        }
+    total = sum(len(rows) for rows in samples.values())
+    return ops, {"requests": total, "duration_s": round(duration, 2), "throughput": round(total / duration, 2)}
+
+
+def print_report(ops, total):
+    print(f"{'operation':<16}{'count':>7}{'err':>5}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}  stages (p50 ms)")
+    for op, r in ops.items():
+        stages = " ".join(f"{k}={v['p50_ms']}" for k, v in r["stages"].items())
+        print(f"{op:<16}{r['count']:>7}{r['errors']:>5}{r['throughput']:>9}"
+              f"{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}  {stages}")
+    print(f"\n{total['requests']} requests in {total['duration_s']} s ({total['throughput']} req/s)")
+
+
+def compare(ops, baseline, threshold):
+    """Print changes against a saved run; returns True if any p95 regressed past `threshold` %."""
+    regressed = False
+    print(f"\n{'operation':<16}{'p50 Δ%':>10}{'p95 Δ%':>10}{'p99 Δ%':>10}")
+    for op, r in ops.items():
+        old = baseline["ops"].get(op)
+        if not old:
+            continue
+        deltas = [(r[k] - old[k]) / old[k] * 100 if old[k] else 0.0 for k in ("p50_ms", "p95_ms", "p99_ms")]
+        flag = ""
+        if deltas[1] > threshold:
+            regressed, flag = True, "  ← regression"
+        print(f"{op:<16}" + "".join(f"{d:>+10.1f}" for d in deltas) + flag)
+    return regressed
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="benchmark a running server instead of an in-process app")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=8, help="users running at the same time")
+    parser.add_argument("--sessions", type=int, default=2, help="sessions per user")
+    parser.add_argument("--history", type=int, default=60, help="messages pre-seeded per session")
+    parser.add_argument("--turns", type=int, default=4, help="chat turns per session")
+    parser.add_argument("--upload-kb", type=int, default=256, help="upload size per session; 0 skips uploads")
+    parser.add_argument("--stream", action="store_true", help="stream every other turn over SSE")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="fake LLM seconds before first token")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="fake LLM seconds between words")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    parser.add_argument("--fail-over", type=float, default=10.0,
+                        help="exit 1 when a p95 regresses by more than this %% against --compare")
+    args = parser.parse_args()
+    args.run_id = format(int(time.time()), "x")
+
+    store = None
+    if args.url:
+        def make_client():
+            return HTTPClient(args.url)
+    else:
+        # In-process: SQL store and fake LLM unless the environment says otherwise
+        os.environ.setdefault("STORAGE_BACKEND", "sql")
+        os.environ.setdefault("DATABASE_URL", "sqlite://")
+        os.environ.setdefault("LLM_BACKEND", "fake")
+        os.environ["FAKE_LLM_LATENCY"]     = str(args.llm_latency)
+        os.environ["FAKE_LLM_TOKEN_DELAY"] = str(args.token_delay)
+        os.environ.setdefault("USER_MAX_IN_FLIGHT", "4")
+        import logging
+        logging.disable(logging.INFO)
+        import main as service
+        store = service.store
+
+        def make_client():
+            return InProcessClient(service.app)
+
+    recorder = Recorder()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        futures = [pool.submit(run_user, i, args, make_client, recorder, store) for i in range(args.users)]
+        for f in futures:
+            f.result()
+    duration = time.perf_counter() - started
+
+    ops, total = summarize(recorder.samples, duration)
+    print_report(ops, total)
+
+    results = {
+        "meta": {
+            "commit":    git_commit(),
+            "timestamp": datetime.utcnow().isoformat(),
+            "target":    args.url or "in-process",
+            "params":    {k: v for k, v in vars(args).items() if k not in ("output", "compare", "run_id")}
+        },
+        "total": total,
+        "ops":   ops
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"Compared with {baseline['meta'].get('commit') or args.compare}:")
+        if compare(ops, baseline, args.fail_over):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
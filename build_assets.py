@@ -0,0 +1,140 @@
+"""
+Build fingerprinted static assets into static/dist/.
+
+    python build_assets.py
+
+Every file in static/ is copied under a content-hashed name. Images also
+get WebP and AVIF variants at a few widths, and text assets (CSS, JS, SVG)
+get gzip and, with the `brotli` package installed, brotli copies. The
+manifest.json written alongside maps source names to outputs; main.py
+reads it to resolve `asset_url()` and serves the outputs from /assets with
+immutable cache headers. Pillow is needed for image variants; without it,
+or without AVIF support in Pillow, those variants are skipped.
+"""
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ROOT   = os.path.dirname(os.path.abspath(__file__))
+STATIC = os.path.join(ROOT, "static")
+
+IMAGE_TYPES = {".png", ".jpg", ".jpeg"}
+TEXT_TYPES  = {".css", ".js", ".svg", ".json", ".txt"}
+
+# Widths for srcset; images narrower than one of these stop at their own width
+WIDTHS  = (320, 640, 1280)
+QUALITY = {"webp": 80, "avif": 55}
+
+
+def digest(data):
+    return hashlib.sha256(data).hexdigest()[:10]
+
+
+def write_hashed(out_dir, stem, ext, data):
+    """Write `data` as `<stem>.<hash><ext>`; returns the file name."""
+    name = f"{stem}.{digest(data)}{ext}"
+    with open(os.path.join(out_dir, name), "wb") as f:
+        f.write(data)
+    return name
+
+
+def compress(out_dir, name, data):
+    """Write .gz/.br siblings of `name` that are smaller than it; returns their encodings."""
+    encodings = []
+    candidates = [("gzip", ".gz", gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        candidates.insert(0, ("br", ".br", brotli.compress(data, quality=11)))
+    for coding, suffix, packed in candidates:
+        if len(packed) < len(data) * 0.9:
+            with open(os.path.join(out_dir, name + suffix), "wb") as f:
+                f.write(packed)
+            encodings.append(coding)
+    return encodings
+
+
+def encode(image, fmt):
+    buf = io.BytesIO()
+    image.save(buf, fmt.upper(), quality=QUALITY[fmt])
+    return buf.getvalue()
+
+
+def image_variants(out_dir, stem, data):
+    """{"avif": [[width, file], ...], "webp": [...]} for the image in `data`."""
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+    widths = [w for w in WIDTHS if w < image.width] + [image.width]
+
+    variants = {}
+    for fmt in ("avif", "webp"):
+        files = []
+        for width in widths:
+            height  = round(image.height * width / image.width)
+            resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+            try:
+                encoded = encode(resized, fmt)
+            except (KeyError, OSError):
+                print(f"  {fmt} not supported by this Pillow; skipped")
+                break
+            files.append([width, write_hashed(out_dir, f"{stem}.{width}", f".{fmt}", encoded)])
+        if files:
+            variants[fmt] = files
+    return {"width": image.width, "height": image.height, "variants": variants}
+
+
+def build(source, out_dir):
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.makedirs(out_dir)
+
+    assets = {}
+    for name in sorted(os.listdir(source)):
+        path = os.path.join(source, name)
+        if not os.path.isfile(path):
+            continue
+        stem, ext = os.path.splitext(name)
+        with open(path, "rb") as f:
+            data = f.read()
+
+        entry = {"file": write_hashed(out_dir, stem, ext, data)}
+        if ext.lower() in TEXT_TYPES:
+            entry["encodings"] = compress(out_dir, entry["file"], data)
+        elif ext.lower() in IMAGE_TYPES and Image is not None:
+            entry.update(image_variants(out_dir, stem, data))
+        assets[name] = entry
+        print(f"{name}: {entry['file']}")
+
+    with open(os.path.join(out_dir, "manifest.json"), "w") as f:
+        json.dump({"assets": assets}, f, indent=2, sort_keys=True)
+    return assets
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", default=STATIC)
+    parser.add_argument("--out", default=os.path.join(STATIC, "dist"))
+    args = parser.parse_args()
+    if Image is None:
+        print("Pillow is not installed; image variants are skipped")
+    if brotli is None:
+        print("brotli is not installed; only gzip copies are written")
+    assets = build(args.source, args.out)
+    print(f"{len(assets)} assets written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger("chat-service")
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries also expire `ttl` seconds after they
+    were filled.
+
+    Loads that race with writes use `reserve()` / `fill()`: a reservation is
+    cancelled by any `update()` or `pop()` of the same key, so a slow reader
+    can never put back data that a concurrent writer has already changed.
+    """
+
+    def __init__(self, maxsize=512, ttl=600.0):
+        self.maxsize = maxsize
+        self.ttl     = ttl
+        self._data   = OrderedDict()   # key -> (expires_at, value)
+        self._reserved = {}
+        self._lock   = threading.Lock()
+        self.hits      = 0
+        self.misses    = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._reserved.pop(key, None)
+            self._store(key, value)
+
+    def update(self, key, fn):
+        """Replace a cached value with `fn(value)`; no-op when not cached."""
+        with self._lock:
+            self._reserved.pop(key, None)
+            item = self._data.get(key)
+            if item is None:
+                return False
+            self._data[key] = (item[0], fn(item[1]))
+            return True
+
+    def pop(self, key):
+        with self._lock:
+            self._reserved.pop(key, None)
+            item = self._data.pop(key, None)
+            return None if item is None else item[1]
+
+    def pop_matching(self, predicate):
+        """Drop every key for which `predicate(key)` is true."""
+        with self._lock:
+            for key in [k for k in self._data if predicate(k)]:
+                del self._data[key]
+            for key in [k for k in self._reserved if predicate(k)]:
+                del self._reserved[key]
+
+    def reserve(self, key):
+        """Start a load for `key`; pass the token to `fill()` when done."""
+        token = object()
+        with self._lock:
+            self._reserved[key] = token
+        return token
+
+    def fill(self, key, value, token):
+        """Store a loaded value unless a write touched `key` meanwhile."""
+        with self._lock:
+            if self._reserved.get(key) is not token:
+                return False
+            del self._reserved[key]
+            self._store(key, value)
+            return True
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size":      len(self._data),
+                "hits":      self.hits,
+                "misses":    self.misses,
+                "evictions": self.evictions,
+                "hit_rate":  round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def _store(self, key, value):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+
+# ─── Response Cache ─────────────────────────────────────────────────────────────
+class MemoryBackend:
+    """Per-process backend on top of TTLCache."""
+
+    def __init__(self, maxsize=1000, ttl=3600.0):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def get(self, key):
+        return self._cache.get(key)
+
+    def set(self, key, value):
+        self._cache.set(key, value)
+
+
+class SQLiteBackend:
+    """
+    Local stand-in for a shared cache such as Redis: a SQLite file that all
+    worker processes on an instance can read and write. Entries expire after
+    `ttl` seconds and the least recently used are trimmed past `maxsize`.
+    """
+
+    def __init__(self, path, maxsize=10000, ttl=3600.0):
+        self.path    = path
+        self.maxsize = maxsize
+        self.ttl     = ttl
+        self._local  = threading.local()
+        self._writes = 0
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL, used_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_used_at ON responses (used_at)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        now  = time.time()
+        conn = self._connect()
+        row  = conn.execute(
+            "SELECT value FROM responses WHERE key = ? AND expires_at > ?", (key, now)
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE responses SET used_at = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def set(self, key, value):
+        now  = time.time()
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO responses (key, value, expires_at, used_at) VALUES (?, ?, ?, ?)",
+            (key, value, now + self.ttl, now)
+        )
+        self._writes += 1
+        if self._writes % 100 == 0:
+            conn.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+            conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses"
+                " ORDER BY used_at DESC LIMIT -1 OFFSET ?)", (self.maxsize,)
+            )
+
+
+class ResponseCache:
+    """
+    Opt-in cache of model replies keyed on the model, the tab prompt, a hash
+    of the system instruction and the whitespace/case-normalized rest of the
+    prompt. Only tabs listed in `tabs` are cached ("*" means every tab).
+    """
+
+    def __init__(self, backend, tabs=()):
+        self.backend = backend
+        self.tabs    = set(tabs)
+        self._lock   = threading.Lock()
+        self.hits    = 0
+        self.misses  = 0
+        self.stores  = 0
+
+    def enabled(self, tab):
+        return "*" in self.tabs or tab in self.tabs
+
+    @staticmethod
+    def key(model, tab_prompt, system_instruction, messages):
+        normalized = [(m["role"], " ".join(m["content"].split()).lower()) for m in messages]
+        payload = json.dumps({
+            "model":  model,
+            "tab":    tab_prompt,
+            "system": hashlib.sha256(system_instruction.encode()).hexdigest(),
+            "context": normalized
+        }, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, tab, key):
+        if not self.enabled(tab):
+            return None
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            logger.warning(f"Response cache read failed: {e}")
+            value = None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def put(self, tab, key, reply):
+        if not reply or not self.enabled(tab):
+            return
+        try:
+            self.backend.set(key, reply)
+        except Exception as e:
+            logger.warning(f"Response cache write failed: {e}")
+            return
+        with self._lock:
+            self.stores += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "tabs":     sorted(self.tabs),
+                "backend":  type(self.backend).__name__,
+                "hits":     self.hits,
+                "misses":   self.misses,
+                "stores":   self.stores,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
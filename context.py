@@ -0,0 +1,83 @@
+import logging
+from functools import lru_cache
+
+logger = logging.getLogger("chat-service")
+
+# Every chat message costs a few framing tokens on top of its content.
+MESSAGE_OVERHEAD = 4
+
+# Uploaded files are stored as user messages with this prefix.
+FILE_PREFIX = "[File: "
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    # tiktoken (in requirements.txt) gives exact counts for the gpt-4o
+    # family. If it or its encoding file is missing, counts fall back to
+    # ~4 characters per token, with a warning in the log.
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        logger.warning(f"tiktoken unavailable ({e}); estimating tokens at 4 characters each")
+        return None
+
+
+def count_tokens(text):
+    enc = _encoding()
+    if enc is not None:
+        return len(enc.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def truncate_tokens(text, limit):
+    """
+    Shorten `text` to about `limit` tokens, keeping its beginning and end
+    (titles and conclusions matter most in documents) around a marker.
+    """
+    total = count_tokens(text)
+    if total <= limit:
+        return text
+    marker = f"\n\n[… {total - limit} tokens omitted …]\n\n"
+    keep   = max(limit - count_tokens(marker), 0)
+    head   = keep * 3 // 4
+    tail   = keep - head
+
+    enc = _encoding()
+    if enc is not None:
+        tokens = enc.encode(text, disallowed_special=())
+        return enc.decode(tokens[:head]) + marker + (enc.decode(tokens[-tail:]) if tail else "")
+    return text[:head * 4] + marker + (text[-tail * 4:] if tail else "")
+
+
+def build_context(system_prompts, history, budget, file_token_limit):
+    """
+    Pack the system prompts plus as many of the most recent `history`
+    messages as fit into `budget` tokens.
+
+    `history` is oldest-first and should already end with the current turn.
+    File messages longer than `file_token_limit` are cut down before they
+    are counted, and the newest message is always kept (truncated to the
+    remaining budget if need be). Returns `(messages, token_count)`.
+    """
+    messages = [{"role": "system", "content": p} for p in system_prompts if p]
+    used = sum(count_tokens(m["content"]) + MESSAGE_OVERHEAD for m in messages)
+
+    tail = []
+    for m in reversed(history):
+        content = m["content"]
+        if content.startswith(FILE_PREFIX):
+            content = truncate_tokens(content, file_token_limit)
+
+        cost = count_tokens(content) + MESSAGE_OVERHEAD
+        if used + cost > budget:
+            if tail:
+                break
+            content = truncate_tokens(content, max(budget - used - MESSAGE_OVERHEAD, 0))
+            cost    = count_tokens(content) + MESSAGE_OVERHEAD
+
+        tail.append({"role": m["role"], "content": content})
+        used += cost
+
+    messages.extend(reversed(tail))
+    return messages, used
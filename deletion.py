@@ -0,0 +1,145 @@
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+
+logger = logging.getLogger("chat-service")
+
+# Firestore caps a batch at 500 writes; stay a little below it.
+BATCH_SIZE = 400
+
+
+# ─── Tree Walking ───────────────────────────────────────────────────────────────
+def iter_tree(doc_ref):
+    """Yield every document below `doc_ref`, then `doc_ref` itself."""
+    for sub in doc_ref.collections():
+        yield from iter_collection(sub)
+    yield doc_ref
+
+
+def iter_collection(col_ref):
+    """
+    Yield every document in `col_ref` and below it. `list_documents` also
+    returns ids that only exist as parents of subcollections, which a plain
+    query would skip.
+    """
+    for doc_ref in col_ref.list_documents(page_size=500):
+        yield from iter_tree(doc_ref)
+
+
+# ─── Batched Deletes ────────────────────────────────────────────────────────────
+def _commit_deletes(db, refs):
+    batch = db.batch()
+    for ref in refs:
+        batch.delete(ref)
+    batch.commit()
+    return len(refs)
+
+
+def delete_refs(db, refs, batch_size=BATCH_SIZE, parallelism=8, progress=None):
+    """
+    Delete an iterable of document refs in batches of `batch_size`, with up
+    to `parallelism` commits in flight. `refs` is consumed lazily, so a walk
+    over a large tree never has to fit in memory. Returns the delete count.
+    """
+    deleted = 0
+    pending = set()
+
+    def collect(futures):
+        nonlocal deleted
+        for f in futures:
+            deleted += f.result()
+        if progress:
+            progress(deleted)
+
+    with ThreadPoolExecutor(max_workers=parallelism, thread_name_prefix="delete") as pool:
+        chunk = []
+        for ref in refs:
+            chunk.append(ref)
+            if len(chunk) < batch_size:
+                continue
+            if len(pending) >= parallelism:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending.add(pool.submit(_commit_deletes, db, chunk))
+            chunk = []
+        if chunk:
+            pending.add(pool.submit(_commit_deletes, db, chunk))
+        collect(wait(pending).done)
+    return deleted
+
+
+# ─── Background Jobs ────────────────────────────────────────────────────────────
+class DeletionJobs:
+    """
+    Runs deletions in the background and keeps their status in `store`
+    (`put_job`/`get_job`) for an hour, so any worker or instance can answer
+    a poll. Progress is written at most every `save_every` seconds;
+    re-running a deletion is always safe.
+    """
+
+    def __init__(self, store, max_running=2, keep_for=3600.0, save_every=1.0):
+        self._store      = store
+        self._pool       = ThreadPoolExecutor(max_workers=max_running, thread_name_prefix="delete-job")
+        self._keep_for   = keep_for
+        self._save_every = save_every
+        self._lock       = threading.Lock()
+
+    def start(self, owner, description, run):
+        """
+        Queue `run(progress)` and return the job id. `run` returns the number
+        of deleted documents and may call `progress(count)` along the way.
+        """
+        job_id = uuid.uuid4().hex
+        now = datetime.utcnow()
+        job = {
+            "job_id":      job_id,
+            "owner":       owner,
+            "description": description,
+            "status":      "queued",
+            "deleted":     0,
+            "error":       None,
+            "created_at":  now.isoformat(),
+            "finished_at": None,
+            "expires_at":  (now + timedelta(seconds=self._keep_for)).isoformat()
+        }
+        self._store.put_job(job_id, job)
+        self._pool.submit(self._run, job, run)
+        return job_id
+
+    def get(self, job_id, owner):
+        job = self._store.get_job(job_id)
+        if job is None or job["owner"] != owner or job["expires_at"] <= datetime.utcnow().isoformat():
+            return None
+        return {k: v for k, v in job.items() if k not in ("owner", "expires_at")}
+
+    def _save(self, job, **changes):
+        with self._lock:
+            job.update(changes)
+            snapshot = dict(job)
+        try:
+            self._store.put_job(job["job_id"], snapshot)
+        except Exception as e:
+            logger.warning(f"Deletion job {job['job_id']} status not saved: {e}")
+
+    def _run(self, job, run):
+        saved = [time.monotonic()]
+
+        def progress(count):
+            if time.monotonic() - saved[0] >= self._save_every:
+                saved[0] = time.monotonic()
+                self._save(job, deleted=count)
+            else:
+                with self._lock:
+                    job["deleted"] = count
+
+        self._save(job, status="running")
+        try:
+            deleted = run(progress)
+            changes = {"status": "done", "deleted": deleted}
+        except Exception as e:
+            logger.error(f"Deletion job {job['job_id']} failed: {e}")
+            changes = {"status": "failed", "error": str(e)}
+        self._save(job, finished_at=datetime.utcnow().isoformat(), **changes)
@@ -0,0 +1,67 @@
+# Gunicorn settings for Cloud Run / container deployments.
+#
+#   gunicorn --config gunicorn.conf.py main:app
+#
+# Every knob can be overridden through the environment so the same image can
+# be re-sized per service without a rebuild.
+import os
+import sys
+
+# ─── Binding ────────────────────────────────────────────────────────────────────
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+
+# ─── Workers ────────────────────────────────────────────────────────────────────
+# Chat requests spend almost all of their time waiting on OpenAI and
+# Firestore, so a handful of processes with many threads each keeps the CPU
+# busy without paying for extra interpreters. `gthread` needs nothing beyond
+# gunicorn itself; `gevent` works too once gevent is installed in the image.
+workers      = int(os.getenv("WEB_CONCURRENCY", "2"))
+threads      = int(os.getenv("GUNICORN_THREADS", "8"))
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "100"))  # gevent only
+
+# ─── Timeouts ───────────────────────────────────────────────────────────────────
+# With gthread and gevent workers this is not a request timeout: the
+# worker's main loop sends the heartbeat while requests run on other threads
+# or greenlets, so a long streamed reply never trips it (Cloud Run owns the
+# request timeout). It restarts a worker whose loop has stopped, e.g. one
+# stuck holding the GIL or blocking the gevent hub.
+timeout   = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+
+# Cloud Run sends SIGTERM and kills the container 10 s later; stop accepting
+# new connections and give in-flight chats until just before that to finish.
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "9"))
+
+# Recycle workers now and then so slow leaks never reach the memory limit.
+max_requests        = int(os.getenv("GUNICORN_MAX_REQUESTS", "1000"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "100"))
+
+# ─── Logging ────────────────────────────────────────────────────────────────────
+accesslog = "-"
+errorlog  = "-"
+loglevel  = os.getenv("GUNICORN_LOG_LEVEL", "info")
+
+# The gRPC channel inside the Firestore client is not fork-safe, so each
+# worker imports the app (and opens its own client) after forking.
+preload_app = False
+
+# EAGER_WARMUP=1 opens the storage and model connections in each worker
+# before it takes traffic; otherwise they open on the first request that
+# needs them (or on a GET /_ah/warmup).
+eager_warmup = os.getenv("EAGER_WARMUP", "0") == "1"
+
+
+
+def post_worker_init(worker):
+    app_module = sys.modules.get("main")
+    if eager_warmup and app_module is not None:
+        app_module.warmup()
+
+
+def worker_exit(server, worker):
+    # Commit any chat turns still sitting in the write-behind queue before
+    # the worker process goes away.
+    app_module = sys.modules.get("main")
+    if app_module is not None:
+        app_module.write_queue.close(timeout=graceful_timeout)
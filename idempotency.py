@@ -0,0 +1,149 @@
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from cache import TTLCache
+
+logger = logging.getLogger("chat-service")
+
+
+class InProgress(Exception):
+    """The original request is still running; the caller should answer 409."""
+
+    def __init__(self, retry_after=2):
+        super().__init__("Request with this idempotency key is still in progress")
+        self.retry_after = retry_after
+
+
+class _Pending:
+    def __init__(self):
+        self.event = threading.Event()
+
+
+class Claim:
+    """
+    Outcome of `IdempotencyStore.claim()`. The leader runs the request and
+    must call `finish(result)` or `abandon()`; otherwise `result` holds the
+    stored result to replay.
+    """
+
+    def __init__(self, store, key, pending=None, result=None):
+        self._store  = store
+        self.key     = key
+        self.pending = pending
+        self.result  = result
+
+    @property
+    def leader(self):
+        return self.pending is not None
+
+    def finish(self, result):
+        if self.leader:
+            self._store._settle(self.key, self.pending, result)
+
+    def abandon(self):
+        """Give the key up without a result, so a retry runs the request again."""
+        if self.leader:
+            self._store._settle(self.key, self.pending, None)
+
+
+class IdempotencyStore:
+    """
+    Coalesces requests that share an idempotency key: the first one runs,
+    concurrent duplicates wait for its result, and later ones replay it for
+    `window` seconds.
+
+    Duplicates in this process wait on an event. With a `store`, the key is
+    also claimed there (created if absent), so duplicates that reach another
+    worker or instance find it and poll for the result. A claim whose
+    leader died is taken over once its `lease` seconds have passed.
+    """
+
+    def __init__(self, store=None, window=600.0, lease=300.0, maxsize=10000, poll=0.25):
+        self._store    = store
+        self.window    = window
+        self.lease     = lease
+        self._poll     = poll
+        self._done     = TTLCache(maxsize=maxsize, ttl=window)
+        self._inflight = {}
+        self._lock     = threading.Lock()
+        self.replayed  = 0
+
+    def claim(self, key, wait=60.0):
+        """
+        Return a leader Claim, or a Claim carrying the stored result after
+        waiting up to `wait` seconds for an in-flight duplicate. Raises
+        InProgress if that wait runs out. A duplicate whose leader gave up
+        becomes the new leader.
+        """
+        while True:
+            with self._lock:
+                result = self._done.get(key)
+                if result is not None:
+                    self.replayed += 1
+                    return Claim(self, key, result=result)
+                pending = self._inflight.get(key)
+                leader  = pending is None
+                if leader:
+                    pending = self._inflight[key] = _Pending()
+            if not leader:
+                if not pending.event.wait(wait):
+                    raise InProgress()
+                continue
+
+            try:
+                result = self._claim_shared(key, wait)
+            except BaseException:
+                self._release(key, pending, None)
+                raise
+            if result is None:
+                return Claim(self, key, pending=pending)
+            # Another process ran it: replay, and let local duplicates too
+            self._release(key, pending, result)
+            with self._lock:
+                self.replayed += 1
+            return Claim(self, key, result=result)
+
+    def _claim_shared(self, key, wait):
+        """None once this process holds `key` in the store, else the other holder's result."""
+        if self._store is None:
+            return None
+        deadline = time.monotonic() + wait
+        delay    = self._poll
+        while True:
+            now = datetime.utcnow()
+            record = {"status": "pending", "result": None,
+                      "expires_at": (now + timedelta(seconds=self.lease)).isoformat()}
+            held = self._store.claim_idempotency_key(key, record, now.isoformat())
+            if held is None:
+                return None
+            if held.get("result") is not None:
+                return held["result"]
+            if time.monotonic() + delay > deadline:
+                raise InProgress()
+            time.sleep(delay)
+            delay = min(delay * 2, 2.0)
+
+    def _settle(self, key, pending, result):
+        if not self._release(key, pending, result) or self._store is None:
+            return
+        try:
+            if result is None:
+                self._store.delete_idempotency_key(key)
+            else:
+                expires_at = datetime.utcnow() + timedelta(seconds=self.window)
+                self._store.put_idempotency_key(key, {"status": "done", "result": result,
+                                                      "expires_at": expires_at.isoformat()})
+        except Exception as e:
+            logger.warning(f"Idempotency key not settled in the store: {e}")
+
+    def _release(self, key, pending, result):
+        with self._lock:
+            if self._inflight.get(key) is not pending:
+                return False
+            del self._inflight[key]
+            if result is not None:
+                self._done.set(key, result)
+        pending.event.set()
+        return True
@@ -0,0 +1,162 @@
+import codecs
+import logging
+import os
+import re
+import zipfile
+from collections import namedtuple
+from xml.etree import ElementTree
+
+logger = logging.getLogger("chat-service")
+
+Extracted = namedtuple("Extracted", "text kind truncated")
+
+CHUNK_SIZE = 64 * 1024
+
+_WORD_NS  = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_DRAW_NS  = "{http://schemas.openxmlformats.org/drawingml/2006/main}"
+_SLIDE_RE = re.compile(r"ppt/slides/slide(\d+)\.xml$")
+
+
+# ─── Whitespace ─────────────────────────────────────────────────────────────────
+def normalize_whitespace(text):
+    """Collapse runs of spaces/tabs, trim lines, keep at most one blank line."""
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    text = re.sub(r"[ \t\f\v\u00a0]+", " ", text)
+    text = re.sub(r" *\n *", "\n", text)
+    text = re.sub(r"\n{3,}", "\n\n", text)
+    return text.strip()
+
+
+class _Budget:
+    """Collects text pieces until `limit` normalized characters are reached."""
+
+    def __init__(self, limit):
+        self.limit  = limit
+        self.pieces = []
+        self.raw    = 0
+        self.text   = ""
+
+    def add(self, piece):
+        self.pieces.append(piece)
+        self.raw += len(piece)
+        # Only re-normalize once enough raw text has piled up to matter
+        if self.raw >= self.limit:
+            self.text = normalize_whitespace("".join(self.pieces))
+            self.pieces, self.raw = [self.text], len(self.text)
+        return self.full()
+
+    def full(self):
+        return len(self.text) >= self.limit
+
+    def result(self, kind, more=False):
+        text = normalize_whitespace("".join(self.pieces))
+        truncated = more or len(text) > self.limit
+        return Extracted(text[:self.limit], kind, truncated)
+
+
+# ─── Type Detection ─────────────────────────────────────────────────────────────
+def detect_kind(head, filename):
+    ext = os.path.splitext(filename or "")[1].lower()
+    if head.startswith(b"%PDF-"):
+        return "pdf"
+    if head.startswith(b"PK\x03\x04"):
+        if ext in (".docx", ".pptx"):
+            return ext[1:]
+        return "zip"
+    if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "text"
+    if b"\x00" in head:
+        return "binary"
+    return "text"
+
+
+# ─── Extractors ─────────────────────────────────────────────────────────────────
+def _extract_text(stream, head, budget):
+    if head.startswith(codecs.BOM_UTF16_LE) or head.startswith(codecs.BOM_UTF16_BE):
+        decoder = codecs.getincrementaldecoder("utf-16")(errors="replace")
+    else:
+        decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+
+    chunk = head
+    while chunk:
+        if budget.add(decoder.decode(chunk)):
+            return budget.result("text", more=True)
+        chunk = stream.read(CHUNK_SIZE)
+    budget.add(decoder.decode(b"", final=True))
+    return budget.result("text")
+
+
+def _iter_xml_text(member, text_tag, paragraph_tag, breaks):
+    """
+    Yield text runs from an OOXML part, with newlines between paragraphs and
+    `breaks[tag]` for tab/line-break elements.
+    """
+    for event, elem in ElementTree.iterparse(member, events=("end",)):
+        if elem.tag == text_tag and elem.text:
+            yield elem.text
+        elif elem.tag in breaks:
+            yield breaks[elem.tag]
+        elif elem.tag == paragraph_tag:
+            yield "\n"
+            elem.clear()
+
+
+def _extract_docx(stream, budget):
+    with zipfile.ZipFile(stream) as zf, zf.open("word/document.xml") as member:
+        breaks = {f"{_WORD_NS}tab": " ", f"{_WORD_NS}br": "\n", f"{_WORD_NS}cr": "\n"}
+        for piece in _iter_xml_text(member, f"{_WORD_NS}t", f"{_WORD_NS}p", breaks):
+            if budget.add(piece):
+                return budget.result("docx", more=True)
+    return budget.result("docx")
+
+
+def _extract_pptx(stream, budget):
+    with zipfile.ZipFile(stream) as zf:
+        slides = sorted(
+            (int(m.group(1)), name) for name in zf.namelist() if (m := _SLIDE_RE.match(name))
+        )
+        for number, name in slides:
+            budget.add(f"\n\n[Slide {number}]\n")
+            with zf.open(name) as member:
+                for piece in _iter_xml_text(member, f"{_DRAW_NS}t", f"{_DRAW_NS}p", {f"{_DRAW_NS}br": "\n"}):
+                    if budget.add(piece):
+                        return budget.result("pptx", more=True)
+    return budget.result("pptx")
+
+
+def _extract_pdf(stream, budget):
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        return Extracted("", "pdf", False)
+    reader = PdfReader(stream)
+    for page in reader.pages:
+        if budget.add((page.extract_text() or "") + "\n\n"):
+            return budget.result("pdf", more=True)
+    return budget.result("pdf")
+
+
+def extract_text(file_storage, char_budget):
+    """
+    Pull up to `char_budget` characters of normalized text out of an
+    uploaded file. Plain text is decoded incrementally and reading stops as
+    soon as the budget is met; DOCX/PPTX/PDF need random access, which the
+    request's spooled upload stream already provides.
+    """
+    stream = file_storage.stream
+    head   = stream.read(CHUNK_SIZE)
+    kind   = detect_kind(head, file_storage.filename)
+    budget = _Budget(char_budget)
+
+    if kind == "text":
+        return _extract_text(stream, head, budget)
+    if kind in ("docx", "pptx", "pdf"):
+        stream.seek(0)
+        extractor = {"docx": _extract_docx, "pptx": _extract_pptx, "pdf": _extract_pdf}[kind]
+        try:
+            return extractor(stream, budget)
+        except Exception as e:
+            # Corrupt or password-protected documents: keep the chat going
+            logger.warning(f"Could not extract {kind} upload {file_storage.filename}: {e}")
+            return Extracted("", kind, False)
+    return Extracted("", kind, False)
@@ -0,0 +1,131 @@
+import math
+import threading
+import time
+from collections import Counter
+
+
+class Saturated(Exception):
+    """Admission refused; the caller should answer 429 with `retry_after`."""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason      = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class TokenBucket:
+    """`rate` tokens per second, bursting up to `capacity`."""
+
+    def __init__(self, rate, capacity):
+        self.rate     = rate
+        self.capacity = capacity
+        self._tokens  = capacity
+        self._stamp   = time.monotonic()
+        self._lock    = threading.Lock()
+
+    def take(self, n):
+        """Take `n` tokens; returns 0, or the seconds until they would be there."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._stamp) * self.rate)
+            self._stamp  = now
+            n = min(n, self.capacity)
+            if self._tokens >= n:
+                self._tokens -= n
+                return 0.0
+            return (n - self._tokens) / self.rate
+
+    def available(self):
+        with self._lock:
+            elapsed = time.monotonic() - self._stamp
+            return int(min(self.capacity, self._tokens + elapsed * self.rate))
+
+
+class Permit:
+    """Admitted upstream call(s) of one chat. `release()` may be called more than once."""
+
+    def __init__(self, control, username, calls=1):
+        self._control  = control
+        self._username = username
+        self._calls    = calls
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._control._release(self._username, self._calls)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class AdmissionControl:
+    """
+    Gate in front of the model: at most `per_user` chats in flight per user,
+    at most `max_upstream` upstream calls in flight in this process, and a
+    budget of `tokens_per_minute` (prompt plus reply limit) per process.
+    A caller waits at most `queue_wait` seconds for an upstream slot before
+    being refused, so saturation shows up as fast 429s, not hung workers.
+    """
+
+    def __init__(self, max_upstream=16, tokens_per_minute=0, per_user=2, queue_wait=0.5):
+        self.max_upstream = max_upstream
+        self.per_user     = per_user
+        self.queue_wait   = queue_wait
+        self._slots       = threading.BoundedSemaphore(max_upstream)
+        self._bucket      = TokenBucket(tokens_per_minute / 60.0, tokens_per_minute) if tokens_per_minute > 0 else None
+        self._users       = Counter()
+        self._lock        = threading.Lock()
+        self.rejected     = Counter()
+
+    def admit(self, username, tokens, calls=1):
+        """
+        Return a Permit for `calls` concurrent upstream calls of about
+        `tokens` tokens in total, or raise Saturated. However many calls it
+        covers, a permit counts as one chat against the user's limit;
+        background work passes `username=None` and has no such limit.
+        """
+        with self._lock:
+            if username is not None and self.per_user and self._users[username] >= self.per_user:
+                self.rejected["user"] += 1
+                raise Saturated("Too many chats in progress for this user", 1)
+            self._users[username] += 1
+
+        deadline = time.monotonic() + self.queue_wait
+        for acquired in range(calls):
+            if not self._slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                self._release(username, acquired)
+                with self._lock:
+                    self.rejected["upstream"] += 1
+                raise Saturated("Model capacity is saturated", 1)
+
+        wait = self._bucket.take(tokens) if self._bucket else 0.0
+        if wait:
+            self._release(username, calls)
+            with self._lock:
+                self.rejected["tokens"] += 1
+            raise Saturated("Token budget exhausted", wait)
+        return Permit(self, username, calls)
+
+    def _release_user(self, username):
+        with self._lock:
+            self._users[username] -= 1
+            if self._users[username] <= 0:
+                del self._users[username]
+
+    def _release(self, username, calls=1):
+        for _ in range(calls):
+            self._slots.release()
+        self._release_user(username)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight":        sum(self._users.values()),
+                "max_upstream":     self.max_upstream,
+                "tokens_available": self._bucket.available() if self._bucket else None,
+                "rejected":         dict(self.rejected)
+            }
@@ -0,0 +1,249 @@
+import json
+import logging
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import httpx
+
+logger = logging.getLogger("chat-service")
+
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """Upstream answered with an error status."""
+
+    def __init__(self, status, message, retry_after=None):
+        super().__init__(f"{status}: {message}")
+        self.status      = status
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self):
+        return self.status in RETRY_STATUSES
+
+
+def _retry_after(headers):
+    """Seconds from a `Retry-After` header (delta-seconds or HTTP date)."""
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _is_retryable(error):
+    if isinstance(error, LLMError):
+        return error.retryable
+    return isinstance(error, httpx.TransportError)
+
+
+# ─── Backends ───────────────────────────────────────────────────────────────────
+class OpenAIBackend:
+    """
+    OpenAI chat completions over one pooled keep-alive httpx client, shared
+    by every thread in the process.
+    """
+
+    def __init__(self, api_key, base_url="https://api.openai.com/v1", pool_size=20, connect_timeout=5.0):
+        self.connect_timeout = connect_timeout
+        self._client = httpx.Client(
+            base_url=base_url,
+            headers={"Authorization": f"Bearer {api_key or ''}"},
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            timeout=httpx.Timeout(60.0, connect=connect_timeout)
+        )
+
+    def _timeout(self, timeout):
+        return httpx.Timeout(timeout, connect=min(self.connect_timeout, timeout))
+
+    def warmup(self):
+        """Open a pooled connection (DNS, TCP, TLS) before the first chat needs it."""
+        self._client.get("/models", timeout=self._timeout(10.0)).close()
+
+    @staticmethod
+    def _check(response):
+        if response.status_code >= 400:
+            response.read()
+            try:
+                message = response.json()["error"]["message"]
+            except Exception:
+                message = response.text[:200]
+            raise LLMError(response.status_code, message, _retry_after(response.headers))
+
+    def complete(self, messages, model, max_tokens, temperature, timeout):
+        response = self._client.post("/chat/completions", timeout=self._timeout(timeout), json={
+            "model":       model,
+            "messages":    messages,
+            "max_tokens":  max_tokens,
+            "temperature": temperature
+        })
+        self._check(response)
+        return response.json()["choices"][0]["message"]["content"] or ""
+
+    def stream(self, messages, model, max_tokens, temperature, timeout):
+        # `timeout` bounds each read, so a stalled stream fails instead of
+        # holding the worker; leaving the `with` returns the connection.
+        with self._client.stream("POST", "/chat/completions", timeout=self._timeout(timeout), json={
+            "model":       model,
+            "messages":    messages,
+            "max_tokens":  max_tokens,
+            "temperature": temperature,
+            "stream":      True
+        }) as response:
+            self._check(response)
+            for line in response.iter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    return
+                choices = json.loads(data).get("choices") or []
+                piece = choices[0].get("delta", {}).get("content") if choices else None
+                if piece:
+                    yield piece
+
+
+class FakeBackend:
+    """
+    In-process stand-in for offline runs and benchmarks: waits `latency`
+    seconds, then echoes the last user message a word every `token_delay`.
+    """
+
+    def __init__(self, latency=0.2, token_delay=0.01):
+        self.latency     = latency
+        self.token_delay = token_delay
+
+    def _words(self, messages, max_tokens):
+        last = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+        words = f"(fake reply) {last}".split()
+        return [w + " " for w in words[:max_tokens]]
+
+    def complete(self, messages, model, max_tokens, temperature, timeout):
+        words = self._words(messages, max_tokens)
+        time.sleep(self.latency + self.token_delay * len(words))
+        return "".join(words)
+
+    def stream(self, messages, model, max_tokens, temperature, timeout):
+        time.sleep(self.latency)
+        for word in self._words(messages, max_tokens):
+            yield word
+            time.sleep(self.token_delay)
+
+    def warmup(self):
+        pass
+
+
+# ─── Client ─────────────────────────────────────────────────────────────────────
+class LLMClient:
+    """
+    Model defaults, per-call timeouts and retries around a backend.
+
+    429/5xx replies and transport errors are retried with jittered
+    exponential backoff, waiting at least as long as `Retry-After` asks.
+    Streams are only retried until their first fragment arrives. With
+    `hedge_after` > 0, a blocking completion still running after that many
+    seconds gets a second identical request and the first answer wins (the
+    loser runs to completion in the background and its tokens are paid for).
+    Hedged calls run on a pool of `hedge_workers` threads; size it for two
+    calls per concurrent completion so the pool never queues a primary.
+    """
+
+    def __init__(self, backend, model="gpt-4o-mini", max_tokens=1000, temperature=0.8,
+                 timeout=60.0, max_retries=3, backoff=0.5, max_backoff=20.0, hedge_after=0.0,
+                 hedge_workers=32):
+        self.backend     = backend
+        self.model       = model
+        self.max_tokens  = max_tokens
+        self.temperature = temperature
+        self.timeout     = timeout
+        self.max_retries = max_retries
+        self.backoff     = backoff
+        self.max_backoff = max_backoff
+        self.hedge_after = hedge_after
+        self._hedges     = ThreadPoolExecutor(max_workers=hedge_workers, thread_name_prefix="llm-hedge") \
+            if hedge_after > 0 else None
+
+    def _delay(self, attempt, error):
+        delay = self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+        retry_after = getattr(error, "retry_after", None)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return min(delay, self.max_backoff)
+
+    def _retrying(self, call):
+        attempt = 0
+        while True:
+            try:
+                return call()
+            except Exception as e:
+                if attempt >= self.max_retries or not _is_retryable(e):
+                    raise
+                delay = self._delay(attempt, e)
+                logger.warning(f"LLM call failed ({e}); retry {attempt + 1} in {delay:.1f}s")
+                time.sleep(delay)
+                attempt += 1
+
+    def _hedged(self, call):
+        pending = {self._hedges.submit(call)}
+        done, pending = wait(pending, timeout=self.hedge_after)
+        if not done:
+            pending.add(self._hedges.submit(call))
+        error = None
+        while pending or done:
+            for f in done:
+                if f.exception() is None:
+                    return f.result()
+                error = f.exception()
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        raise error
+
+    def complete(self, messages, max_tokens=None, temperature=None, timeout=None):
+        """Blocking completion; returns the stripped reply text."""
+        def call():
+            return self.backend.complete(
+                messages, self.model,
+                max_tokens or self.max_tokens,
+                self.temperature if temperature is None else temperature,
+                timeout or self.timeout
+            )
+        once = (lambda: self._hedged(call)) if self._hedges else call
+        return self._retrying(once).strip()
+
+    def stream(self, messages, max_tokens=None, temperature=None, timeout=None):
+        """Yield reply fragments; closing the generator closes the upstream stream."""
+        def open_stream():
+            upstream = self.backend.stream(
+                messages, self.model,
+                max_tokens or self.max_tokens,
+                self.temperature if temperature is None else temperature,
+                timeout or self.timeout
+            )
+            try:
+                return upstream, next(upstream, None)
+            except BaseException:
+                upstream.close()
+                raise
+
+        upstream, first = self._retrying(open_stream)
+        try:
+            if first is None:
+                return
+            yield first
+            yield from upstream
+        finally:
+            upstream.close()
+
+    def warmup(self):
+        self.backend.warmup()
@@ -238,44 +238,208 @@
 # if __name__ == "__main__":
 #     app.run(host="0.0.0.0", port=9800)
 
+# Imported first so the startup profile covers the imports below
+from startup import Lazy, StartupProfile
+startup = StartupProfile()
+
 import os
+import json
+import atexit
+import gzip
+import hashlib
+import io
 import logging
+import mimetypes
+import tempfile
+import threading
+import time
+import zlib
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
 from datetime import datetime, timedelta
 from functools import wraps
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify, flash
-from google.oauth2 import service_account
-from google.cloud import firestore
+from flask import Flask, Request, Response, render_template, request, redirect, url_for, session, jsonify, flash, g, send_from_directory
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.wsgi import get_input_stream
 from dotenv import load_dotenv
-import openai
+startup.mark("imports:framework")
+
+from assets import IMMUTABLE, AssetManifest
+from cache import MemoryBackend, ResponseCache, SQLiteBackend, TTLCache
+from context import build_context, count_tokens
+from deletion import DeletionJobs
+from idempotency import IdempotencyStore, InProgress
+from ingest import extract_text
+from limits import AdmissionControl, Saturated
+from llm import FakeBackend, LLMClient, OpenAIBackend
+from metrics import REQUEST_SECONDS, STARTUP_SECONDS, TOKENS, InstrumentedStore, registry, server_timing, stage
+from retrieval import BM25Index, chunk_text
+from storage import (FirestoreStore, SQLStore, StorageUnavailable, create_engine, load_firestore, message_id,
+                     turn_message_id)
+from summarizer import CompactionWorker, fold_summary
+from write_queue import WriteBehindQueue
+startup.mark("imports:app")
 
 # ─── Load env & init ────────────────────────────────────────────────────────────
 load_dotenv()
 
+# Uploads up to this size stay in memory instead of Werkzeug's default
+# 500 KB-then-disk temp file; anything larger spills to disk as before.
+UPLOAD_SPOOL_BYTES = int(os.getenv("UPLOAD_SPOOL_BYTES", str(8 * 1024 * 1024)))
+
+class ChatRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES, mode="rb+")
+
 app = Flask(__name__, template_folder='templates', static_folder='static')
+app.request_class = ChatRequest
 app.secret_key = os.getenv("FLASK_SECRET_KEY", "your-very-secret-key")
 
+# Reject oversized uploads before they are read (413)
+app.config['MAX_CONTENT_LENGTH'] = int(os.getenv("MAX_UPLOAD_MB", "20")) * 1024 * 1024
+
 # Secure sessions
 app.permanent_session_lifetime = timedelta(minutes=30)
 app.config['SESSION_COOKIE_SECURE'] = True
 app.config['SESSION_COOKIE_HTTPONLY'] = True
 
+# Unhashed files under /static may change on deploy, so cache them briefly;
+# fingerprinted copies under /assets are cached for good (see build_assets.py)
+app.config['SEND_FILE_MAX_AGE_DEFAULT'] = int(os.getenv("STATIC_MAX_AGE", "3600"))
+assets = AssetManifest(os.path.join(app.static_folder, "dist"))
+
 # Logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("chat-service")
 
-# OpenAI
-openai.api_key = os.getenv("OPENAI_API_KEY")
+# Heavy clients (Firestore, the model's HTTP pool) are built on first use, or
+# by warmup(), so a cold worker starts serving without paying for them.
 
-# Firestore init
-try:
-    FIREBASE_PROJECT     = os.getenv("FIREBASE_PROJECT")
-    FIREBASE_CREDENTIALS = os.getenv("FIREBASE_CREDENTIALS")
-    creds = service_account.Credentials.from_service_account_file(FIREBASE_CREDENTIALS)
-    db    = firestore.Client(project=FIREBASE_PROJECT, credentials=creds)
-    logger.info("Firestore initialized")
-except Exception as e:
-    logger.error(f"Firestore init error: {e}")
-    db = None
+# LLM client: OpenAI over a pooled HTTP client, or LLM_BACKEND=fake offline
+def open_llm_backend():
+    if os.getenv("LLM_BACKEND", "openai") == "fake":
+        return FakeBackend(
+            latency=float(os.getenv("FAKE_LLM_LATENCY", "0.2")),
+            token_delay=float(os.getenv("FAKE_LLM_TOKEN_DELAY", "0.01"))
+        )
+    return OpenAIBackend(
+        os.getenv("OPENAI_API_KEY"),
+        base_url=os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1"),
+        pool_size=int(os.getenv("LLM_POOL_SIZE", "20")),
+        connect_timeout=float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+    )
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+
+llm = LLMClient(
+    Lazy("llm", open_llm_backend, startup),
+    model=os.getenv("LLM_MODEL", "gpt-4o-mini"),
+    max_tokens=int(os.getenv("LLM_MAX_TOKENS", "1000")),
+    temperature=float(os.getenv("LLM_TEMPERATURE", "0.8")),
+    timeout=float(os.getenv("LLM_TIMEOUT", "60")),
+    max_retries=int(os.getenv("LLM_MAX_RETRIES", "3")),
+    hedge_after=float(os.getenv("LLM_HEDGE_AFTER", "0")),
+    # A primary and a hedge per admitted call
+    hedge_workers=2 * LLM_MAX_CONCURRENCY
+)
+
+# Storage: Firestore by default, or SQL (SQLite/Postgres) with
+# STORAGE_BACKEND=sql. If Firestore cannot start, requests get 503 and the
+# next one tries again. STORAGE_FALLBACK=sql lets the SQL store take over
+# instead (reported as degraded in /healthz).
+STORAGE_BACKEND     = os.getenv("STORAGE_BACKEND", "firestore")
+STORAGE_FALLBACK    = os.getenv("STORAGE_FALLBACK", "")
+STORAGE_RETRY_AFTER = int(os.getenv("STORAGE_RETRY_AFTER", "5"))
+DATABASE_URL    = os.getenv("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.gettempdir(), 'chat.sqlite3')}")
+
+def open_firestore():
+    from google.auth.credentials import AnonymousCredentials
+    from google.oauth2 import service_account
+    firestore = load_firestore()
+    if os.getenv("FIRESTORE_EMULATOR_HOST"):
+        creds = AnonymousCredentials()
+    else:
+        creds = service_account.Credentials.from_service_account_file(os.getenv("FIREBASE_CREDENTIALS"))
+    return FirestoreStore(firestore.Client(project=os.getenv("FIREBASE_PROJECT"), credentials=creds))
+
+def open_store():
+    backend = None
+    if STORAGE_BACKEND == "firestore":
+        try:
+            backend = open_firestore()
+            logger.info("Firestore initialized")
+        except Exception as e:
+            if STORAGE_FALLBACK != "sql":
+                logger.error(f"Firestore init error: {e}; retrying on the next request")
+                raise StorageUnavailable(f"Firestore init error: {e}") from e
+            logger.error(f"Firestore init error: {e}; falling back to SQL storage")
+    if backend is None:
+        backend = SQLStore(create_engine(DATABASE_URL, pool_size=int(os.getenv("DATABASE_POOL_SIZE", "10"))))
+        logger.info(f"SQL storage initialized ({backend.engine.url.get_backend_name()})")
+    # Every storage call is counted and timed for /metrics
+    return InstrumentedStore(backend)
+
+store = Lazy("storage", open_store, startup)
+
+# Write-behind queue: chat turns are committed off the response path
+write_queue = WriteBehindQueue(
+    maxsize=int(os.getenv("WRITE_QUEUE_SIZE", "1000")),
+    max_retries=int(os.getenv("WRITE_QUEUE_RETRIES", "5"))
+)
+atexit.register(write_queue.close, timeout=float(os.getenv("WRITE_QUEUE_DRAIN_SECONDS", "8")))
+
+# Per-session message history, kept warm by write-through from save_turn
+history_cache = TTLCache(
+    maxsize=int(os.getenv("HISTORY_CACHE_SIZE", "512")),
+    ttl=float(os.getenv("HISTORY_CACHE_TTL", "600"))
+)
+summary_cache = TTLCache(maxsize=history_cache.maxsize, ttl=history_cache.ttl)
+file_index_cache = TTLCache(maxsize=int(os.getenv("FILE_INDEX_CACHE_SIZE", "128")), ttl=history_cache.ttl)
+# Extracted uploads by (username, sha256)
+file_store_cache = TTLCache(maxsize=int(os.getenv("FILE_STORE_CACHE_SIZE", "256")),
+                            ttl=float(os.getenv("FILE_STORE_CACHE_TTL", "3600")))
+# (username, sha256) of uploads whose last_used_at was refreshed recently
+file_touches = TTLCache(maxsize=4096, ttl=float(os.getenv("FILE_TOUCH_INTERVAL", "600")))
+
+# Opt-in reply cache for repeated prompts; RESPONSE_CACHE_TABS lists the tabs
+# it applies to ("*" for all). The sqlite backend is shared by every worker
+# process on the instance.
+if os.getenv("RESPONSE_CACHE_BACKEND", "memory") == "sqlite":
+    response_backend = SQLiteBackend(
+        os.getenv("RESPONSE_CACHE_PATH", os.path.join(tempfile.gettempdir(), "response-cache.sqlite3")),
+        maxsize=int(os.getenv("RESPONSE_CACHE_SIZE", "1000")),
+        ttl=float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+    )
+else:
+    response_backend = MemoryBackend(
+        maxsize=int(os.getenv("RESPONSE_CACHE_SIZE", "1000")),
+        ttl=float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+    )
+response_cache = ResponseCache(
+    response_backend,
+    tabs=[t.strip() for t in os.getenv("RESPONSE_CACHE_TABS", "").split(",") if t.strip()]
+)
+
+# Admission control in front of the model (per process): in-flight chats per
+# user, concurrent upstream calls, and an optional token-per-minute budget
+admission = AdmissionControl(
+    max_upstream=LLM_MAX_CONCURRENCY,
+    tokens_per_minute=int(os.getenv("LLM_TOKENS_PER_MINUTE", "0")),
+    per_user=int(os.getenv("USER_MAX_IN_FLIGHT", "2")),
+    queue_wait=float(os.getenv("LLM_QUEUE_WAIT", "0.5"))
+)
+
+# Chat turns carrying an Idempotency-Key: duplicates wait for the original
+# and completed results are replayed for IDEMPOTENCY_WINDOW seconds. Keys are
+# claimed in the store, so this holds across workers; a claim whose worker
+# died frees up after IDEMPOTENCY_LEASE seconds.
+idempotency = IdempotencyStore(
+    store,
+    window=float(os.getenv("IDEMPOTENCY_WINDOW", "600")),
+    lease=float(os.getenv("IDEMPOTENCY_LEASE", "300"))
+)
+IDEMPOTENCY_WAIT = float(os.getenv("IDEMPOTENCY_WAIT", "90"))
+startup.mark("config")
 
 # ─── System & Bot Prompts ───────────────────────────────────────────────────────
 system_instruction = "\n".join([
@@ -285,6 +449,31 @@ system_instruction = "\n".join([
     os.getenv("ADDITIONAL_RULES", "")
 ])
 
+# Prompt size limits (tokens) for the context window sent to OpenAI
+CONTEXT_TOKEN_BUDGET     = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+FILE_MESSAGE_TOKEN_LIMIT = int(os.getenv("FILE_MESSAGE_TOKEN_LIMIT", "1500"))
+
+# Characters of normalized text indexed from an upload; extraction stops here
+FILE_TEXT_BUDGET   = int(os.getenv("FILE_TEXT_BUDGET", "150000"))
+FILE_PREVIEW_CHARS = int(os.getenv("FILE_PREVIEW_CHARS", "400"))
+
+# Uploaded files are chunked and searched per turn (BM25); only the best
+# RETRIEVAL_TOP_K chunks go into the prompt.
+RETRIEVAL_CHUNK_CHARS   = int(os.getenv("RETRIEVAL_CHUNK_CHARS", "800"))
+RETRIEVAL_CHUNK_OVERLAP = int(os.getenv("RETRIEVAL_CHUNK_OVERLAP", "100"))
+RETRIEVAL_TOP_K         = int(os.getenv("RETRIEVAL_TOP_K", "4"))
+
+# Uploads kept per user in the shared content-hash store (least recently used go first)
+FILE_STORE_MAX_PER_USER = int(os.getenv("FILE_STORE_MAX_PER_USER", "50"))
+
+# Rolling summaries: once the unsummarized part of a session passes either
+# threshold, everything but the newest SUMMARY_KEEP_RECENT messages is folded
+# into the session summary. SUMMARY_TRIGGER_MESSAGES=0 turns this off.
+SUMMARY_TRIGGER_MESSAGES = int(os.getenv("SUMMARY_TRIGGER_MESSAGES", "30"))
+SUMMARY_TRIGGER_TOKENS   = int(os.getenv("SUMMARY_TRIGGER_TOKENS", "4000"))
+SUMMARY_KEEP_RECENT      = int(os.getenv("SUMMARY_KEEP_RECENT", "10"))
+SUMMARY_MAX_TOKENS       = int(os.getenv("SUMMARY_MAX_TOKENS", "600"))
+
 bot_tabs = ["Rainmaker", "Insight-Magus", "Voice Sculptor", "ROI Architect"]
 tab_prompts = {
     "Rainmaker":      "🔹 You are in Rainmaker Mode (BizDev). Focus on clarity and strategic framing.",
@@ -301,6 +490,538 @@ def login_required(f):
             return redirect(url_for("login"))
         return f(*args, **kwargs)
     return decorated
+
+# ─── LLM Helpers ────────────────────────────────────────────────────────────────
+def complete_chat(messages, max_tokens=None, temperature=None):
+    """Run a blocking completion and return the stripped reply text."""
+    return llm.complete(messages, max_tokens=max_tokens, temperature=temperature)
+
+def stream_chat(messages):
+    """
+    Yield reply fragments as the model produces them. Closing the generator
+    releases the upstream connection when the browser goes away mid-reply.
+    """
+    return llm.stream(messages)
+
+# ─── Chat Persistence ───────────────────────────────────────────────────────────
+def session_key(username, active_tab, chat_id):
+    """Write-queue key for one chat session."""
+    return (username, active_tab, chat_id)
+
+def merge_history(history, newer):
+    """`history` plus the messages of `newer` it lacks, in timestamp order."""
+    seen  = {(m["timestamp"], m["role"], m["content"]) for m in history}
+    added = [m for m in newer if (m["timestamp"], m["role"], m["content"]) not in seen]
+    return sorted(history + added, key=lambda m: m["timestamp"]) if added else history
+
+def fresh_history(username, active_tab, chat_id):
+    """
+    The cached history of a session, first topped up with anything another
+    worker stored after its newest message (one indexed delta read); None
+    when the session is not cached.
+    """
+    key = session_key(username, active_tab, chat_id)
+    history = history_cache.get(key)
+    if history is None:
+        return None
+    with stage("history"):
+        newer = store.messages(username, active_tab, chat_id, since=history[-1]["timestamp"] if history else None)
+    if newer:
+        history = merge_history(history, newer)
+        history_cache.update(key, lambda current: merge_history(current, newer))
+    return history
+
+def load_history(username, active_tab, chat_id):
+    """
+    Every message of a session in timestamp order, as dicts with `role`,
+    `content` and `timestamp`. Served from `history_cache` when warm; the
+    returned list is shared, so treat it as read-only.
+    """
+    key = session_key(username, active_tab, chat_id)
+    history = fresh_history(username, active_tab, chat_id)
+    if history is not None:
+        return history
+
+    with stage("history"):
+        token = history_cache.reserve(key)
+        write_queue.wait(key)
+        history = store.messages(username, active_tab, chat_id)
+        history_cache.fill(key, history, token)
+    return history
+
+def response_key(active_tab, messages):
+    """Response-cache key for a prompt built by build_prompt()."""
+    tab_prompt = tab_prompts.get(active_tab, "")
+    fixed      = {system_instruction, tab_prompt}
+    context    = [m for m in messages if not (m["role"] == "system" and m["content"] in fixed)]
+    return ResponseCache.key(llm.model, tab_prompt, system_instruction, context)
+
+def cached_reply(active_tab, messages, lookup=True):
+    """complete_chat() behind the response cache; `lookup=False` when the caller already missed."""
+    key   = response_key(active_tab, messages)
+    reply = response_cache.get(active_tab, key) if lookup else None
+    if reply is None:
+        reply = complete_chat(messages)
+        response_cache.put(active_tab, key, reply)
+    return reply
+
+def cached_stream(active_tab, messages, lookup=True):
+    """
+    stream_chat() behind the response cache: a hit is sent as one fragment,
+    and a miss is stored only once the stream has run to the end.
+    """
+    key   = response_key(active_tab, messages)
+    reply = response_cache.get(active_tab, key) if lookup else None
+    if reply is not None:
+        yield reply
+        return
+    parts    = []
+    upstream = stream_chat(messages)
+    try:
+        for piece in upstream:
+            parts.append(piece)
+            yield piece
+    finally:
+        upstream.close()
+    response_cache.put(active_tab, key, "".join(parts).strip())
+
+def admit_turn(username, active_tab, messages, context_tokens):
+    """
+    `(cached, permit)` for a chat turn. A reply already in the response
+    cache comes back with no permit, so it takes no upstream slot or
+    tokens; otherwise the model call is admitted (or Saturated raised).
+    """
+    cached = response_cache.get(active_tab, response_key(active_tab, messages))
+    if cached is not None:
+        return cached, None
+    return None, admission.admit(username, context_tokens + llm.max_tokens)
+
+def build_prompt(username, active_tab, chat_id, entries):
+    """
+    Prompt for this turn: system instruction, tab prompt, the rolling
+    summary (if any), then the newest unsummarized history plus the turn's
+    own `entries`, packed into the token budget.
+    Returns `(messages, token_count)`.
+    """
+    history = load_history(username, active_tab, chat_id)
+    summary = load_summary(username, active_tab, chat_id)
+
+    system_prompts = [system_instruction, tab_prompts.get(active_tab, "")]
+    if summary.get("content"):
+        system_prompts.append(f"Summary of the earlier conversation:\n{summary['content']}")
+        history = [m for m in history if m["timestamp"] > summary["covered_until"]]
+
+    if needs_compaction(history):
+        compactor.request(session_key(username, active_tab, chat_id))
+
+    query = " ".join(e["content"] for e in entries
+                     if e["role"] == "user" and not e.get("file_hash"))
+    focus = next((e["file_hash"] for e in reversed(entries) if e.get("file_hash")), None)
+    excerpts = retrieve_excerpts(username, active_tab, chat_id, query, focus)
+    if excerpts:
+        system_prompts.append(excerpts)
+
+    return build_context(
+        system_prompts,
+        list(history) + list(entries),
+        CONTEXT_TOKEN_BUDGET,
+        FILE_MESSAGE_TOKEN_LIMIT
+    )
+
+# ─── Uploaded Files ─────────────────────────────────────────────────────────────
+# Extracted uploads are stored once per user, keyed by content hash, and
+# sessions only reference them, so re-uploading the same brief to another
+# tab or session skips extraction.
+def content_hash(stream):
+    digest = hashlib.sha256()
+    for block in iter(lambda: stream.read(64 * 1024), b""):
+        digest.update(block)
+    stream.seek(0)
+    return digest.hexdigest()
+
+def load_stored_file(username, digest):
+    """The user's stored extraction for `digest` (`chunks`, `preview`, ...) or None."""
+    key = (username, digest)
+    stored = file_store_cache.get(key)
+    if stored is None:
+        stored = store.get_file(username, digest)
+        if stored is None:
+            return None
+        file_store_cache.set(key, stored)
+    return stored
+
+def evict_stored_files(username):
+    """Keep only the FILE_STORE_MAX_PER_USER most recently used uploads."""
+    for digest in store.evict_files(username, FILE_STORE_MAX_PER_USER):
+        file_store_cache.pop((username, digest))
+
+def ingest_upload(username, uploaded_file):
+    """
+    Hash the upload and return `(digest, stored)`. Content the user has
+    uploaded before is served from the store without re-extracting it;
+    new content is extracted, chunked and queued for storage.
+    """
+    digest = content_hash(uploaded_file.stream)
+    now    = datetime.utcnow().isoformat()
+
+    stored = load_stored_file(username, digest)
+    if stored is not None:
+        write_queue.submit(lambda: store.touch_file(username, digest, now), key=("files", username))
+        return digest, stored
+
+    extracted = extract_text(uploaded_file, FILE_TEXT_BUDGET)
+    stored = {
+        "kind":         extracted.kind,
+        "chars":        len(extracted.text),
+        "chunks":       chunk_text(extracted.text, RETRIEVAL_CHUNK_CHARS, RETRIEVAL_CHUNK_OVERLAP),
+        "preview":      extracted.text[:FILE_PREVIEW_CHARS]
+                        + ("…" if len(extracted.text) > FILE_PREVIEW_CHARS else ""),
+        "created_at":   now,
+        "last_used_at": now
+    }
+    file_store_cache.set((username, digest), stored)
+
+    def persist():
+        store.put_file(username, digest, stored)
+        evict_stored_files(username)
+    write_queue.submit(persist, key=("files", username))
+    return digest, stored
+
+def session_chunks(filename, digest, stored):
+    return [{"text": t, "source": filename, "position": i, "hash": digest}
+            for i, t in enumerate(stored.get("chunks", []))]
+
+def touch_stored_files(username, digests):
+    """
+    Queue a last_used_at refresh for uploads a session is using, at most
+    once per FILE_TOUCH_INTERVAL each, so eviction keeps files in use.
+    """
+    stale = [d for d in digests if file_touches.get((username, d)) is None]
+    if not stale:
+        return
+    for digest in stale:
+        file_touches.set((username, digest), True)
+    now = datetime.utcnow().isoformat()
+
+    def touch():
+        for digest in stale:
+            store.touch_file(username, digest, now)
+    write_queue.submit(touch, key=("files", username))
+
+def file_chunks(username, active_tab, chat_id, files):
+    """Chunks of the `(digest, name)` files that are still stored."""
+    chunks = []
+    for digest, name in files:
+        stored = load_stored_file(username, digest)
+        if stored is None:
+            logger.warning(f"Upload {digest[:12]} ({name}) of {username}/{active_tab}/{chat_id} is gone; "
+                           f"re-upload it to search it again")
+            continue
+        chunks.extend(session_chunks(name, digest, stored))
+    return chunks
+
+def load_file_index(username, active_tab, chat_id):
+    """BM25 index over every file referenced by the session (may be empty)."""
+    key = session_key(username, active_tab, chat_id)
+    index = file_index_cache.get(key)
+    if index is None:
+        token = file_index_cache.reserve(key)
+        write_queue.wait(key)
+        write_queue.wait(("files", username))
+        index = BM25Index(file_chunks(username, active_tab, chat_id,
+                                      store.session_files(username, active_tab, chat_id)))
+        file_index_cache.fill(key, index, token)
+    else:
+        # Another worker may have attached a file since the index was built
+        indexed = {c["hash"] for c in index.chunks}
+        added = file_chunks(username, active_tab, chat_id,
+                            [f for f in store.session_files(username, active_tab, chat_id) if f[0] not in indexed])
+        if added:
+            index = index.extended(added)
+            file_index_cache.set(key, index)
+    touch_stored_files(username, {c["hash"] for c in index.chunks})
+    return index
+
+def attach_upload(username, active_tab, chat_id, filename, digest, stored):
+    """Reference a stored upload from the session and add it to its index."""
+    key   = session_key(username, active_tab, chat_id)
+    index = load_file_index(username, active_tab, chat_id)
+    if any(c["hash"] == digest for c in index.chunks):
+        return
+    added = session_chunks(filename, digest, stored)
+    if not file_index_cache.update(key, lambda index: index.extended(added)):
+        file_index_cache.set(key, index.extended(added))
+
+    now = datetime.utcnow().isoformat()
+    write_queue.submit(lambda: store.attach_file(username, active_tab, chat_id, digest, filename, now), key=key)
+
+def retrieve_excerpts(username, active_tab, chat_id, query, focus=None):
+    """
+    System prompt with the uploaded-file chunks most relevant to `query`,
+    or None when the session has no files. Without a usable query (e.g. a
+    bare upload) the opening chunks of file `focus` (or the newest) are used.
+    """
+    index = load_file_index(username, active_tab, chat_id)
+    if not len(index):
+        return None
+    hits = index.search(query, RETRIEVAL_TOP_K) if query else []
+    if not hits:
+        focus = focus or index.chunks[-1]["hash"]
+        hits = [c for c in index.chunks if c["hash"] == focus][:RETRIEVAL_TOP_K]
+    excerpts = "\n\n".join(f"[{c['source']}, part {c['position'] + 1}]\n{c['text']}" for c in hits)
+    return f"Relevant excerpts from files the user uploaded:\n\n{excerpts}"
+
+# ─── Rolling Summaries ──────────────────────────────────────────────────────────
+def load_summary(username, active_tab, chat_id):
+    """The session's summary doc (`content`, `covered_until`, ...) or {}."""
+    key = session_key(username, active_tab, chat_id)
+    summary = summary_cache.get(key)
+    if summary is None:
+        token = summary_cache.reserve(key)
+        summary = store.get_summary(username, active_tab, chat_id)
+        summary_cache.fill(key, summary, token)
+    return summary
+
+def needs_compaction(unsummarized):
+    if SUMMARY_TRIGGER_MESSAGES <= 0 or len(unsummarized) <= SUMMARY_KEEP_RECENT:
+        return False
+    if len(unsummarized) > SUMMARY_TRIGGER_MESSAGES:
+        return True
+    return sum(count_tokens(m["content"]) for m in unsummarized) > SUMMARY_TRIGGER_TOKENS
+
+def compact_session(key):
+    """Fold messages older than the recent tail into the rolling summary."""
+    username, active_tab, chat_id = key
+    summary = load_summary(username, active_tab, chat_id)
+    history = load_history(username, active_tab, chat_id)
+
+    covered_until = summary.get("covered_until", "")
+    pending = [m for m in history if m["timestamp"] > covered_until]
+    folded  = pending[:len(pending) - SUMMARY_KEEP_RECENT]
+    if not folded:
+        return
+
+    def admitted(messages, **kwargs):
+        # Compaction shares the upstream slots and token budget with chats,
+        # but counts against no user's chat limit
+        tokens = sum(count_tokens(m["content"]) for m in messages) + kwargs.get("max_tokens", 0)
+        with admission.admit(None, tokens):
+            return complete_chat(messages, **kwargs)
+
+    try:
+        content = fold_summary(summary.get("content", ""), folded, admitted,
+                               message_token_limit=FILE_MESSAGE_TOKEN_LIMIT,
+                               max_tokens=SUMMARY_MAX_TOKENS)
+    except Saturated as e:
+        # The session's next turn asks for compaction again
+        logger.info(f"Compaction of {chat_id} deferred: {e.reason}")
+        return
+
+    updated = {
+        "content":       content,
+        "covered_until": folded[-1]["timestamp"],
+        "covered_count": summary.get("covered_count", 0) + len(folded),
+        "updated_at":    datetime.utcnow().isoformat()
+    }
+    store.set_summary(username, active_tab, chat_id, updated)
+    summary_cache.set(key, updated)
+    logger.info(f"Compacted {len(folded)} messages of {chat_id}")
+
+compactor = CompactionWorker(compact_session)
+
+def message_entry(role, content, **extra):
+    entry = {
+        "role":      role,
+        "content":   content,
+        "timestamp": datetime.utcnow().isoformat()
+    }
+    entry.update(extra)
+    return entry
+
+def session_title(messages, length=60):
+    """
+    Sidebar title: the first user message that isn't a persona preamble
+    (those start with “🔹”). None if there is no such message yet.
+    """
+    for m in messages:
+        content = m["content"].strip()
+        if m["role"] != "user" or not content or content.startswith("🔹"):
+            continue
+        if content.startswith("[File: "):
+            content = "📎 " + content[len("[File: "):].split("]", 1)[0]
+        content = " ".join(content.split())
+        return content if len(content) <= length else content[:length - 1].rstrip() + "…"
+    return None
+
+def prepare_turn(username, active_tab, chat_id, entries, reply=None, partial=False, prompt_tokens=0,
+                 turn_key=None):
+    """
+    The store's `turn` dict for one chat turn, with the history cache
+    already updated; None when there is nothing to write. With the turn's
+    idempotency `turn_key`, message ids derive from it instead of content.
+    """
+    now = datetime.utcnow().isoformat()
+
+    entries = list(entries)
+    if reply:
+        entries.append(message_entry("assistant", reply, **({"partial": True} if partial else {})))
+    if not entries:
+        return None
+
+    # Ids are fixed here, before the write is queued, so a retried batch
+    # overwrites the same messages instead of adding copies. Keyed turns get
+    # ids from the key, so a duplicate run elsewhere lands on the same ones;
+    # a partial reply has its own, so a retry's full reply is still written.
+    entries = [dict(e, id=e.get("id") or (turn_message_id(turn_key, active_tab, chat_id,
+                                                          f"{i}-partial" if e.get("partial") else i)
+                                          if turn_key else message_id(active_tab, chat_id, e)))
+               for i, e in enumerate(entries)]
+
+    key = session_key(username, active_tab, chat_id)
+    history = load_history(username, active_tab, chat_id)
+    history_cache.update(key, lambda history: history + [
+        {"role": e["role"], "content": e["content"], "timestamp": e["timestamp"]} for e in entries
+    ])
+
+    # Session index fields; created_at and title are only written once.
+    # The store adds message_count and the usage counters to the totals.
+    index = {"last_message_at": entries[-1]["timestamp"]}
+    if not history:
+        index["created_at"] = now
+    if session_title(history) is None and session_title(entries) is not None:
+        index["title"] = session_title(entries)
+
+    turn = {
+        "username": username,
+        "tab":      active_tab,
+        "chat_id":  chat_id,
+        "messages": entries,
+        "session":  index,
+        "usage": {
+            "turns":             1,
+            "prompt_tokens":     prompt_tokens,
+            "completion_tokens": count_tokens(reply) if reply else 0
+        },
+        "at": now
+    }
+    TOKENS.inc(turn["usage"]["prompt_tokens"], kind="prompt")
+    TOKENS.inc(turn["usage"]["completion_tokens"], kind="completion")
+    return turn
+
+def save_turn(username, active_tab, chat_id, entries, reply=None, partial=False, prompt_tokens=0,
+              turn_key=None):
+    """
+    Queue one chat turn for persistence: the user's entries, the assistant
+    reply, the “last” pointer, the session metadata and the usage counters
+    go out together in a single batch from the write-behind thread.
+    """
+    turn = prepare_turn(username, active_tab, chat_id, entries, reply, partial, prompt_tokens, turn_key)
+    if turn:
+        write_queue.submit(lambda: store.commit_turn(turn),
+                           key=session_key(username, active_tab, chat_id))
+
+def save_failed_turn(username, active_tab, chat_id, entries, claim=None):
+    """
+    Keep the user's entries of a turn whose model call failed, as the SSE
+    path does; a retry with the same idempotency key adds the reply.
+    """
+    try:
+        save_turn(username, active_tab, chat_id, entries, turn_key=claim and claim.key)
+    except Exception as e:
+        logger.error(f"Failed turn save error: {e}")
+
+# ─── Server-Sent Events ─────────────────────────────────────────────────────────
+def wants_event_stream():
+    """True when the client asked for `Accept: text/event-stream`."""
+    best = request.accept_mimetypes.best_match(["application/json", "text/event-stream"])
+    return best == "text/event-stream"
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def stream_reply(messages, username, active_tab, chat_id, entries, context_tokens, claim=None, cached=None):
+    """
+    Relay tokens to the browser as SSE and persist the turn once it ends.
+
+    If the client disconnects, the WSGI server closes this generator, which
+    raises GeneratorExit at the pending `yield`; the `finally` block then
+    stores whatever was received (flagged `partial`) and closes the upstream
+    OpenAI stream so the worker is freed straight away. A `cached` reply
+    (see admit_turn()) is sent as one fragment.
+    """
+    parts = []
+    saved = False
+    if cached is None:
+        upstream = cached_stream(active_tab, messages, lookup=False)
+    else:
+        upstream = (piece for piece in [cached])
+    try:
+        yield sse("start", {"chat_id": chat_id, "context_tokens": context_tokens})
+        # Only the histogram sees this: the headers went out before the stream
+        with stage("llm"):
+            for piece in upstream:
+                parts.append(piece)
+                yield sse("token", {"text": piece})
+
+        reply = "".join(parts).strip()
+        save_turn(username, active_tab, chat_id, entries, reply, prompt_tokens=context_tokens,
+                  turn_key=claim and claim.key)
+        saved = True
+        if claim:
+            claim.finish({"reply": reply, "chat_id": chat_id, "context_tokens": context_tokens})
+        yield sse("done", {"reply": reply, "chat_id": chat_id})
+    except GeneratorExit:
+        logger.info(f"Client left stream {chat_id} after {len(parts)} chunks")
+        raise
+    except Exception as e:
+        logger.error(f"Stream error: {e}")
+        yield sse("error", {"reply": "⚠️ Error processing your request.", "chat_id": chat_id})
+    finally:
+        upstream.close()
+        if not saved:
+            try:
+                save_turn(username, active_tab, chat_id, entries, "".join(parts).strip(),
+                          partial=True, prompt_tokens=context_tokens, turn_key=claim and claim.key)
+            except Exception as e:
+                logger.error(f"Partial reply save error: {e}")
+
+def event_stream_response(generator, *on_close):
+    response = Response(generator, mimetype="text/event-stream", headers={
+        "Cache-Control":     "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+    # Callbacks run once the server is done with the body, finished or not
+    for callback in on_close:
+        if callback:
+            response.call_on_close(callback)
+    return response
+
+# ─── Idempotent Turns ───────────────────────────────────────────────────────────
+def claim_turn(username, fields):
+    """
+    Claim the request's idempotency key (`Idempotency-Key` header or
+    `idempotency_key` field). Returns None when there is none.
+    """
+    key = request.headers.get("Idempotency-Key") or fields.get("idempotency_key")
+    if not key:
+        return None
+    # Each endpoint has its own keys: a /chat result can't answer /council
+    key = hashlib.sha256(f"{username}\x1f{request.endpoint}\x1f{key[:200]}".encode("utf-8")).hexdigest()
+    return idempotency.claim(key, wait=IDEMPOTENCY_WAIT)
+
+def replay_turn(result):
+    """Answer a duplicate request with the original turn's result."""
+    if wants_event_stream():
+        response = event_stream_response(iter([
+            sse("start", {"chat_id": result["chat_id"], "context_tokens": result["context_tokens"]}),
+            sse("token", {"text": result["reply"]}),
+            sse("done", {"reply": result["reply"], "chat_id": result["chat_id"]})
+        ]))
+    else:
+        response = jsonify(result)
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
 # ─── Sign Up ────────────────────────────────────────────────────────────────────
 @app.route("/signup", methods=["GET", "POST"])
 def signup():
@@ -314,14 +1035,13 @@ def signup():
             flash("Passwords do not match", "danger")
             return render_template("signup.html")
 
-        user_ref = db.collection("users").document(username)
         # 2) No duplicate usernames
-        if user_ref.get().exists:
+        if store.get_user(username) is not None:
             flash("Username already taken", "danger")
             return render_template("signup.html")
 
-        # 3) Create the user in Firestore
-        user_ref.set({
+        # 3) Create the user
+        store.create_user(username, {
             "username":   username,
             "password":   password,
             "created_at": datetime.utcnow().isoformat()
@@ -340,11 +1060,9 @@ def login():
         username = request.form["username"]
         password = request.form["password"]
         try:
-            user_ref = db.collection("users").document(username)
-            user_doc = user_ref.get()
+            data = store.get_user(username)
 
-            if user_doc.exists:
-                data = user_doc.to_dict()
+            if data is not None:
                 if data.get("password") == password:
                     session["username"] = username
                     session.permanent = True
@@ -354,7 +1072,7 @@ def login():
                     flash("Invalid credentials", "danger")
             else:
                 # Create new user
-                user_ref.set({
+                store.create_user(username, {
                     "username":   username,
                     "password":   password,
                     "created_at": datetime.utcnow().isoformat()
@@ -389,69 +1107,184 @@ def logout():
 def resume_session(active_tab):
     try:
         username = session["username"]
-        doc = db.collection(f"users/{username}/bots/{active_tab}/active_session") \
-                .document("last").get()
-        if doc.exists:
-            return jsonify({"chat_id": doc.to_dict().get("chat_id")})
+        return jsonify({"chat_id": store.active_session(username, active_tab)})
     except Exception as e:
         logger.error(f"Resume session error: {e}")
     return jsonify({"chat_id": None})
 
 # ─── Chat History ───────────────────────────────────────────────────────────────
+HISTORY_PAGE_MAX = 200
+
+def query_history(username, active_tab, chat_id, since=None, before=None, limit=None):
+    """
+    Messages with `since < timestamp < before`, oldest first. With `limit`,
+    keeps the newest `limit` of them when paging backwards (`before` given or
+    no bounds at all), otherwise the oldest. A warm cache is brought up to
+    date and sliced in memory; a cold one gets a narrow store query that
+    leaves the cache alone.
+    """
+    newest_first = limit is not None and since is None
+
+    history = fresh_history(username, active_tab, chat_id)
+    if history is not None:
+        items = [m for m in history
+                 if (since is None or m["timestamp"] > since)
+                 and (before is None or m["timestamp"] < before)]
+        if limit is not None:
+            items = items[-limit:] if newest_first else items[:limit]
+        return items
+
+    if since is None and before is None and limit is None:
+        return load_history(username, active_tab, chat_id)
+
+    with stage("history"):
+        write_queue.wait(session_key(username, active_tab, chat_id))
+        return store.messages(username, active_tab, chat_id, since, before, limit, newest_first)
+
 @app.route("/history/<active_tab>/<chat_id>", methods=["GET"])
 @login_required
 def get_history(active_tab, chat_id):
+    """
+    Session messages, oldest first, each with its `timestamp`.
+
+      ?since=<ts>             only messages newer than ts (delta fetch)
+      ?before=<ts>&limit=N    the N messages just before ts (scroll back)
+      ?limit=N                the newest N messages
+
+    Responses carry an ETag; a matching If-None-Match gets a bare 304.
+    """
     try:
         username = session["username"]
-        path = f"users/{username}/bots/{active_tab}/sessions/{chat_id}/messages"
-        docs = db.collection(path).order_by("timestamp").stream()
-
-        history = []
-        for doc in docs:
-            d = doc.to_dict()
-            history.append({"role": d["role"], "content": d["content"]})
-        return jsonify(history)
+        since    = request.args.get("since") or None
+        before   = request.args.get("before") or None
+        limit    = request.args.get("limit", type=int)
+        if limit is not None:
+            limit = max(1, min(limit, HISTORY_PAGE_MAX))
+
+        items = query_history(username, active_tab, chat_id, since, before, limit)
+
+        # Messages are append-only, so count + boundary timestamps pin the page
+        version = f"{len(items)}:{items[0]['timestamp'] if items else ''}:{items[-1]['timestamp'] if items else ''}"
+        etag = hashlib.sha1(f"{request.query_string!r}|{version}".encode()).hexdigest()
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = jsonify([{"role": m["role"], "content": m["content"], "timestamp": m["timestamp"]}
+                                for m in items])
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = "private, no-cache"
+        return response
     except Exception as e:
         logger.error(f"Get history error: {e}")
         return jsonify([]), 500
 
 # ─── List Sessions ─────────────────────────────────────────────────────────────
+SESSIONS_PAGE_SIZE = 20
+SESSIONS_PAGE_MAX  = 100
+
+def session_page(username, active_tab, limit, cursor=None):
+    """`(sessions, next_cursor)` for one page of the session index."""
+    # One extra row tells us whether there is a next page
+    sessions = store.list_sessions(username, active_tab, limit + 1, cursor)
+    if len(sessions) > limit:
+        sessions = sessions[:limit]
+        return sessions, sessions[-1]["chat_id"]
+    return sessions, None
+
 @app.route("/sessions/<active_tab>", methods=["GET"])
 @login_required
 def list_sessions(active_tab):
+    """
+    One page of sessions, newest first. Pass the returned `next_cursor`
+    back as `?cursor=` to get the following page.
+    """
     try:
         username = session["username"]
-        col = db.collection(f"users/{username}/bots/{active_tab}/sessions")
-        docs = col.stream()
-
-        sessions = []
-        for doc in docs:
-            data = doc.to_dict() or {}
-            sessions.append({
-                "chat_id":    doc.id,
-                "created_at": data.get("created_at", "")
-            })
-        sessions.sort(key=lambda s: s["created_at"])
-        return jsonify(sessions)
+        limit    = max(1, min(request.args.get("limit", SESSIONS_PAGE_SIZE, type=int), SESSIONS_PAGE_MAX))
+        cursor   = request.args.get("cursor")
+
+        with stage("sessions"):
+            sessions, next_cursor = session_page(username, active_tab, limit, cursor)
+        return jsonify({"sessions": sessions, "next_cursor": next_cursor})
     except Exception as e:
         logger.error(f"List sessions error: {e}")
-        return jsonify([]), 500
+        return jsonify({"sessions": [], "next_cursor": None}), 500
+
+# ─── Bootstrap ──────────────────────────────────────────────────────────────────
+# Everything the chat page needs to show a tab, in one round trip: the resume
+# pointer, the first page of sessions and the tail of the resumed session.
+BOOTSTRAP_HISTORY  = int(os.getenv("BOOTSTRAP_HISTORY", "50"))
+BOOTSTRAP_PREFETCH = os.getenv("BOOTSTRAP_PREFETCH", "1") not in ("0", "false", "")
+bootstrap_pool = ThreadPoolExecutor(max_workers=int(os.getenv("BOOTSTRAP_WORKERS", "16")),
+                                    thread_name_prefix="bootstrap")
+
+def bootstrap_history(username, active_tab, chat_id):
+    if not chat_id:
+        return []
+    return query_history(username, active_tab, chat_id, limit=BOOTSTRAP_HISTORY)
+
+def bootstrap_payload(username, active_tab, prefetch=False):
+    """
+    `{"tabs": {tab: ...}}` for `active_tab`, or for every bot tab with
+    `prefetch`. All pointers and session pages are read concurrently, then
+    each history tail as soon as its pointer is known. Pool tasks never
+    wait on other pool tasks, so a busy pool cannot deadlock.
+    """
+    tabs = [active_tab] + [t for t in bot_tabs if t != active_tab] if prefetch else [active_tab]
+    with stage("bootstrap"):
+        pointers = {t: bootstrap_pool.submit(store.active_session, username, t) for t in tabs}
+        pages    = {t: bootstrap_pool.submit(session_page, username, t, SESSIONS_PAGE_SIZE) for t in tabs}
+        chat_ids = {t: pointers[t].result() for t in tabs}
+        tails    = {t: bootstrap_pool.submit(bootstrap_history, username, t, chat_ids[t]) for t in tabs}
+
+        payload = {}
+        for t in tabs:
+            sessions, next_cursor = pages[t].result()
+            history = tails[t].result()
+            payload[t] = {
+                "chat_id":      chat_ids[t],
+                "sessions":     sessions,
+                "next_cursor":  next_cursor,
+                "history":      [{"role": m["role"], "content": m["content"], "timestamp": m["timestamp"]}
+                                 for m in history],
+                "more_history": len(history) == BOOTSTRAP_HISTORY
+            }
+    return {"tabs": payload}
+
+@app.route("/bootstrap/<active_tab>", methods=["GET"])
+@login_required
+def bootstrap(active_tab):
+    """Bootstrap data for a tab; `?prefetch=1` includes every bot tab."""
+    try:
+        prefetch = request.args.get("prefetch", "0") not in ("0", "false", "")
+        return jsonify(bootstrap_payload(session["username"], active_tab, prefetch))
+    except Exception as e:
+        logger.error(f"Bootstrap error: {e}")
+        return jsonify({"tabs": {}}), 500
 
 # ─── Chat API ───────────────────────────────────────────────────────────────────
 # ─── Chat Page Route ────────────────────────────────────────────────────────────
 @app.route("/chat", methods=["GET"])
 @login_required
 def chat():
-    # Render the main chat UI
+    # Render the main chat UI with the first tab's data inlined, so the page
+    # can draw without any follow-up requests
+    try:
+        initial = bootstrap_payload(session["username"], bot_tabs[0], BOOTSTRAP_PREFETCH)
+    except Exception as e:
+        logger.error(f"Bootstrap error: {e}")
+        initial = {"tabs": {}}
     return render_template(
         "chat.html",
         username=session["username"],
-        tabs=bot_tabs
+        tabs=bot_tabs,
+        bootstrap=initial
     )
 
 @app.route("/chat", methods=["POST"])
 @login_required
 def chat_api():
+    claim = entries = None
     try:
         data       = request.get_json()
         user_input = data.get("message", "")
@@ -459,87 +1292,333 @@ def chat_api():
         chat_id    = data.get("chat_id") or f"{active_tab}_{datetime.utcnow().isoformat()}"
         username   = session["username"]
 
-        # Build Firestore path for messages
-        messages_path = f"users/{username}/bots/{active_tab}/sessions/{chat_id}/messages"
-
-        # Build the prompt list
-        messages = [{"role":"system","content":system_instruction}]
-        messages.append({"role":"system","content":tab_prompts.get(active_tab, "")})
-        # Load last 20 messages from Firestore
-        for msg in db.collection(messages_path).order_by("timestamp").limit(20).stream():
-            md = msg.to_dict()
-            messages.append({"role": md["role"], "content": md["content"]})
-
-        # 1️⃣ Save user message
-        db.collection(messages_path).add({
-            "role":      "user",
-            "content":   user_input,
-            "timestamp": datetime.utcnow().isoformat()
-        })
-
-        # 2️⃣ Call OpenAI
-        response = openai.ChatCompletion.create(
-            model="gpt-4o-mini",
-            messages=messages,
-            max_tokens=1000,
-            temperature=0.8
-        )
-        reply = response.choices[0].message.content.strip()
-
-        # 3️⃣ Save assistant reply
-        db.collection(messages_path).add({
-            "role":      "assistant",
-            "content":   reply,
-            "timestamp": datetime.utcnow().isoformat()
-        })
-
-        # 4️⃣ Update “last” pointer
-        db.collection(f"users/{username}/bots/{active_tab}/active_session") \
-          .document("last").set({
-            "chat_id":   chat_id,
-            "timestamp": datetime.utcnow().isoformat()
-        })
-
-        # 5️⃣ Create/merge session metadata
-        db.collection(f"users/{username}/bots/{active_tab}/sessions") \
-          .document(chat_id).set({
-            "created_at": datetime.utcnow().isoformat()
-        }, merge=True)
-
-        return jsonify({"reply": reply, "chat_id": chat_id})
-
+        # A retried request replays the original turn instead of rerunning it
+        claim = claim_turn(username, data)
+        if claim and not claim.leader:
+            return replay_turn(claim.result)
+
+        # 1️⃣ User message is persisted with the reply in one batch
+        entries = [message_entry("user", user_input)]
+
+        # Build the prompt: newest history that fits the token budget
+        with stage("prompt"):
+            messages, context_tokens = build_prompt(username, active_tab, chat_id, entries)
+
+        # 2️⃣ Admission on a cache miss: the permit is held until the reply is complete
+        cached, permit = admit_turn(username, active_tab, messages, context_tokens)
+
+        # 3️⃣ Stream tokens back when the client asked for SSE
+        if wants_event_stream():
+            return event_stream_response(
+                stream_reply(messages, username, active_tab, chat_id, entries, context_tokens, claim, cached),
+                permit and permit.release, claim and claim.abandon)
+
+        # 4️⃣ Call the model, then queue the whole turn
+        if permit is None:
+            reply = cached
+        else:
+            with permit, stage("llm"):
+                reply = cached_reply(active_tab, messages, lookup=False)
+        with stage("persist"):
+            save_turn(username, active_tab, chat_id, entries, reply, prompt_tokens=context_tokens,
+                      turn_key=claim and claim.key)
+
+        result = {"reply": reply, "chat_id": chat_id, "context_tokens": context_tokens}
+        if claim:
+            claim.finish(result)
+        return jsonify(result)
+
+    except (Saturated, InProgress):
+        if claim:
+            claim.abandon()
+        raise
     except Exception as e:
         logger.error(f"Chat error: {e}")
+        if entries:
+            save_failed_turn(username, active_tab, chat_id, entries, claim)
+        if claim:
+            claim.abandon()
         return jsonify({"reply": "⚠️ Error processing your request."}), 500
 
-# ─── Delete Session ────────────────────────────────────────────────────────────
-@app.route("/delete_chat/<active_tab>/<chat_id>", methods=["GET"])
+# ─── Council ────────────────────────────────────────────────────────────────────
+# One message to several personas at once. Prompts are built and the model
+# is asked for every tab concurrently, so the wait is that of the slowest
+# persona rather than the sum, and the turns are written in one batch.
+# Prompts get their own pool: behind long model calls they would hold up
+# admission, and with it the quick 429 when the service is saturated.
+# Admission never lets more than LLM_MAX_CONCURRENCY calls run at once.
+council_prompt_pool = ThreadPoolExecutor(max_workers=int(os.getenv("COUNCIL_PROMPT_WORKERS", "8")),
+                                         thread_name_prefix="council-prompt")
+council_pool = ThreadPoolExecutor(max_workers=LLM_MAX_CONCURRENCY, thread_name_prefix="council")
+
+def council_members(username, user_input, tabs, chat_ids):
+    """Per tab: `tab`, `chat_id`, `entries`, `messages` and `context_tokens`."""
+    now = datetime.utcnow().isoformat()
+    members = [{
+        "tab":     tab,
+        "chat_id": chat_ids.get(tab) or f"{tab}_{now}",
+        "entries": [message_entry("user", user_input)]
+    } for tab in tabs]
+    prompts = [council_prompt_pool.submit(build_prompt, username, m["tab"], m["chat_id"], m["entries"])
+               for m in members]
+    for m, prompt in zip(members, prompts):
+        m["messages"], m["context_tokens"] = prompt.result()
+    return members
+
+def save_council(username, members, futures, turn_key=None):
+    """Queue every answered member's turn as one store batch."""
+    turns = []
+    for m, f in zip(members, futures):
+        if f.exception() is not None:
+            logger.error(f"Council member {m['tab']} failed: {f.exception()}")
+            continue
+        turns.append(prepare_turn(username, m["tab"], m["chat_id"], m["entries"], f.result(),
+                                  prompt_tokens=m["context_tokens"], turn_key=turn_key))
+    if turns:
+        write_queue.submit(lambda: store.commit_turns(turns),
+                           key=[session_key(username, t["tab"], t["chat_id"]) for t in turns])
+
+def ask_council(username, members, permit, turn_key=None):
+    """
+    Start every member's model call; returns `(futures, saved)`. When the
+    last call settles the permit is released and save_council() runs, even
+    if the client has gone, and then the `saved` event is set.
+    """
+    futures   = [council_pool.submit(cached_reply, m["tab"], m["messages"]) for m in members]
+    saved     = threading.Event()
+    remaining = [len(futures)]
+    lock      = threading.Lock()
+
+    def settle(_):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0]:
+                return
+        try:
+            permit.release()
+            save_council(username, members, futures, turn_key)
+        finally:
+            saved.set()
+
+    for f in futures:
+        f.add_done_callback(settle)
+    return futures, saved
+
+def council_reply(member, future):
+    reply = {"tab": member["tab"], "chat_id": member["chat_id"]}
+    if future.exception() is not None:
+        return dict(reply, error="⚠️ Error processing your request.")
+    return dict(reply, reply=future.result(), context_tokens=member["context_tokens"])
+
+def council_events(replies):
+    """SSE events for `replies` ({tab: council_reply()}) in the given order."""
+    return [sse("error" if "error" in r else "reply", r) for r in replies.values()]
+
+def stream_council(members, futures, saved, claim=None):
+    """SSE: `start`, then a `reply` (or `error`) per persona as each finishes, then `done`."""
+    member_of = dict(zip(futures, members))
+    replies   = {}
+    yield sse("start", {"members": {m["tab"]: m["chat_id"] for m in members}})
+    with stage("llm"):
+        for f in as_completed(futures):
+            reply = council_reply(member_of[f], f)
+            replies[reply["tab"]] = reply
+            yield from council_events({reply["tab"]: reply})
+    saved.wait()
+    if claim:
+        claim.finish({"replies": replies})
+    yield sse("done", {"replies": replies})
+
+def replay_council(result):
+    if wants_event_stream():
+        start = {"members": {tab: r["chat_id"] for tab, r in result["replies"].items()}}
+        response = event_stream_response(iter(
+            [sse("start", start)] + council_events(result["replies"]) + [sse("done", result)]))
+    else:
+        response = jsonify(result)
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+@app.route("/council", methods=["POST"])
+@login_required
+def council():
+    """
+    `{"message": ..., "tabs": [...], "chat_ids": {tab: chat_id}}`; `tabs`
+    defaults to every bot tab and a tab without a chat_id starts a new
+    session. Answers `{"replies": {tab: ...}}`, or SSE events as each
+    persona finishes.
+    """
+    claim = None
+    try:
+        data       = request.get_json()
+        user_input = data.get("message", "")
+        tabs       = data.get("tabs") or bot_tabs
+        chat_ids   = data.get("chat_ids") or {}
+        username   = session["username"]
+        if not isinstance(tabs, list) or not all(isinstance(t, str) for t in tabs):
+            return jsonify({"error": "tabs must be a list of tab names"}), 400
+        if not isinstance(chat_ids, dict) or not all(isinstance(c, str) for c in chat_ids.values()):
+            return jsonify({"error": "chat_ids must map tab names to chat ids"}), 400
+        tabs    = list(dict.fromkeys(tabs))
+        unknown = [t for t in tabs if t not in bot_tabs]
+        if unknown:
+            return jsonify({"error": f"Unknown tabs: {', '.join(unknown)}"}), 400
+
+        claim = claim_turn(username, data)
+        if claim and not claim.leader:
+            return replay_council(claim.result)
+
+        with stage("prompt"):
+            members = council_members(username, user_input, tabs, chat_ids)
+
+        # One chat for the per-user limit, one upstream slot per persona
+        tokens = sum(m["context_tokens"] for m in members) + llm.max_tokens * len(members)
+        permit = admission.admit(username, tokens, calls=len(members))
+        futures, saved = ask_council(username, members, permit, claim and claim.key)
+
+        if wants_event_stream():
+            return event_stream_response(stream_council(members, futures, saved, claim),
+                                         claim and claim.abandon)
+
+        with stage("llm"):
+            wait(futures)
+        with stage("persist"):
+            saved.wait()
+        result = {"replies": {m["tab"]: council_reply(m, f) for m, f in zip(members, futures)}}
+        if claim:
+            claim.finish(result)
+        return jsonify(result)
+
+    except (Saturated, InProgress):
+        if claim:
+            claim.abandon()
+        raise
+    except Exception as e:
+        if claim:
+            claim.abandon()
+        logger.error(f"Council error: {e}")
+        return jsonify({"error": "⚠️ Error processing your request."}), 500
+
+# ─── Delete Session / Purge ─────────────────────────────────────────────────────
+deletion_jobs = DeletionJobs(store, max_running=int(os.getenv("DELETE_JOB_WORKERS", "2")))
+DELETE_PARALLELISM = int(os.getenv("DELETE_PARALLELISM", "8"))
+
+def forget_cached(username, active_tab=None, chat_id=None):
+    """Evict cached histories, summaries and file indexes for a session, a tab or a user."""
+    def matches(key):
+        return key[0] == username \
+            and (active_tab is None or key[1] == active_tab) \
+            and (chat_id is None or key[2] == chat_id)
+    history_cache.pop_matching(matches)
+    summary_cache.pop_matching(matches)
+    file_index_cache.pop_matching(matches)
+    if active_tab is None:
+        file_store_cache.pop_matching(lambda key: key[0] == username)
+
+def run_deletion(username, description, delete, active_tab=None, chat_id=None):
+    """
+    Run `delete(parallelism, progress)` (a store deletion method) inline by
+    default, or as a background job with `?async=1`.
+    """
+    def run(progress=None):
+        try:
+            return delete(parallelism=DELETE_PARALLELISM, progress=progress)
+        finally:
+            forget_cached(username, active_tab, chat_id)
+
+    forget_cached(username, active_tab, chat_id)
+    if request.args.get("async", "0") not in ("0", "false", ""):
+        job_id = deletion_jobs.start(username, description, run)
+        response = jsonify({"status": "accepted", "job_id": job_id,
+                            "status_url": url_for("deletion_status", job_id=job_id)})
+        response.status_code = 202
+        return response
+    return jsonify({"status": "success", "deleted": run()})
+
+@app.route("/delete_chat/<active_tab>/<chat_id>", methods=["GET", "DELETE"])
 @login_required
 def delete_chat(active_tab, chat_id):
     try:
         username = session["username"]
-        base = f"users/{username}/bots/{active_tab}/sessions/{chat_id}"
-
-        # delete messages
-        for m in db.collection(f"{base}/messages").stream():
-            db.collection(f"{base}/messages").document(m.id).delete()
+        write_queue.wait(session_key(username, active_tab, chat_id))
+        # messages, rolling summary and the session doc itself
+        return run_deletion(username, f"chat {active_tab}/{chat_id}",
+                            lambda **kw: store.delete_session(username, active_tab, chat_id, **kw),
+                            active_tab, chat_id)
+    except Exception as e:
+        logger.error(f"Delete chat error: {e}")
+        return jsonify({"status": "error"}), 500
 
-        # delete session metadata
-        db.collection(f"users/{username}/bots/{active_tab}/sessions") \
-          .document(chat_id).delete()
+@app.route("/purge/<active_tab>", methods=["POST", "DELETE"])
+@login_required
+def purge_tab(active_tab):
+    """Delete every session of one bot tab, plus its “last” pointer."""
+    try:
+        username = session["username"]
+        write_queue.flush(timeout=10)
+        return run_deletion(username, f"tab {active_tab}",
+                            lambda **kw: store.delete_tab(username, active_tab, **kw), active_tab)
+    except Exception as e:
+        logger.error(f"Purge tab error: {e}")
+        return jsonify({"status": "error"}), 500
 
-        return jsonify({"status": "success"})
+@app.route("/purge", methods=["POST", "DELETE"])
+@login_required
+def purge_account():
+    """
+    Delete the user's account and everything under it. The body must echo
+    the username as `{"confirm": "<username>"}`.
+    """
+    try:
+        username = session["username"]
+        if (request.get_json(silent=True) or {}).get("confirm") != username:
+            return jsonify({"status": "error", "error": "confirmation required"}), 400
+        write_queue.flush(timeout=10)
+        response = run_deletion(username, "account", lambda **kw: store.delete_user(username, **kw))
+        # Background purges keep the login so the job can still be polled
+        if response.status_code == 200:
+            session.clear()
+        return response
     except Exception as e:
-        logger.error(f"Delete chat error: {e}")
+        logger.error(f"Purge account error: {e}")
         return jsonify({"status": "error"}), 500
 
+@app.route("/jobs/<job_id>", methods=["GET"])
+@login_required
+def deletion_status(job_id):
+    job = deletion_jobs.get(job_id, session["username"])
+    if job is None:
+        return jsonify({"status": "error", "error": "unknown job"}), 404
+    return jsonify(job)
+
 
 from werkzeug.utils import secure_filename
-import tempfile
+
+@app.errorhandler(RequestEntityTooLarge)
+def upload_too_large(e):
+    limit_mb = app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)
+    return jsonify({"reply": f"⚠️ File too large (max {limit_mb} MB)."}), 413
+
+@app.errorhandler(Saturated)
+def too_busy(e):
+    return jsonify({"reply": f"⚠️ {e.reason}. Please retry shortly.", "retry_after": e.retry_after}), \
+        429, {"Retry-After": str(e.retry_after)}
+
+@app.errorhandler(StorageUnavailable)
+def storage_unavailable(e):
+    return jsonify({"reply": "⚠️ Storage is unavailable. Please retry shortly.",
+                    "retry_after": STORAGE_RETRY_AFTER}), \
+        503, {"Retry-After": str(STORAGE_RETRY_AFTER)}
+
+@app.errorhandler(InProgress)
+def turn_in_progress(e):
+    return jsonify({"reply": "⚠️ This message is still being answered.", "retry_after": e.retry_after}), \
+        409, {"Retry-After": str(e.retry_after)}
 
 @app.route("/chat_with_file", methods=["POST"])
 @login_required
 def chat_with_file():
+    claim = entries = None
     try:
         user_input = request.form.get("message", "")
         active_tab = request.form.get("tab", "Rainmaker")
@@ -547,70 +1626,320 @@ def chat_with_file():
         username = session["username"]
         uploaded_file = request.files.get("file")
 
-        messages_path = f"users/{username}/bots/{active_tab}/sessions/{chat_id}/messages"
-
-        # Load past messages
-        messages = [{"role":"system","content":system_instruction}]
-        messages.append({"role":"system","content":tab_prompts.get(active_tab, "")})
-        for msg in db.collection(messages_path).order_by("timestamp").limit(20).stream():
-            md = msg.to_dict()
-            messages.append({"role": md["role"], "content": md["content"]})
+        claim = claim_turn(username, request.form)
+        if claim and not claim.leader:
+            return replay_turn(claim.result)
 
+        entries = []
         if user_input:
-            messages.append({"role": "user", "content": user_input})
-            db.collection(messages_path).add({
-                "role": "user", "content": user_input,
-                "timestamp": datetime.utcnow().isoformat()
-            })
+            entries.append(message_entry("user", user_input))
 
         if uploaded_file:
             filename = secure_filename(uploaded_file.filename)
-            with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-                uploaded_file.save(temp_file.name)
-                with open(temp_file.name, "r", encoding="utf-8", errors="ignore") as f:
-                    file_content = f.read()
-                os.unlink(temp_file.name)
-
-            messages.append({"role": "user", "content": f"Here is a file I uploaded:\n\n{file_content[:4000]}"})  # limit to 4k tokens
-            db.collection(messages_path).add({
-                "role": "user",
-                "content": f"[File: {filename}] {file_content[:4000]}",
-                "timestamp": datetime.utcnow().isoformat()
-            })
-
-        # GPT call
-        response = openai.ChatCompletion.create(
-            model="gpt-4o-mini",
-            messages=messages,
-            max_tokens=1000,
-            temperature=0.8
-        )
-        reply = response.choices[0].message.content.strip()
-
-        db.collection(messages_path).add({
-            "role": "assistant",
-            "content": reply,
-            "timestamp": datetime.utcnow().isoformat()
-        })
-
-        db.collection(f"users/{username}/bots/{active_tab}/active_session") \
-          .document("last").set({
-            "chat_id":   chat_id,
-            "timestamp": datetime.utcnow().isoformat()
-        })
-
-        db.collection(f"users/{username}/bots/{active_tab}/sessions") \
-          .document(chat_id).set({
-            "created_at": datetime.utcnow().isoformat()
-        }, merge=True)
-
-        return jsonify({"reply": reply, "chat_id": chat_id})
-
+            with stage("ingest"):
+                digest, stored = ingest_upload(username, uploaded_file)
+            if stored["chunks"]:
+                # Full text is in the retrieval index; the message keeps a preview
+                attach_upload(username, active_tab, chat_id, filename, digest, stored)
+                file_content = f"({len(stored['chunks'])} sections indexed) {stored['preview']}"
+            else:
+                file_content = f"(no readable text found in this {stored['kind']} file)"
+            entries.append(message_entry("user", f"[File: {filename}] {file_content}", file_hash=digest))
+
+        # Past messages + this turn, packed into the token budget
+        with stage("prompt"):
+            messages, context_tokens = build_prompt(username, active_tab, chat_id, entries)
+
+        cached, permit = admit_turn(username, active_tab, messages, context_tokens)
+        if wants_event_stream():
+            return event_stream_response(
+                stream_reply(messages, username, active_tab, chat_id, entries, context_tokens, claim, cached),
+                permit and permit.release, claim and claim.abandon)
+
+        # GPT call, unless the response cache had the reply
+        if permit is None:
+            reply = cached
+        else:
+            with permit, stage("llm"):
+                reply = cached_reply(active_tab, messages, lookup=False)
+        with stage("persist"):
+            save_turn(username, active_tab, chat_id, entries, reply, prompt_tokens=context_tokens,
+                      turn_key=claim and claim.key)
+
+        result = {"reply": reply, "chat_id": chat_id, "context_tokens": context_tokens}
+        if claim:
+            claim.finish(result)
+        return jsonify(result)
+
+    except (RequestEntityTooLarge, Saturated, InProgress):
+        if claim:
+            claim.abandon()
+        raise
     except Exception as e:
         logger.error(f"File-based chat error: {e}")
+        if entries:
+            save_failed_turn(username, active_tab, chat_id, entries, claim)
+        if claim:
+            claim.abandon()
         return jsonify({"reply": "⚠️ Failed to process file input."}), 500
 
 
+# ─── Export / Import ────────────────────────────────────────────────────────────
+# A user's whole archive as NDJSON, one record per line: an `export` header,
+# then for each tab every `session` followed by its `message`s and its
+# `summary`, the tab's `active` pointer, and finally an `end` record with
+# totals. Both directions stream, so memory is bounded by one page or batch
+# whatever the archive size.
+EXPORT_PAGE_SIZE   = int(os.getenv("EXPORT_PAGE_SIZE", "500"))
+EXPORT_CHUNK_BYTES = 64 * 1024
+# Writes per import batch; Firestore refuses batches of more than 500
+IMPORT_BATCH_SIZE  = min(int(os.getenv("IMPORT_BATCH_SIZE", "400")), 500)
+IMPORT_MAX_BYTES   = int(os.getenv("IMPORT_MAX_MB", "4096")) * 1024 * 1024
+IMPORT_ROLES       = ("user", "assistant")
+
+def export_records(username):
+    totals = Counter(sessions=0, messages=0)
+    yield {"type": "export", "version": 1, "username": username, "exported_at": datetime.utcnow().isoformat()}
+    for tab in bot_tabs:
+        for s in store.export_sessions(username, tab, EXPORT_PAGE_SIZE):
+            chat_id = s["chat_id"]
+            write_queue.wait(session_key(username, tab, chat_id))
+            yield {"type": "session", "tab": tab, **s}
+            for m in store.export_messages(username, tab, chat_id, EXPORT_PAGE_SIZE):
+                totals["messages"] += 1
+                yield {"type": "message", "tab": tab, "chat_id": chat_id, **m}
+            summary = store.get_summary(username, tab, chat_id)
+            if summary:
+                yield {"type": "summary", "tab": tab, "chat_id": chat_id, **summary}
+            totals["sessions"] += 1
+        active = store.active_session(username, tab)
+        if active:
+            yield {"type": "active", "tab": tab, "chat_id": active}
+    yield {"type": "end", **totals}
+
+def ndjson_chunks(records, compress=False):
+    """NDJSON bytes in chunks of about EXPORT_CHUNK_BYTES, gzipped with `compress`."""
+    packer = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    lines, size = [], 0
+    for record in records:
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode()
+        lines.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK_BYTES:
+            chunk = b"".join(lines)
+            lines, size = [], 0
+            chunk = packer.compress(chunk) if packer else chunk
+            if chunk:
+                yield chunk
+    chunk = b"".join(lines)
+    yield packer.compress(chunk) + packer.flush() if packer else chunk
+
+def archive_records(lines):
+    """Importable records from NDJSON `lines`; raises ValueError naming the first bad line."""
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            raise ValueError(f"line {number}: not valid JSON")
+        kind = record.get("type") if isinstance(record, dict) else None
+        if kind in ("export", "end"):
+            continue
+        if kind not in ("session", "message", "summary", "active"):
+            raise ValueError(f"line {number}: unknown record type {kind!r}")
+        chat_id = record.get("chat_id")
+        if record.get("tab") not in bot_tabs:
+            raise ValueError(f"line {number}: unknown tab {record.get('tab')!r}")
+        if not isinstance(chat_id, str) or not chat_id or "/" in chat_id or len(chat_id) > 255:
+            raise ValueError(f"line {number}: invalid chat_id")
+        if kind == "message" and not (record.get("role") in IMPORT_ROLES
+                                      and isinstance(record.get("content"), str)
+                                      and isinstance(record.get("timestamp"), str)):
+            raise ValueError(f"line {number}: a message needs role, content and timestamp")
+        if kind == "summary" and not (isinstance(record.get("content"), str)
+                                      and isinstance(record.get("covered_until"), str)):
+            raise ValueError(f"line {number}: a summary needs content and covered_until")
+        yield record
+
+def import_records(username, records, counts):
+    """
+    Write `records` in batches of at most IMPORT_BATCH_SIZE writes, tallying
+    what each batch wrote into `counts` (messages already stored count as
+    "duplicate"). A record is one write, and each session that a batch's
+    `session` or `message` records touch adds one more for its document.
+    """
+    batch, sessions = [], set()
+    try:
+        for record in records:
+            key     = record.get("tab"), record.get("chat_id")
+            touches = record.get("type") in ("session", "message")
+            if batch and len(batch) + len(sessions) + 1 + (touches and key not in sessions) > IMPORT_BATCH_SIZE:
+                counts.update(store.import_records(username, batch))
+                batch, sessions = [], set()
+            batch.append(record)
+            if touches:
+                sessions.add(key)
+        if batch:
+            counts.update(store.import_records(username, batch))
+    finally:
+        forget_cached(username)
+
+@app.route("/export", methods=["GET"])
+@login_required
+def export_archive():
+    """The user's archive as an NDJSON download; `?gzip=1` compresses it."""
+    username = session["username"]
+    compress = request.args.get("gzip") == "1"
+    filename = f"{secure_filename(username) or 'chats'}-{datetime.utcnow():%Y%m%d}.ndjson" + (".gz" if compress else "")
+    return Response(ndjson_chunks(export_records(username), compress),
+                    mimetype="application/gzip" if compress else "application/x-ndjson",
+                    headers={"Content-Disposition": f'attachment; filename="{filename}"',
+                             "X-Accel-Buffering": "no"})
+
+@app.route("/import", methods=["POST"])
+@login_required
+def import_archive():
+    """
+    Add an archive from /export (the raw request body, gzipped or not) to
+    this user's chats. Records are written batch by batch, so on a bad line
+    the batches before it stay imported; the response says how many.
+    """
+    username = session["username"]
+    body = io.BufferedReader(get_input_stream(request.environ, max_content_length=IMPORT_MAX_BYTES), 1 << 16)
+    if request.headers.get("Content-Encoding") == "gzip" or body.peek(2)[:2] == b"\x1f\x8b":
+        body = gzip.GzipFile(fileobj=body)
+
+    counts = Counter()
+    try:
+        with stage("import"):
+            import_records(username, archive_records(body), counts)
+    except RequestEntityTooLarge:
+        raise
+    except (ValueError, OSError, EOFError) as e:
+        return jsonify({"status": "error", "error": str(e), "imported": counts}), 400
+    except Exception as e:
+        logger.error(f"Import error for {username}: {e}")
+        return jsonify({"status": "error", "error": "import failed", "imported": counts}), 500
+    logger.info(f"Imported {dict(counts)} for {username}")
+    return jsonify({"status": "ok", "imported": counts})
+
+# ─── Static Assets ──────────────────────────────────────────────────────────────
+@app.context_processor
+def asset_helpers():
+    def asset_url(name):
+        return assets.url(name, lambda n: url_for("static", filename=n))
+    return {"asset_url": asset_url, "asset_srcset": assets.srcset}
+
+@app.route("/assets/<path:filename>", methods=["GET"])
+def asset(filename):
+    """Build outputs only, precompressed when the client accepts it."""
+    resolved = assets.resolve(filename, request.headers.get("Accept-Encoding"))
+    if resolved is None:
+        return Response("Not found", status=404)
+    path, coding = resolved
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    response = send_from_directory(assets.directory, path, mimetype=mimetype)
+    if coding:
+        response.headers["Content-Encoding"] = coding
+    response.headers["Vary"]          = "Accept-Encoding"
+    response.headers["Cache-Control"] = IMMUTABLE
+    return response
+
+# ─── Timing & Metrics ───────────────────────────────────────────────────────────
+@app.before_request
+def start_timer():
+    g.started = time.perf_counter()
+
+@app.before_request
+def require_storage():
+    """Build the store (or retry building it) before any route that reads it."""
+    if request.endpoint not in ("metrics", "healthz", "static", "asset", "warmup_hook"):
+        store.get()
+
+@app.after_request
+def report_timings(response):
+    """Server-Timing header, request histogram and one structured log line."""
+    started = g.get("started")
+    if started is None:
+        return response
+    total   = time.perf_counter() - started
+    timings = g.get("timings", [])
+    route   = request.url_rule.rule if request.url_rule else "unmatched"
+    stages  = {}
+    for name, elapsed in timings:
+        stages[name] = stages.get(name, 0.0) + elapsed
+
+    response.headers["Server-Timing"] = server_timing(stages.items(), total)
+    REQUEST_SECONDS.observe(total, route=route, method=request.method, status=response.status_code)
+    if request.endpoint not in ("metrics", "healthz", "static", "asset"):
+        logger.info(json.dumps({
+            "event":    "request",
+            "route":    route,
+            "method":   request.method,
+            "status":   response.status_code,
+            "ms":       round(total * 1000, 1),
+            "stages":   {name: round(elapsed * 1000, 1) for name, elapsed in stages.items()},
+            "streamed": response.is_streamed
+        }))
+    return response
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Prometheus scrape endpoint (this worker process only)."""
+    for phase, seconds in startup.report()["phases"].items():
+        STARTUP_SECONDS.set(seconds, phase=phase)
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
+# ─── Health ────────────────────────────────────────────────────────────────────
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    try:
+        backend = store.name
+    except StorageUnavailable:
+        backend = None
+    return jsonify({
+        "status":             "unavailable" if backend is None else "ok" if backend == STORAGE_BACKEND else "degraded",
+        "storage":            backend,
+        "write_queue_depth":  write_queue.depth(),
+        "write_queue_failed": write_queue.failed,
+        "history_cache":      history_cache.stats(),
+        "response_cache":     response_cache.stats(),
+        "compaction_pending": compactor.pending(),
+        "admission":          admission.stats(),
+        "startup":            startup.report()
+    }), 503 if backend is None else 200
+
+# ─── Warmup ────────────────────────────────────────────────────────────────────
+def warmup():
+    """
+    Build the storage and model clients and open their first connections,
+    so the first real request on this worker does not pay for them. Failures
+    are logged only; the clients are retried on first use.
+    """
+    started = time.perf_counter()
+    try:
+        store.get_user("_warmup")
+    except Exception as e:
+        logger.warning(f"Storage warmup failed: {e}")
+    try:
+        llm.warmup()
+    except Exception as e:
+        logger.warning(f"LLM warmup failed: {e}")
+    startup.record("warmup", time.perf_counter() - started)
+    startup.log()
+
+@app.route("/_ah/warmup", methods=["GET"])
+def warmup_hook():
+    warmup()
+    return jsonify(startup.report())
+
+startup.mark("routes")
+startup.log()
+
 # ─── Run App ───────────────────────────────────────────────────────────────────
+# Local development only; containers run gunicorn (see gunicorn.conf.py).
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=8080)
+    if os.getenv("EAGER_WARMUP", "0") == "1":
+        warmup()
+    app.run(host="0.0.0.0", port=int(os.getenv("PORT", "8080")), threaded=True)
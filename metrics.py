@@ -0,0 +1,186 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context
+
+# Seconds; covers cache hits through slow model replies
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+# ─── Metric Types ───────────────────────────────────────────────────────────────
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name       = name
+        self.doc        = documentation
+        self.labelnames = tuple(labelnames)
+        self._values    = {}
+        self._lock      = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name       = name
+        self.doc        = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets    = tuple(sorted(buckets))
+        self._series    = {}
+        self._lock      = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0}
+            series["counts"][i] += 1
+            series["sum"] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), series["counts"]):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, [('le', le)])} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {series['sum']}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name       = name
+        self.doc        = documentation
+        self.labelnames = tuple(labelnames)
+        self._values    = {}
+        self._lock      = threading.Lock()
+
+    def set(self, value, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Registry:
+    """Metrics of this process, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, *args, **kwargs):
+        metric = Counter(*args, **kwargs)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, *args, **kwargs):
+        metric = Gauge(*args, **kwargs)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, *args, **kwargs):
+        metric = Histogram(*args, **kwargs)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        return "\n".join(line for m in self._metrics for line in m.render()) + "\n"
+
+
+registry = Registry()
+
+REQUEST_SECONDS = registry.histogram(
+    "http_request_duration_seconds", "Time to produce the response (not the streamed body).",
+    ["route", "method", "status"])
+STAGE_SECONDS = registry.histogram(
+    "chat_stage_duration_seconds", "Time spent in each stage of a request.", ["stage"])
+STORAGE_OPS = registry.counter(
+    "storage_operations_total", "Calls into the storage backend.", ["backend", "op", "outcome"])
+STORAGE_SECONDS = registry.histogram(
+    "storage_operation_duration_seconds", "Storage backend call latency.", ["backend", "op"])
+TOKENS = registry.counter(
+    "llm_tokens_total", "Prompt and completion tokens of saved turns.", ["kind"])
+STARTUP_SECONDS = registry.gauge(
+    "process_startup_seconds", "Cold start time of this worker by phase.", ["phase"])
+
+
+# ─── Stage Timing ───────────────────────────────────────────────────────────────
+@contextmanager
+def stage(name):
+    """
+    Time a block as stage `name`: always into the stage histogram, and into
+    the request's Server-Timing list when running inside a request.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        if has_request_context():
+            g.setdefault("timings", []).append((name, elapsed))
+
+
+def server_timing(timings, total=None):
+    """Server-Timing header value from `(stage, seconds)` pairs."""
+    parts = [f"{name};dur={elapsed * 1000:.1f}" for name, elapsed in timings]
+    if total is not None:
+        parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+class InstrumentedStore:
+    """Wraps a storage backend, counting and timing every call made through it."""
+
+    def __init__(self, store):
+        self._store = store
+        self.name   = store.name
+
+    def __getattr__(self, attr):
+        target = getattr(self._store, attr)
+        if not callable(target) or attr.startswith("_"):
+            return target
+
+        def call(*args, **kwargs):
+            start = time.perf_counter()
+            outcome = "error"
+            try:
+                result = target(*args, **kwargs)
+                outcome = "ok"
+                return result
+            finally:
+                STORAGE_SECONDS.observe(time.perf_counter() - start, backend=self.name, op=attr)
+                STORAGE_OPS.inc(backend=self.name, op=attr, outcome=outcome)
+        return call
@@ -0,0 +1,88 @@
+import math
+import re
+from collections import Counter
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+STOPWORDS = frozenset("""
+a an and are as at be but by can do for from has have how i if in into is it
+its me my no not of on or our so that the their them then there these they
+this to us was we what when where which who why will with you your
+""".split())
+
+
+def tokenize(text):
+    return [w for w in _WORD_RE.findall(text.lower()) if w not in STOPWORDS]
+
+
+def chunk_text(text, size=800, overlap=100):
+    """
+    Split `text` into ~`size`-character chunks that overlap by `overlap`,
+    cutting at paragraph, then sentence, then word boundaries when one is
+    close enough to the target length.
+    """
+    chunks = []
+    start  = 0
+    while start < len(text):
+        end = min(start + size, len(text))
+        if end < len(text):
+            window = text[start:end]
+            for sep in ("\n\n", "\n", ". ", " "):
+                cut = window.rfind(sep)
+                if cut > size // 2:
+                    end = start + cut + len(sep)
+                    break
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(text):
+            break
+        # Back up by `overlap`, then forward to a word start
+        next_start = max(end - overlap, start + 1)
+        space = text.find(" ", next_start, end)
+        start = space + 1 if space != -1 else next_start
+    return chunks
+
+
+class BM25Index:
+    """
+    Okapi BM25 over a list of chunk dicts (`text`, `source`, `position`).
+    Immutable: `extended()` returns a new index, so readers never see a
+    half-built one.
+    """
+
+    def __init__(self, chunks, k1=1.5, b=0.75):
+        self.chunks = list(chunks)
+        self.k1, self.b = k1, b
+        self._tfs   = [Counter(tokenize(c["text"])) for c in self.chunks]
+        self._lens  = [sum(tf.values()) for tf in self._tfs]
+        self._avgdl = (sum(self._lens) / len(self._lens)) if self._lens else 0.0
+        df = Counter()
+        for tf in self._tfs:
+            df.update(tf.keys())
+        n = len(self.chunks)
+        self._idf = {t: math.log(1 + (n - f + 0.5) / (f + 0.5)) for t, f in df.items()}
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def extended(self, chunks):
+        return BM25Index(self.chunks + list(chunks), self.k1, self.b)
+
+    def search(self, query, k=4):
+        """Top-`k` chunks for `query`, best first; empty when nothing matches."""
+        terms = set(tokenize(query))
+        if not terms or not self.chunks:
+            return []
+        scored = []
+        for i, tf in enumerate(self._tfs):
+            score = 0.0
+            norm = self.k1 * (1 - self.b + self.b * self._lens[i] / (self._avgdl or 1))
+            for t in terms:
+                f = tf.get(t)
+                if f:
+                    score += self._idf[t] * f * (self.k1 + 1) / (f + norm)
+            if score > 0:
+                scored.append((score, i))
+        scored.sort(reverse=True)
+        return [self.chunks[i] for _, i in scored[:k]]
@@ -0,0 +1,76 @@
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger("chat-service")
+
+
+class StartupProfile:
+    """
+    Where a worker's cold start goes. `mark(phase)` closes a phase that ran
+    since the previous mark; lazily built clients `record()` their own
+    init time whenever it happens (warmup or first use).
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases  = {}
+        self._last   = self.started
+        self._lock   = threading.Lock()
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        with self._lock:
+            self.phases[phase] = now - self._last
+            self._last = now
+
+    def record(self, phase, seconds):
+        with self._lock:
+            self.phases[phase] = seconds
+
+    def report(self):
+        with self._lock:
+            return {
+                "pid":     os.getpid(),
+                "ready_s": round(self._last - self.started, 4),
+                "phases":  {name: round(s, 4) for name, s in self.phases.items()}
+            }
+
+    def log(self):
+        logger.info(json.dumps(dict(self.report(), event="startup")))
+
+
+class Lazy:
+    """
+    Proxy that builds its object with `factory()` on first attribute access
+    (or `get()`), once, even when several threads ask at the same time. The
+    build time is recorded in `profile` as "init:<name>".
+    """
+
+    def __init__(self, name, factory, profile=None):
+        self._name    = name
+        self._factory = factory
+        self._profile = profile
+        self._target  = None
+        self._lock    = threading.Lock()
+
+    @property
+    def ready(self):
+        return self._target is not None
+
+    def get(self):
+        target = self._target
+        if target is not None:
+            return target
+        with self._lock:
+            if self._target is None:
+                start = time.perf_counter()
+                self._target = self._factory()
+                if self._profile is not None:
+                    self._profile.record(f"init:{self._name}", time.perf_counter() - start)
+            return self._target
+
+    def __getattr__(self, attr):
+        return getattr(self.get(), attr)
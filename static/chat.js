@@ -0,0 +1,581 @@
+let activeTab = "Rainmaker";
+let currentChatID = null;
+// Tab data inlined by the server (or prefetched); each entry is used once
+const bootstrapCache = JSON.parse(document.getElementById("bootstrap-data").textContent).tabs || {};
+
+const botMessages = {
+  "Rainmaker":      "🔹 You are in Rainmaker Mode (BizDev)…",
+  "Insight-Magus":  "🔹 You are in Insight-Magus Mode (Strategy)…",
+  "Voice Sculptor": "🔹 You are in Voice Sculptor Mode (Copy)…",
+  "ROI Architect":  "🔹 You are in ROI Architect Mode (Conversion)…"
+};
+
+// Utility to append a bubble
+function appendMessage(role, content) {
+  const div = document.createElement("div");
+  div.className = `msg ${role}`;
+  if (role === "bot") div.innerHTML = marked.parse(content);
+  else div.textContent = content;
+  const box = document.getElementById("chatbox");
+  box.appendChild(div);
+  box.scrollTop = box.scrollHeight;
+}
+
+// // 1. Switch tabs
+// function switchTab(tab) {
+//   activeTab = tab;
+//   if (!currentChatID || !currentChatID.startsWith(activeTab)) {
+//     startNewChat();
+//   } else {
+//     loadChatSessions();
+//     loadChatHistoryFromServer();
+//   }
+// }
+// Call this whenever `activeTab` changes
+function updateTabHighlight() {
+  document.querySelectorAll('.tab-button').forEach(btn => {
+    btn.classList.toggle('active', btn.dataset.tab === activeTab);
+  });
+}
+  // after DOM is parsed wire everything up
+document.addEventListener("DOMContentLoaded", () => {
+  document.getElementById("chatbox").addEventListener("scroll", e => {
+    if (e.target.scrollTop < 40) loadOlderHistory();
+  });
+  updateTabHighlight();
+  resumeLastSession();
+});
+
+  // 1. Switch tabs (no auto-new‐chat!)
+async function switchTab(tab) {
+  activeTab = tab;
+  updateTabHighlight();
+  // resume pointer, sessions and history in one request
+  try {
+await loadTab(tab);
+if (!currentChatID) {
+  // no prior session: just clear the chat area
+  document.getElementById("chatbox").innerHTML = "";
+}
+  } catch (err) {
+console.error("Error resuming session:", err);
+document.getElementById("chatbox").innerHTML = "";
+  }
+}
+
+  // Bootstrap a tab from the inlined/prefetched data, or from /bootstrap
+  async function loadTab(tab) {
+currentChatID = null;
+let data = bootstrapCache[tab];
+delete bootstrapCache[tab];
+if (!data) {
+  const res = await fetch(`/bootstrap/${encodeURIComponent(tab)}`);
+  data = (await res.json()).tabs[tab];
+}
+if (tab !== activeTab || !data) return;
+currentChatID = data.chat_id;
+renderSessions(data.sessions, data.next_cursor);
+document.getElementById("chatbox").innerHTML = "";
+renderHistory(data.history, data.more_history);
+  }
+
+// 2. Generate a unique chat ID
+function generateChatID(botName) {
+  const now = new Date();
+  return `${botName}_${now.getFullYear()}${String(now.getMonth()+1).padStart(2,"0")}`
+       + `${String(now.getDate()).padStart(2,"0")}_${String(now.getHours()).padStart(2,"0")}`
+       + `${String(now.getMinutes()).padStart(2,"0")}${String(now.getSeconds()).padStart(2,"0")}`;
+}
+
+// One key per message; retries reuse it so the server answers them
+// with the original turn instead of running it again
+function newIdempotencyKey() {
+  if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+  return `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+}
+
+async function postWithRetry(url, options, attempts = 3) {
+  for (let i = 1; ; i++) {
+    try {
+      const res = await fetch(url, options);
+      // 409: the first attempt is still being answered
+      if (res.status !== 409 || i >= attempts) return res;
+      const wait = Number(res.headers.get("Retry-After") || 2);
+      await new Promise(r => setTimeout(r, wait * 1000));
+    } catch (err) {
+      if (i >= attempts) throw err;
+      await new Promise(r => setTimeout(r, 1000 * i));
+    }
+  }
+}
+
+// 3. Start a fresh chat: save system prompt then load history
+// async function startNewChat() {
+//   currentChatID = generateChatID(activeTab);
+//   await fetch("/chat", {
+//     method: "POST",
+//     headers: {"Content-Type":"application/json"},
+//     body: JSON.stringify({
+//       message: botMessages[activeTab],
+//       tab: activeTab,
+//       chat_id: currentChatID
+//     })
+//   });
+//   await loadChatSessions();
+//   await loadChatHistoryFromServer();
+// }
+
+// 4. Load session list
+// async function loadChatSessions() {
+//   const list = document.getElementById("chat-list");
+//   list.innerHTML = "";
+//   // We can’t list from Firestore easily—keep last 20 in sessionStorage
+//   const keys = Object.keys(sessionStorage)
+//                      .filter(k=>k.startsWith(activeTab))
+//                      .slice(-20);
+//   keys.forEach(id => {
+//     const btn = document.createElement("button");
+//     btn.textContent = id;
+//     btn.onclick = async () => {
+//       currentChatID = id;
+//       await loadChatHistoryFromServer();
+//     };
+
+//     const del = document.createElement("button");
+//     del.textContent = "❌";
+//     del.className = "delete-btn";
+//     del.onclick = async e => {
+//       e.stopPropagation();
+//       await fetch(`/delete_chat/${activeTab}/${id}`);
+//       sessionStorage.removeItem(id);
+//       await loadChatSessions();
+//     };
+
+//     btn.appendChild(del);
+//     list.appendChild(btn);
+//   });
+// }
+
+  // Pages of the session index: the first page (newest 20) replaces the
+  // list, later ones (cursor = last chat_id shown) are appended to it
+  const SESSIONS_PAGE = 20;
+
+  async function loadChatSessions(cursor = null) {
+try {
+  const query = cursor ? `&cursor=${encodeURIComponent(cursor)}` : "";
+  const tab = activeTab;
+  const res = await fetch(`/sessions/${tab}?limit=${SESSIONS_PAGE}${query}`);
+  const { sessions, next_cursor } = await res.json();
+  if (tab !== activeTab) return;
+  renderSessions(sessions, next_cursor, Boolean(cursor));
+} catch (err) {
+  console.error("Could not load sessions:", err);
+}
+  }
+
+  function renderSessions(sessions, nextCursor = null, append = false) {
+  const list = document.getElementById("chat-list");
+  if (append) list.querySelector(".load-more")?.remove();
+  else list.innerHTML = "";
+  // newest first
+  sessions.forEach(sess => {
+    const id = sess.chat_id;
+    const btn = document.createElement("button");
+    btn.textContent = sess.title || id;
+    btn.title = id;
+    btn.onclick = async () => {
+      currentChatID = id;
+      await loadChatHistoryFromServer();
+    };
+
+    const del = document.createElement("button");
+    del.textContent = "❌";
+    del.className = "delete-btn";
+    del.onclick = async e => {
+      e.stopPropagation();
+      await fetch(`/delete_chat/${activeTab}/${id}`);
+      await loadChatSessions();
+    };
+
+    btn.appendChild(del);
+    list.appendChild(btn);
+  });
+
+  if (nextCursor) {
+    const more = document.createElement("button");
+    more.textContent = "Load more";
+    more.className = "load-more";
+    more.onclick = async () => {
+      more.disabled = true;
+      await loadChatSessions(nextCursor);
+      more.disabled = false;
+    };
+    list.appendChild(more);
+  }
+  }
+
+
+// 5. Load history from Firestore: newest page first, older pages on scroll-up
+const HISTORY_PAGE = 50;
+let oldestLoaded = null;
+let moreHistory = false;
+let loadingOlder = false;
+
+async function loadChatHistoryFromServer() {
+  document.getElementById("chatbox").innerHTML = "";
+  oldestLoaded = null;
+  moreHistory = false;
+  try {
+    const res = await fetch(`/history/${activeTab}/${currentChatID}?limit=${HISTORY_PAGE}`);
+    const history = await res.json();
+    renderHistory(history, history.length === HISTORY_PAGE);
+  } catch(err) {
+    console.error("History load error", err);
+  }
+}
+
+function renderHistory(history, more) {
+  history.forEach(m=>appendMessage(m.role, m.content));
+  oldestLoaded = history.length ? history[0].timestamp : null;
+  moreHistory = more;
+}
+
+async function loadOlderHistory() {
+  if (!moreHistory || loadingOlder || !oldestLoaded) return;
+  loadingOlder = true;
+  const box = document.getElementById("chatbox");
+  const chatID = currentChatID;
+  try {
+    const res = await fetch(`/history/${activeTab}/${chatID}`
+                            + `?before=${encodeURIComponent(oldestLoaded)}&limit=${HISTORY_PAGE}`);
+    const older = await res.json();
+    if (chatID !== currentChatID) return;
+    const prevHeight = box.scrollHeight;
+    older.slice().reverse().forEach(m => {
+      const div = document.createElement("div");
+      div.className = `msg ${m.role}`;
+      if (m.role === "bot") div.innerHTML = marked.parse(m.content);
+      else div.textContent = m.content;
+      box.insertBefore(div, box.firstChild);
+    });
+    box.scrollTop += box.scrollHeight - prevHeight;
+    if (older.length) oldestLoaded = older[0].timestamp;
+    moreHistory = older.length === HISTORY_PAGE;
+  } catch(err) {
+    console.error("Older history load error", err);
+  } finally {
+    loadingOlder = false;
+  }
+}
+
+// 6. Send a user message
+// async function sendMessage() {
+//   const txt = document.getElementById("message").value.trim();
+//   if (!txt) return;
+//   appendMessage("user", txt);
+//   document.getElementById("message").value = "";
+
+//   // show typing…
+//   document.getElementById("typing-indicator").style.display = "block";
+
+//   try {
+//     const res = await fetch("/chat", {
+//       method: "POST",
+//       headers: {"Content-Type":"application/json"},
+//       body: JSON.stringify({
+//         message: txt,
+//         tab: activeTab,
+//         chat_id: currentChatID
+//       })
+//     });
+//     const data = await res.json();
+
+//     document.getElementById("typing-indicator").style.display = "none";
+//     currentChatID = data.chat_id;
+//     appendMessage("bot", data.reply);
+
+//     // remember this session in sessionStorage
+//     sessionStorage.setItem(currentChatID, "1");
+//     await loadChatSessions();
+
+//   } catch(err) {
+//     console.error("Chat error:", err);
+//     document.getElementById("typing-indicator").style.display = "none";
+//     appendMessage("bot", "⚠️ Error processing your request.");
+//   }
+// }
+async function startNewChat() {
+  currentChatID = generateChatID(activeTab);
+  // send the system prompt to the /chat API which will
+  // create the session metadata automatically
+  await postWithRetry("/chat", {
+method: "POST",
+headers: { "Content-Type": "application/json" },
+body: JSON.stringify({
+  message: botMessages[activeTab],
+  tab: activeTab,
+  chat_id: currentChatID,
+  idempotency_key: newIdempotencyKey()
+})
+  });
+  // then refresh the list & history
+  await loadChatSessions();
+  await loadChatHistoryFromServer();
+}
+
+// async function sendMessage() {
+//   const txt = document.getElementById("message").value.trim();
+//   if (!txt) return;
+//   appendMessage("user", txt);
+//   document.getElementById("message").value = "";
+
+//   document.getElementById("typing-indicator").style.display = "block";
+//   try {
+//     const res = await fetch("/chat", {
+//       method: "POST",
+//       headers: { "Content-Type": "application/json" },
+//       body: JSON.stringify({
+//         message: txt,
+//         tab: activeTab,
+//         chat_id: currentChatID
+//       })
+//     });
+//     const data = await res.json();
+//     document.getElementById("typing-indicator").style.display = "none";
+//     currentChatID = data.chat_id;
+//     appendMessage("bot", data.reply);
+
+//     // update list now that a brand-new session might exist
+//     await loadChatSessions();
+//   } catch (err) {
+//     console.error("Chat error:", err);
+//     document.getElementById("typing-indicator").style.display = "none";
+//     appendMessage("bot", "⚠️ Error processing your request.");
+//   }
+// }
+
+
+  // // ── Helper: gradually type out the bot’s reply ────────────────────────────────
+  // function typeText(msgDiv, text, speed = 10) {
+  //   let i = 0;
+  //   const box = document.getElementById("chatbox");
+  //   function typeChar() {
+  //     if (i < text.length) {
+  //       msgDiv.textContent += text.charAt(i++);
+  //       box.scrollTop = box.scrollHeight;
+  //       setTimeout(typeChar, speed);
+  //     } else {
+  //       // Once done, render Markdown properly
+  //       msgDiv.innerHTML = marked.parse(text);
+  //       box.scrollTop = box.scrollHeight;
+  //     }
+  //   }
+  //   typeChar();
+  // }
+
+
+function typeText(msgDiv, text, speed = 10) {
+  let i = 0;
+  const box = document.getElementById("chatbox");
+  function typeChar() {
+if (i < text.length) {
+  // take the first i+1 chars, parse to HTML, inject
+  const partial = text.slice(0, i + 1);
+  msgDiv.innerHTML = marked.parse(partial);
+  box.scrollTop = box.scrollHeight;
+  i++;
+  setTimeout(typeChar, speed);
+}
+  }
+  typeChar();
+}
+
+  
+  // ── Updated sendMessage() ────────────────────────────────────────────────────
+  // async function sendMessage() {
+  //   const inputEl = document.getElementById("message");
+  //   const txt     = inputEl.value.trim();
+  //   if (!txt) return;
+  //   appendMessage("user", txt);
+  //   inputEl.value = "";
+
+  //   // Show the generic typing indicator
+  //   const typingEl = document.getElementById("typing-indicator");
+  //   typingEl.style.display = "block";
+
+  //   try {
+  //     const res  = await fetch("/chat", {
+  //       method: "POST",
+  //       headers: { "Content-Type": "application/json" },
+  //       body: JSON.stringify({
+  //         message: txt,
+  //         tab: activeTab,
+  //         chat_id: currentChatID
+  //       })
+  //     });
+  //     const data = await res.json();
+  //     // Hide the generic indicator
+  //     typingEl.style.display = "none";
+
+  //     // Update chat_id in case it was newly generated
+  //     currentChatID = data.chat_id;
+
+  //     // Create a new bot bubble, then type into it
+  //     const box   = document.getElementById("chatbox");
+  //     const msgDiv = document.createElement("div");
+  //     msgDiv.className = "msg bot";
+  //     box.appendChild(msgDiv);
+
+  //     // Type‐out effect
+  //     typeText(msgDiv, data.reply, 10 /* ms per character */);
+
+  //     // Refresh session list
+  //     await loadChatSessions();
+
+  //   } catch (err) {
+  //     console.error("Chat error:", err);
+  //     typingEl.style.display = "none";
+  //     appendMessage("bot", "⚠️ Error processing your request.");
+  //   }
+  // }
+
+  // ── Render an SSE reply token-by-token ──────────────────────────────────────
+  async function readReplyStream(res, msgDiv) {
+const box = document.getElementById("chatbox");
+const reader = res.body.getReader();
+const decoder = new TextDecoder();
+let buffer = "";
+let text = "";
+
+function handle(event, data) {
+  if (event === "start") {
+    currentChatID = data.chat_id;
+  } else if (event === "token") {
+    if (!msgDiv.isConnected) {
+      document.getElementById("typing-indicator").style.display = "none";
+      box.appendChild(msgDiv);
+    }
+    text += data.text;
+    msgDiv.innerHTML = marked.parse(text);
+    box.scrollTop = box.scrollHeight;
+  } else if (event === "done" || event === "error") {
+    document.getElementById("typing-indicator").style.display = "none";
+    if (!msgDiv.isConnected) box.appendChild(msgDiv);
+    msgDiv.innerHTML = marked.parse(data.reply);
+    box.scrollTop = box.scrollHeight;
+  }
+}
+
+while (true) {
+  const { value, done } = await reader.read();
+  if (done) break;
+  buffer += decoder.decode(value, { stream: true });
+  let sep;
+  while ((sep = buffer.indexOf("\n\n")) !== -1) {
+    const frame = buffer.slice(0, sep);
+    buffer = buffer.slice(sep + 2);
+    let event = "message", data = "";
+    frame.split("\n").forEach(line => {
+      if (line.startsWith("event: ")) event = line.slice(7);
+      else if (line.startsWith("data: ")) data += line.slice(6);
+    });
+    handle(event, JSON.parse(data || "{}"));
+  }
+}
+document.getElementById("typing-indicator").style.display = "none";
+  }
+
+  async function sendMessage() {
+  const inputEl = document.getElementById("message");
+  const fileEl = document.getElementById("file-input");
+  const txt = inputEl.value.trim();
+  const file = fileEl.files[0];
+
+  if (!txt && !file) return;
+
+  if (txt) appendMessage("user", txt);
+  inputEl.value = "";
+
+  const formData = new FormData();
+  formData.append("tab", activeTab);
+  formData.append("chat_id", currentChatID || "");
+  formData.append("message", txt || "");
+  formData.append("idempotency_key", newIdempotencyKey());
+  if (file) formData.append("file", file);
+
+  document.getElementById("typing-indicator").style.display = "block";
+
+  try {
+const res = await postWithRetry("/chat_with_file", {
+  method: "POST",
+  headers: { "Accept": "text/event-stream" },
+  body: formData
+});
+const msgDiv = document.createElement("div");
+msgDiv.className = "msg bot";
+
+if (!(res.headers.get("Content-Type") || "").startsWith("text/event-stream")) {
+  // Errors before the stream starts still come back as JSON
+  const data = await res.json();
+  document.getElementById("typing-indicator").style.display = "none";
+  if (data.chat_id) currentChatID = data.chat_id;
+  document.getElementById("chatbox").appendChild(msgDiv);
+  typeText(msgDiv, data.reply, 10);
+} else {
+  await readReplyStream(res, msgDiv);
+}
+await loadChatSessions();
+  } catch (err) {
+console.error("File chat error:", err);
+document.getElementById("typing-indicator").style.display = "none";
+appendMessage("bot", "⚠️ File processing failed.");
+  }
+
+  fileEl.value = ""; // Reset file input
+}
+
+// 7. Resume on load
+// async function resumeLastSession() {
+//   try {
+//     const res = await fetch(`/resume_session/${activeTab}`);
+//     const data = await res.json();
+//     if (data.chat_id) {
+//       currentChatID = data.chat_id;
+//       sessionStorage.setItem(currentChatID, "1");
+//       await loadChatSessions();
+//       await loadChatHistoryFromServer();
+//     } else {
+//       await startNewChat();
+//     }
+//   } catch {
+//     await startNewChat();
+//   }
+// }
+
+  async function resumeLastSession() {
+// highlight the default tab on load
+  updateTabHighlight();
+// 1️⃣ the “last” session, session list and history, inlined in the page
+try {
+  await loadTab(activeTab);
+} catch {
+  currentChatID = null;
+}
+
+// 2️⃣ start fresh if there was nothing to resume
+if (!currentChatID) {
+  await startNewChat();
+}
+  }
+
+  // window.onload = resumeLastSession;
+
+
+// 8. Logout
+function logout() {
+  fetch("/logout")
+    .then(()=>{ sessionStorage.clear(); window.location.href="/"; })
+    .catch(console.error);
+}
+
+// window.onload = resumeLastSession;
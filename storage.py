@@ -0,0 +1,886 @@
+import hashlib
+import logging
+import os
+import tempfile
+from collections import Counter
+from datetime import datetime
+
+import sqlalchemy as sa
+
+from deletion import delete_refs, iter_tree
+
+logger = logging.getLogger("chat-service")
+
+# google.cloud.firestore takes a few hundred ms to import, so it is loaded
+# by the first FirestoreStore instead of with this module
+firestore = FieldFilter = None
+
+
+def load_firestore():
+    """Import the Firestore client library; returns the `firestore` module."""
+    global firestore, FieldFilter
+    if firestore is None:
+        from google.cloud import firestore as module
+        from google.cloud.firestore_v1.base_query import FieldFilter as field_filter
+        FieldFilter, firestore = field_filter, module
+    return firestore
+
+class StorageUnavailable(Exception):
+    """The configured backend could not be opened; the caller should answer 503."""
+
+
+def message_id(active_tab, chat_id, message):
+    """
+    Id of a message, derived from its content so that writing it again (a
+    retried batch, a re-imported archive) lands on the same row or document.
+    """
+    key = "\x1f".join((active_tab, chat_id, message.get("timestamp") or "", message["role"], message["content"]))
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+
+def _ids(turn):
+    return [e.get("id") or message_id(turn["tab"], turn["chat_id"], e) for e in turn["messages"]]
+
+
+def turn_message_id(turn_key, active_tab, chat_id, index):
+    """
+    Id of the `index`th message a turn with idempotency key `turn_key`
+    writes to a session: a duplicate of that turn gets the same ids, even
+    when it ran on another worker with its own timestamps.
+    """
+    raw = "\x1f".join([turn_key, active_tab, chat_id or "", str(index)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+def _grouped(messages):
+    """Message rows by `(tab, chat_id)`, in their original order."""
+    groups = {}
+    for m in messages:
+        groups.setdefault((m["tab"], m["chat_id"]), []).append(m)
+    return groups
+
+
+def _stored(entry):
+    return {k: v for k, v in entry.items() if k != "id"}
+
+
+# Timestamps are ISO-8601 strings in every backend, so they sort as text.
+def _message(d):
+    return {"role": d["role"], "content": d["content"], "timestamp": d.get("timestamp") or ""}
+
+
+def _archived(d):
+    """A message with the optional fields an export carries."""
+    message = _message(d)
+    if d.get("partial"):
+        message["partial"] = True
+    if d.get("file_hash"):
+        message["file_hash"] = d["file_hash"]
+    return message
+
+
+def _summary_fields(d):
+    return {k: d.get(k) for k in ("content", "covered_until", "covered_count", "updated_at")}
+
+
+def _session(chat_id, d):
+    return {
+        "chat_id":         chat_id,
+        "title":           d.get("title"),
+        "created_at":      d.get("created_at") or "",
+        "last_message_at": d.get("last_message_at") or d.get("created_at") or "",
+        "message_count":   d.get("message_count") or 0
+    }
+
+
+# ─── Firestore ──────────────────────────────────────────────────────────────────
+class FirestoreStore:
+    """
+    Users, sessions, messages, summaries and uploads in Firestore:
+
+        users/{user}
+        users/{user}/files/{sha256}                 (sessions: "tab/chat_id" using it)
+        users/{user}/bots/{tab}/active_session/last
+        users/{user}/bots/{tab}/sessions/{chat_id}
+        users/{user}/bots/{tab}/sessions/{chat_id}/messages/{auto}
+        users/{user}/bots/{tab}/sessions/{chat_id}/summary/rolling
+        users/{user}/bots/{tab}/sessions/{chat_id}/files/{sha256}
+    """
+
+    name = "firestore"
+
+    def __init__(self, db):
+        load_firestore()
+        self.db = db
+
+    def _user(self, username):
+        return self.db.collection("users").document(username)
+
+    def _tab(self, username, active_tab):
+        return self._user(username).collection("bots").document(active_tab)
+
+    def _session(self, username, active_tab, chat_id):
+        return self._tab(username, active_tab).collection("sessions").document(chat_id)
+
+    # Users
+    def get_user(self, username):
+        doc = self._user(username).get()
+        return doc.to_dict() if doc.exists else None
+
+    def create_user(self, username, data):
+        self._user(username).set(data)
+
+    # Messages and sessions
+    def messages(self, username, active_tab, chat_id, since=None, before=None, limit=None, newest_first=False):
+        """Messages with `since < timestamp < before`, oldest first."""
+        query = self._session(username, active_tab, chat_id).collection("messages")
+        if since is not None:
+            query = query.where(filter=FieldFilter("timestamp", ">", since))
+        if before is not None:
+            query = query.where(filter=FieldFilter("timestamp", "<", before))
+        direction = firestore.Query.DESCENDING if newest_first else firestore.Query.ASCENDING
+        query = query.order_by("timestamp", direction=direction)
+        if limit is not None:
+            query = query.limit(limit)
+        items = [_message(doc.to_dict()) for doc in query.stream()]
+        return items[::-1] if newest_first else items
+
+    def list_sessions(self, username, active_tab, limit, cursor=None):
+        """Up to `limit` sessions, newest first, starting after chat id `cursor`."""
+        col   = self._tab(username, active_tab).collection("sessions")
+        query = col.order_by("created_at", direction=firestore.Query.DESCENDING).limit(limit)
+        if cursor:
+            snapshot = col.document(cursor).get()
+            if snapshot.exists:
+                query = query.start_after(snapshot)
+        return [_session(doc.id, doc.to_dict() or {}) for doc in query.stream()]
+
+    def active_session(self, username, active_tab):
+        doc = self._tab(username, active_tab).collection("active_session").document("last").get()
+        return doc.to_dict().get("chat_id") if doc.exists else None
+
+    def commit_turn(self, turn):
+        """
+        Write one chat turn atomically: its messages, the “last” pointer,
+        the session index fields and the usage counters. See
+        `main.save_turn` for the shape of `turn`.
+        """
+        self.commit_turns([turn])
+
+    def commit_turns(self, turns):
+        """
+        Write several turns (e.g. one per tab) in a single batch. Messages
+        already stored are not written again, and a turn that is stored in
+        full (a retry after a commit that succeeded) is skipped, so the
+        counters are not incremented twice.
+        """
+        messages = [self._session(t["username"], t["tab"], t["chat_id"]).collection("messages")
+                    for t in turns]
+        refs = [[col.document(mid) for mid in _ids(turn)] for col, turn in zip(messages, turns)]
+        stored = {doc.reference.path for doc in self.db.get_all([r for rs in refs for r in rs]) if doc.exists}
+
+        batch  = self.db.batch()
+        totals = {}
+        for turn, turn_refs in zip(turns, refs):
+            new = [(entry, ref) for entry, ref in zip(turn["messages"], turn_refs) if ref.path not in stored]
+            if not new:
+                continue
+            username, active_tab, chat_id = turn["username"], turn["tab"], turn["chat_id"]
+            session_ref = self._session(username, active_tab, chat_id)
+            usage = {k: firestore.Increment(v) for k, v in turn["usage"].items()}
+            index = dict(turn["session"], message_count=firestore.Increment(len(new)), usage=usage)
+
+            for entry, ref in new:
+                batch.set(ref, _stored(entry))
+            batch.set(self._tab(username, active_tab).collection("active_session").document("last"),
+                      {"chat_id": chat_id, "timestamp": turn["at"]})
+            batch.set(session_ref, index, merge=True)
+
+            # One user-document write per user, with the summed counters
+            user = totals.setdefault(username, {"usage": {}, "at": turn["at"]})
+            for k, v in turn["usage"].items():
+                user["usage"][k] = user["usage"].get(k, 0) + v
+            user["at"] = max(user["at"], turn["at"])
+        for username, user in totals.items():
+            usage = {k: firestore.Increment(v) for k, v in user["usage"].items()}
+            batch.set(self._user(username), {"usage": dict(usage, last_turn_at=user["at"])}, merge=True)
+        if totals:
+            batch.commit()
+
+    # Rolling summaries
+    def _summary(self, username, active_tab, chat_id):
+        return self._session(username, active_tab, chat_id).collection("summary").document("rolling")
+
+    def get_summary(self, username, active_tab, chat_id):
+        doc = self._summary(username, active_tab, chat_id).get()
+        return doc.to_dict() if doc.exists else {}
+
+    def set_summary(self, username, active_tab, chat_id, summary):
+        self._summary(username, active_tab, chat_id).set(summary)
+
+    # Uploaded files
+    def get_file(self, username, digest):
+        doc = self._user(username).collection("files").document(digest).get()
+        return doc.to_dict() if doc.exists else None
+
+    def put_file(self, username, digest, stored):
+        # Merged, so the sessions already using the file stay recorded
+        self._user(username).collection("files").document(digest).set(stored, merge=True)
+
+    def touch_file(self, username, digest, at):
+        self._user(username).collection("files").document(digest).set({"last_used_at": at}, merge=True)
+
+    def evict_files(self, username, keep):
+        """
+        Drop all but the `keep` most recently used files, never one that a
+        session still references; returns their digests.
+        """
+        stale = self._user(username).collection("files") \
+            .order_by("last_used_at", direction=firestore.Query.DESCENDING) \
+            .offset(keep).select(["sessions"]).stream()
+        refs = [doc.reference for doc in stale if not doc.to_dict().get("sessions")]
+        if refs:
+            delete_refs(self.db, refs)
+        return [ref.id for ref in refs]
+
+    def session_files(self, username, active_tab, chat_id):
+        """`(digest, name)` for each file attached to the session, oldest first."""
+        col = self._session(username, active_tab, chat_id).collection("files")
+        return [(doc.id, doc.to_dict()["name"]) for doc in col.order_by("created_at").stream()]
+
+    def attach_file(self, username, active_tab, chat_id, digest, name, at):
+        batch = self.db.batch()
+        batch.set(self._session(username, active_tab, chat_id).collection("files").document(digest),
+                  {"name": name, "created_at": at})
+        batch.set(self._user(username).collection("files").document(digest),
+                  {"sessions": firestore.ArrayUnion([f"{active_tab}/{chat_id}"])}, merge=True)
+        batch.commit()
+
+    def _release_files(self, username, active_tab, sessions):
+        """Take `sessions` (session references) off the files they use."""
+        batch, pending = self.db.batch(), 0
+        for s in sessions:
+            for f in s.collection("files").select([]).stream():
+                batch.set(self._user(username).collection("files").document(f.id),
+                          {"sessions": firestore.ArrayRemove([f"{active_tab}/{s.id}"])}, merge=True)
+                pending += 1
+                if pending == 500:
+                    batch.commit()
+                    batch, pending = self.db.batch(), 0
+        if pending:
+            batch.commit()
+
+    # Deletion: whole subtrees, in parallel batches
+    def delete_session(self, username, active_tab, chat_id, parallelism=8, progress=None):
+        self._release_files(username, active_tab, [self._session(username, active_tab, chat_id)])
+        return delete_refs(self.db, iter_tree(self._session(username, active_tab, chat_id)),
+                           parallelism=parallelism, progress=progress)
+
+    def delete_tab(self, username, active_tab, parallelism=8, progress=None):
+        self._release_files(username, active_tab,
+                            self._tab(username, active_tab).collection("sessions").list_documents())
+        return delete_refs(self.db, iter_tree(self._tab(username, active_tab)),
+                           parallelism=parallelism, progress=progress)
+
+    def delete_user(self, username, parallelism=8, progress=None):
+        return delete_refs(self.db, iter_tree(self._user(username)),
+                           parallelism=parallelism, progress=progress)
+
+    # Background job status, outside the user tree so that purging an
+    # account does not delete the status of the job doing it
+    def put_job(self, job_id, job):
+        self.db.collection("jobs").document(job_id).set(job)
+
+    def get_job(self, job_id):
+        doc = self.db.collection("jobs").document(job_id).get()
+        return doc.to_dict() if doc.exists else None
+
+    # Idempotency keys, shared by every worker and instance
+    def _idempotency(self, key):
+        return self.db.collection("idempotency").document(key)
+
+    def claim_idempotency_key(self, key, record, now):
+        """Create `key` as `record` unless a claim that expires after `now` holds it; returns that claim."""
+        ref = self._idempotency(key)
+
+        @firestore.transactional
+        def claim(transaction):
+            doc = ref.get(transaction=transaction)
+            if doc.exists and (doc.to_dict().get("expires_at") or "") > now:
+                return doc.to_dict()
+            transaction.set(ref, record)
+            return None
+        return claim(self.db.transaction())
+
+    def put_idempotency_key(self, key, record):
+        self._idempotency(key).set(record)
+
+    def delete_idempotency_key(self, key):
+        self._idempotency(key).delete()
+
+    # Export and import
+    def export_sessions(self, username, active_tab, page_size=500):
+        """
+        Every session of a tab, a page at a time, including sessions that
+        only exist as a messages subcollection (no session document).
+        """
+        refs = []
+        for ref in self._tab(username, active_tab).collection("sessions").list_documents(page_size=page_size):
+            refs.append(ref)
+            if len(refs) == page_size:
+                yield from (_session(doc.id, doc.to_dict() or {}) for doc in self.db.get_all(refs))
+                refs = []
+        if refs:
+            yield from (_session(doc.id, doc.to_dict() or {}) for doc in self.db.get_all(refs))
+
+    def export_messages(self, username, active_tab, chat_id, page_size=500):
+        """Every message of a session, oldest first, a page at a time."""
+        query = self._session(username, active_tab, chat_id).collection("messages") \
+            .order_by("timestamp").limit(page_size)
+        last = None
+        while True:
+            page = list((query.start_after(last) if last else query).stream())
+            for doc in page:
+                yield _archived(doc.to_dict())
+            if len(page) < page_size:
+                return
+            last = page[-1]
+
+    def import_records(self, username, records):
+        """
+        Write a slice of an archive in one batch: `session`, `message`,
+        `summary` and `active` records as produced by `main.export_records`.
+        Messages are keyed by `message_id()`, so importing an archive again
+        only adds what is missing. Returns the records written per type;
+        messages already stored are counted as "duplicate".
+        """
+        message_refs = {}
+        for r in records:
+            if r["type"] == "message":
+                ref = self._session(username, r["tab"], r["chat_id"]).collection("messages") \
+                    .document(message_id(r["tab"], r["chat_id"], r))
+                message_refs[ref.path] = ref
+        stored = {doc.reference.path for doc in self.db.get_all(list(message_refs.values())) if doc.exists} \
+            if message_refs else set()
+
+        batch    = self.db.batch()
+        written  = Counter()
+        sessions = {}
+        stamps   = {}
+        for r in records:
+            key = r["tab"], r["chat_id"]
+            session_ref = self._session(username, *key)
+            if r["type"] == "session":
+                sessions.setdefault(key, {}).update(
+                    {k: r[k] for k in ("title", "created_at", "last_message_at") if r.get(k)})
+            elif r["type"] == "message":
+                ref = session_ref.collection("messages").document(message_id(r["tab"], r["chat_id"], r))
+                if ref.path in stored:
+                    written["duplicate"] += 1
+                    continue
+                stored.add(ref.path)
+                batch.set(ref, _archived(r))
+                sessions.setdefault(key, {})
+                stamps.setdefault(key, []).append(r.get("timestamp") or "")
+            elif r["type"] == "summary":
+                batch.set(session_ref.collection("summary").document("rolling"), _summary_fields(r))
+            elif r["type"] == "active":
+                batch.set(self._tab(username, r["tab"]).collection("active_session").document("last"),
+                          {"chat_id": r["chat_id"], "timestamp": r.get("timestamp")})
+            written[r["type"]] += 1
+
+        # Sessions without created_at never show up in list_sessions(); date
+        # them the way SQLStore does when neither the archive nor the
+        # existing document has one
+        paths = {self._session(username, *key).path: key for key in sessions}
+        existing = self.db.get_all([self._session(username, *key) for key in sessions]) if sessions else []
+        current = {paths[doc.reference.path]: doc.to_dict() or {} for doc in existing}
+        for key in sessions:
+            fields, have = sessions[key], current.get(key, {})
+            if not have.get("created_at") and not fields.get("created_at"):
+                fields["created_at"] = fields.get("last_message_at") or min(stamps.get(key) or [""])
+            if not have.get("last_message_at") and not fields.get("last_message_at") and key in stamps:
+                fields["last_message_at"] = max(stamps[key])
+            if key in stamps:
+                fields["message_count"] = firestore.Increment(len(stamps[key]))
+            batch.set(self._session(username, *key), fields, merge=True)
+        batch.commit()
+        return written
+
+
+# ─── SQL ────────────────────────────────────────────────────────────────────────
+metadata = sa.MetaData()
+
+users_table = sa.Table(
+    "users", metadata,
+    sa.Column("username", sa.String(255), primary_key=True),
+    sa.Column("password", sa.Text),
+    sa.Column("created_at", sa.String(32)),
+    sa.Column("usage_turns", sa.BigInteger, nullable=False, server_default="0"),
+    sa.Column("usage_prompt_tokens", sa.BigInteger, nullable=False, server_default="0"),
+    sa.Column("usage_completion_tokens", sa.BigInteger, nullable=False, server_default="0"),
+    sa.Column("last_turn_at", sa.String(32))
+)
+
+sessions_table = sa.Table(
+    "sessions", metadata,
+    sa.Column("username", sa.String(255), primary_key=True),
+    sa.Column("tab", sa.String(64), primary_key=True),
+    sa.Column("chat_id", sa.String(255), primary_key=True),
+    sa.Column("title", sa.Text),
+    sa.Column("created_at", sa.String(32), nullable=False),
+    sa.Column("last_message_at", sa.String(32)),
+    sa.Column("message_count", sa.Integer, nullable=False, server_default="0"),
+    sa.Column("usage_turns", sa.BigInteger, nullable=False, server_default="0"),
+    sa.Column("usage_prompt_tokens", sa.BigInteger, nullable=False, server_default="0"),
+    sa.Column("usage_completion_tokens", sa.BigInteger, nullable=False, server_default="0"),
+    sa.Index("sessions_by_created", "username", "tab", "created_at")
+)
+
+messages_table = sa.Table(
+    "messages", metadata,
+    sa.Column("id", sa.BigInteger().with_variant(sa.Integer, "sqlite"), primary_key=True, autoincrement=True),
+    sa.Column("username", sa.String(255), nullable=False),
+    sa.Column("tab", sa.String(64), nullable=False),
+    sa.Column("chat_id", sa.String(255), nullable=False),
+    sa.Column("role", sa.String(16), nullable=False),
+    sa.Column("content", sa.Text, nullable=False),
+    sa.Column("timestamp", sa.String(32), nullable=False),
+    sa.Column("partial", sa.Boolean, nullable=False, server_default=sa.false()),
+    sa.Column("file_hash", sa.String(64)),
+    sa.Column("message_id", sa.String(64)),
+    sa.Index("messages_by_time", "username", "tab", "chat_id", "timestamp"),
+    sa.Index("messages_by_id", "username", "tab", "chat_id", "message_id", unique=True)
+)
+
+active_sessions_table = sa.Table(
+    "active_sessions", metadata,
+    sa.Column("username", sa.String(255), primary_key=True),
+    sa.Column("tab", sa.String(64), primary_key=True),
+    sa.Column("chat_id", sa.String(255), nullable=False),
+    sa.Column("timestamp", sa.String(32))
+)
+
+summaries_table = sa.Table(
+    "summaries", metadata,
+    sa.Column("username", sa.String(255), primary_key=True),
+    sa.Column("tab", sa.String(64), primary_key=True),
+    sa.Column("chat_id", sa.String(255), primary_key=True),
+    sa.Column("content", sa.Text, nullable=False),
+    sa.Column("covered_until", sa.String(32), nullable=False),
+    sa.Column("covered_count", sa.Integer, nullable=False),
+    sa.Column("updated_at", sa.String(32))
+)
+
+files_table = sa.Table(
+    "files", metadata,
+    sa.Column("username", sa.String(255), primary_key=True),
+    sa.Column("digest", sa.String(64), primary_key=True),
+    sa.Column("kind", sa.String(16)),
+    sa.Column("chars", sa.Integer),
+    sa.Column("chunks", sa.JSON, nullable=False),
+    sa.Column("preview", sa.Text),
+    sa.Column("created_at", sa.String(32)),
+    sa.Column("last_used_at", sa.String(32)),
+    sa.Index("files_by_use", "username", "last_used_at")
+)
+
+session_files_table = sa.Table(
+    "session_files", metadata,
+    sa.Column("username", sa.String(255), primary_key=True),
+    sa.Column("tab", sa.String(64), primary_key=True),
+    sa.Column("chat_id", sa.String(255), primary_key=True),
+    sa.Column("digest", sa.String(64), primary_key=True),
+    sa.Column("name", sa.Text, nullable=False),
+    sa.Column("created_at", sa.String(32))
+)
+
+jobs_table = sa.Table(
+    "jobs", metadata,
+    sa.Column("job_id", sa.String(64), primary_key=True),
+    sa.Column("data", sa.JSON, nullable=False),
+    sa.Column("expires_at", sa.String(32), nullable=False, index=True)
+)
+
+idempotency_table = sa.Table(
+    "idempotency_keys", metadata,
+    sa.Column("request_key", sa.String(64), primary_key=True),
+    sa.Column("data", sa.JSON, nullable=False),
+    sa.Column("expires_at", sa.String(32), nullable=False, index=True)
+)
+
+USAGE_COLUMNS = {"turns": "usage_turns", "prompt_tokens": "usage_prompt_tokens",
+                 "completion_tokens": "usage_completion_tokens"}
+
+
+def create_engine(url, pool_size=10):
+    """Engine for `url`, with SQLite set up for use from many threads."""
+    if url.startswith("sqlite"):
+        if url in ("sqlite://", "sqlite:///:memory:"):
+            # A throwaway file instead: an in-memory database is private to
+            # one connection, and sharing that connection across threads
+            # mixes up their transactions
+            fd, path = tempfile.mkstemp(prefix="chat-", suffix=".sqlite3")
+            os.close(fd)
+            url = f"sqlite:///{path}"
+        engine = sa.create_engine(url, connect_args={"check_same_thread": False, "timeout": 30})
+
+        @sa.event.listens_for(engine, "connect")
+        def _pragmas(conn, record):
+            cursor = conn.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.close()
+        return engine
+    return sa.create_engine(url, pool_size=pool_size, max_overflow=pool_size, pool_pre_ping=True)
+
+
+class SQLStore:
+    """
+    The same repository on SQLAlchemy Core, for SQLite (local runs, tests,
+    benchmarks) or Postgres (a co-located database). Tables are created on
+    start-up if missing.
+    """
+
+    name = "sql"
+
+    def __init__(self, engine):
+        self.engine = engine
+        metadata.create_all(engine)
+
+    @staticmethod
+    def _where(table, username, active_tab=None, chat_id=None):
+        clause = table.c.username == username
+        if active_tab is not None:
+            clause = clause & (table.c.tab == active_tab)
+        if chat_id is not None:
+            clause = clause & (table.c.chat_id == chat_id)
+        return clause
+
+    # Users
+    def get_user(self, username):
+        with self.engine.connect() as conn:
+            row = conn.execute(sa.select(users_table).where(users_table.c.username == username)).mappings().first()
+        if row is None:
+            return None
+        user = {k: row[k] for k in ("username", "password", "created_at")}
+        user["usage"] = {k: row[c] for k, c in USAGE_COLUMNS.items()}
+        return user
+
+    def create_user(self, username, data):
+        with self.engine.begin() as conn:
+            conn.execute(sa.delete(users_table).where(users_table.c.username == username))
+            conn.execute(sa.insert(users_table).values(
+                username=username, password=data.get("password"), created_at=data.get("created_at")))
+
+    # Messages and sessions
+    def messages(self, username, active_tab, chat_id, since=None, before=None, limit=None, newest_first=False):
+        t = messages_table
+        query = sa.select(t.c.role, t.c.content, t.c.timestamp).where(self._where(t, username, active_tab, chat_id))
+        if since is not None:
+            query = query.where(t.c.timestamp > since)
+        if before is not None:
+            query = query.where(t.c.timestamp < before)
+        order = (t.c.timestamp.desc(), t.c.id.desc()) if newest_first else (t.c.timestamp, t.c.id)
+        query = query.order_by(*order)
+        if limit is not None:
+            query = query.limit(limit)
+        with self.engine.connect() as conn:
+            items = [_message(row) for row in conn.execute(query).mappings()]
+        return items[::-1] if newest_first else items
+
+    def list_sessions(self, username, active_tab, limit, cursor=None):
+        t = sessions_table
+        query = sa.select(t).where(self._where(t, username, active_tab)) \
+            .order_by(t.c.created_at.desc(), t.c.chat_id.desc()).limit(limit)
+        with self.engine.connect() as conn:
+            if cursor:
+                start = conn.execute(sa.select(t.c.created_at).where(
+                    self._where(t, username, active_tab, cursor))).scalar()
+                if start is not None:
+                    query = query.where((t.c.created_at < start)
+                                        | ((t.c.created_at == start) & (t.c.chat_id < cursor)))
+            return [_session(row["chat_id"], row) for row in conn.execute(query).mappings()]
+
+    def active_session(self, username, active_tab):
+        t = active_sessions_table
+        with self.engine.connect() as conn:
+            return conn.execute(sa.select(t.c.chat_id).where(self._where(t, username, active_tab))).scalar()
+
+    def commit_turn(self, turn):
+        self.commit_turns([turn])
+
+    def _existing_ids(self, conn, username, active_tab, chat_id, ids):
+        t = messages_table
+        query = sa.select(t.c.message_id).where(self._where(t, username, active_tab, chat_id)
+                                                & t.c.message_id.in_(ids))
+        return set(conn.execute(query).scalars())
+
+    def commit_turns(self, turns):
+        with self.engine.begin() as conn:
+            for turn in turns:
+                self._write_turn(conn, turn)
+
+    def _write_turn(self, conn, turn):
+        username, active_tab, chat_id, at = turn["username"], turn["tab"], turn["chat_id"], turn["at"]
+        s = sessions_table
+        ids = _ids(turn)
+        # Messages written by an earlier attempt of the same job (or of the
+        # same keyed turn) are not written again
+        existing = self._existing_ids(conn, username, active_tab, chat_id, ids)
+        new = [(e, mid) for e, mid in zip(turn["messages"], ids) if mid not in existing]
+        if not new:
+            return
+        conn.execute(sa.insert(messages_table), [{
+            "username": username, "tab": active_tab, "chat_id": chat_id, "message_id": mid,
+            "role": e["role"], "content": e["content"], "timestamp": e["timestamp"],
+            "partial": bool(e.get("partial")), "file_hash": e.get("file_hash")
+        } for e, mid in new])
+
+        t = active_sessions_table
+        conn.execute(sa.delete(t).where(self._where(t, username, active_tab)))
+        conn.execute(sa.insert(t).values(username=username, tab=active_tab, chat_id=chat_id, timestamp=at))
+
+        values = {c: getattr(s.c, c) + turn["usage"].get(k, 0) for k, c in USAGE_COLUMNS.items()}
+        values["message_count"]   = s.c.message_count + len(new)
+        values["last_message_at"] = turn["session"]["last_message_at"]
+        if turn["session"].get("title"):
+            values["title"] = sa.func.coalesce(s.c.title, turn["session"]["title"])
+        updated = conn.execute(sa.update(s).where(self._where(s, username, active_tab, chat_id)).values(values))
+        if updated.rowcount == 0:
+            conn.execute(sa.insert(s).values(
+                username=username, tab=active_tab, chat_id=chat_id,
+                title=turn["session"].get("title"),
+                created_at=turn["session"].get("created_at", at),
+                last_message_at=turn["session"]["last_message_at"],
+                message_count=len(new),
+                **{c: turn["usage"].get(k, 0) for k, c in USAGE_COLUMNS.items()}
+            ))
+
+        u = users_table
+        values = {c: getattr(u.c, c) + turn["usage"].get(k, 0) for k, c in USAGE_COLUMNS.items()}
+        conn.execute(sa.update(u).where(u.c.username == username).values(dict(values, last_turn_at=at)))
+
+    # Rolling summaries
+    def get_summary(self, username, active_tab, chat_id):
+        t = summaries_table
+        with self.engine.connect() as conn:
+            row = conn.execute(sa.select(t.c.content, t.c.covered_until, t.c.covered_count, t.c.updated_at)
+                               .where(self._where(t, username, active_tab, chat_id))).mappings().first()
+        return dict(row) if row else {}
+
+    def set_summary(self, username, active_tab, chat_id, summary):
+        t = summaries_table
+        with self.engine.begin() as conn:
+            conn.execute(sa.delete(t).where(self._where(t, username, active_tab, chat_id)))
+            conn.execute(sa.insert(t).values(username=username, tab=active_tab, chat_id=chat_id, **summary))
+
+    # Uploaded files
+    def get_file(self, username, digest):
+        t = files_table
+        with self.engine.connect() as conn:
+            row = conn.execute(sa.select(t).where((t.c.username == username) & (t.c.digest == digest))) \
+                      .mappings().first()
+        if row is None:
+            return None
+        return {k: row[k] for k in ("kind", "chars", "chunks", "preview", "created_at", "last_used_at")}
+
+    def put_file(self, username, digest, stored):
+        t = files_table
+        with self.engine.begin() as conn:
+            conn.execute(sa.delete(t).where((t.c.username == username) & (t.c.digest == digest)))
+            conn.execute(sa.insert(t).values(username=username, digest=digest, **stored))
+
+    def touch_file(self, username, digest, at):
+        t = files_table
+        with self.engine.begin() as conn:
+            conn.execute(sa.update(t).where((t.c.username == username) & (t.c.digest == digest))
+                         .values(last_used_at=at))
+
+    def evict_files(self, username, keep):
+        """
+        Drop all but the `keep` most recently used files, never one that a
+        session still references; returns their digests.
+        """
+        t, sf = files_table, session_files_table
+        with self.engine.begin() as conn:
+            stale = conn.execute(sa.select(t.c.digest).where(t.c.username == username)
+                                 .order_by(t.c.last_used_at.desc()).offset(keep)).scalars().all()
+            if stale:
+                referenced = set(conn.execute(sa.select(sf.c.digest).where(sf.c.username == username)).scalars())
+                stale = [digest for digest in stale if digest not in referenced]
+            if stale:
+                conn.execute(sa.delete(t).where((t.c.username == username) & t.c.digest.in_(stale)))
+        return stale
+
+    def session_files(self, username, active_tab, chat_id):
+        t = session_files_table
+        with self.engine.connect() as conn:
+            rows = conn.execute(sa.select(t.c.digest, t.c.name)
+                                .where(self._where(t, username, active_tab, chat_id))
+                                .order_by(t.c.created_at)).all()
+        return [(digest, name) for digest, name in rows]
+
+    def attach_file(self, username, active_tab, chat_id, digest, name, at):
+        t = session_files_table
+        with self.engine.begin() as conn:
+            conn.execute(sa.delete(t).where(self._where(t, username, active_tab, chat_id) & (t.c.digest == digest)))
+            conn.execute(sa.insert(t).values(username=username, tab=active_tab, chat_id=chat_id,
+                                             digest=digest, name=name, created_at=at))
+
+    # Deletion: one transaction; `parallelism` only matters for Firestore
+    def _delete(self, tables, progress, **scope):
+        deleted = 0
+        with self.engine.begin() as conn:
+            for t in tables:
+                deleted += conn.execute(sa.delete(t).where(self._where(t, **scope))).rowcount
+        if progress:
+            progress(deleted)
+        return deleted
+
+    def delete_session(self, username, active_tab, chat_id, parallelism=8, progress=None):
+        return self._delete((messages_table, summaries_table, session_files_table, sessions_table),
+                            progress, username=username, active_tab=active_tab, chat_id=chat_id)
+
+    def delete_tab(self, username, active_tab, parallelism=8, progress=None):
+        return self._delete((messages_table, summaries_table, session_files_table, sessions_table,
+                             active_sessions_table),
+                            progress, username=username, active_tab=active_tab)
+
+    def delete_user(self, username, parallelism=8, progress=None):
+        return self._delete((messages_table, summaries_table, session_files_table, sessions_table,
+                             active_sessions_table, files_table, users_table),
+                            progress, username=username)
+
+    # Background job status; expired rows are dropped as new ones are written
+    def put_job(self, job_id, job):
+        t = jobs_table
+        with self.engine.begin() as conn:
+            conn.execute(sa.delete(t).where((t.c.job_id == job_id) | (t.c.expires_at < datetime.utcnow().isoformat())))
+            conn.execute(sa.insert(t).values(job_id=job_id, data=job, expires_at=job["expires_at"]))
+
+    def get_job(self, job_id):
+        with self.engine.connect() as conn:
+            return conn.execute(sa.select(jobs_table.c.data).where(jobs_table.c.job_id == job_id)).scalar()
+
+    # Idempotency keys; the primary key makes the claim create-if-absent
+    def claim_idempotency_key(self, key, record, now):
+        t = idempotency_table
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(sa.delete(t).where((t.c.request_key == key) & (t.c.expires_at <= now)))
+                conn.execute(sa.insert(t).values(request_key=key, data=record, expires_at=record["expires_at"]))
+            return None
+        except sa.exc.IntegrityError:
+            with self.engine.connect() as conn:
+                # {} when the holder let go in between; the caller asks again
+                return conn.execute(sa.select(t.c.data).where(t.c.request_key == key)).scalar() or {}
+
+    def put_idempotency_key(self, key, record):
+        t = idempotency_table
+        with self.engine.begin() as conn:
+            conn.execute(sa.delete(t).where((t.c.request_key == key)
+                                            | (t.c.expires_at < datetime.utcnow().isoformat())))
+            conn.execute(sa.insert(t).values(request_key=key, data=record, expires_at=record["expires_at"]))
+
+    def delete_idempotency_key(self, key):
+        with self.engine.begin() as conn:
+            conn.execute(sa.delete(idempotency_table).where(idempotency_table.c.request_key == key))
+
+    # Export and import
+    def export_sessions(self, username, active_tab, page_size=500):
+        t = sessions_table
+        cursor = None
+        while True:
+            query = sa.select(t).where(self._where(t, username, active_tab)).order_by(t.c.chat_id).limit(page_size)
+            if cursor is not None:
+                query = query.where(t.c.chat_id > cursor)
+            with self.engine.connect() as conn:
+                rows = conn.execute(query).mappings().all()
+            for row in rows:
+                yield _session(row["chat_id"], row)
+            if len(rows) < page_size:
+                return
+            cursor = rows[-1]["chat_id"]
+
+    def export_messages(self, username, active_tab, chat_id, page_size=500):
+        t = messages_table
+        cursor = None
+        while True:
+            query = sa.select(t.c.id, t.c.role, t.c.content, t.c.timestamp, t.c.partial, t.c.file_hash) \
+                .where(self._where(t, username, active_tab, chat_id)) \
+                .order_by(t.c.timestamp, t.c.id).limit(page_size)
+            if cursor is not None:
+                timestamp, last_id = cursor
+                query = query.where((t.c.timestamp > timestamp)
+                                    | ((t.c.timestamp == timestamp) & (t.c.id > last_id)))
+            with self.engine.connect() as conn:
+                rows = conn.execute(query).mappings().all()
+            for row in rows:
+                yield _archived(row)
+            if len(rows) < page_size:
+                return
+            cursor = (rows[-1]["timestamp"], rows[-1]["id"])
+
+    def import_records(self, username, records):
+        s = sessions_table
+        counts   = Counter()
+        written  = Counter()
+        messages = []
+        with self.engine.begin() as conn:
+            for r in records:
+                active_tab, chat_id = r["tab"], r["chat_id"]
+                if r["type"] == "session":
+                    where  = self._where(s, username, active_tab, chat_id)
+                    fields = {k: r[k] for k in ("title", "created_at", "last_message_at") if r.get(k)}
+                    if conn.execute(sa.select(s.c.chat_id).where(where)).first() is None:
+                        fields.setdefault("created_at", r.get("last_message_at") or "")
+                        conn.execute(sa.insert(s).values(dict(fields, username=username, tab=active_tab, chat_id=chat_id)))
+                    elif fields:
+                        conn.execute(sa.update(s).where(where).values(fields))
+                elif r["type"] == "message":
+                    messages.append(dict(_archived(r), username=username, tab=active_tab, chat_id=chat_id,
+                                         message_id=message_id(active_tab, chat_id, r),
+                                         partial=bool(r.get("partial")), file_hash=r.get("file_hash")))
+                elif r["type"] == "summary":
+                    t = summaries_table
+                    conn.execute(sa.delete(t).where(self._where(t, username, active_tab, chat_id)))
+                    conn.execute(sa.insert(t).values(username=username, tab=active_tab, chat_id=chat_id,
+                                                     **_summary_fields(r)))
+                elif r["type"] == "active":
+                    t = active_sessions_table
+                    conn.execute(sa.delete(t).where(self._where(t, username, active_tab)))
+                    conn.execute(sa.insert(t).values(username=username, tab=active_tab, chat_id=chat_id,
+                                                     timestamp=r.get("timestamp")))
+                if r["type"] != "message":
+                    written[r["type"]] += 1
+
+            # Messages already stored (an archive imported twice) are skipped
+            new = []
+            for (active_tab, chat_id), group in _grouped(messages).items():
+                seen = self._existing_ids(conn, username, active_tab, chat_id, [m["message_id"] for m in group])
+                for m in group:
+                    if m["message_id"] in seen:
+                        written["duplicate"] += 1
+                        continue
+                    seen.add(m["message_id"])
+                    new.append(m)
+                    counts[active_tab, chat_id] += 1
+            messages = new
+            written["message"] += len(messages)
+            if messages:
+                conn.execute(sa.insert(messages_table), messages)
+            for (active_tab, chat_id), n in counts.items():
+                where  = self._where(s, username, active_tab, chat_id)
+                stamps = [m["timestamp"] for m in messages if (m["tab"], m["chat_id"]) == (active_tab, chat_id)]
+                updated = conn.execute(sa.update(s).where(where).values(message_count=s.c.message_count + n))
+                if updated.rowcount == 0:
+                    # Messages without a session record: index them under their own dates
+                    conn.execute(sa.insert(s).values(
+                        username=username, tab=active_tab, chat_id=chat_id, message_count=n,
+                        created_at=min(stamps), last_message_at=max(stamps)))
+                else:
+                    # A session record without any dates
+                    conn.execute(sa.update(s).where(where & (s.c.created_at == "")).values(
+                        created_at=min(stamps), last_message_at=sa.func.coalesce(s.c.last_message_at, max(stamps))))
+        return written
@@ -0,0 +1,87 @@
+import logging
+import queue
+import threading
+
+from context import count_tokens, truncate_tokens
+
+logger = logging.getLogger("chat-service")
+
+SUMMARY_INSTRUCTION = (
+    "You maintain a running summary of a conversation between a user and an "
+    "assistant. Update the current summary with the new messages. Keep every "
+    "fact, decision, name, number, preference and open question the assistant "
+    "will need later; drop greetings and filler. Answer with the updated "
+    "summary only, as compact bullet points."
+)
+
+
+def _transcript_chunks(messages, chunk_tokens, message_token_limit):
+    """Split messages into transcripts of roughly `chunk_tokens` tokens."""
+    chunk, size = [], 0
+    for m in messages:
+        line = f"{m['role'].upper()}: {truncate_tokens(m['content'], message_token_limit)}"
+        cost = count_tokens(line)
+        if chunk and size + cost > chunk_tokens:
+            yield "\n\n".join(chunk)
+            chunk, size = [], 0
+        chunk.append(line)
+        size += cost
+    if chunk:
+        yield "\n\n".join(chunk)
+
+
+def fold_summary(previous, messages, complete, chunk_tokens=3000,
+                 message_token_limit=1000, max_tokens=600):
+    """
+    Fold `messages` into the `previous` summary text and return the result.
+
+    Only the new messages are sent, a chunk at a time, so the cost of each
+    update is proportional to what was added since the last one.
+    """
+    summary = previous
+    for transcript in _transcript_chunks(messages, chunk_tokens, message_token_limit):
+        summary = complete([
+            {"role": "system", "content": SUMMARY_INSTRUCTION},
+            {"role": "user", "content": f"Current summary:\n{summary or '(none yet)'}"
+                                        f"\n\nNew messages:\n{transcript}"}
+        ], max_tokens=max_tokens, temperature=0.2)
+    return summary
+
+
+class CompactionWorker:
+    """
+    Background thread that runs `compact(key)` for sessions that asked for
+    it. A session already waiting in the queue is not queued twice.
+    """
+
+    def __init__(self, compact):
+        self._compact = compact
+        self._queue   = queue.Queue()
+        self._queued  = set()
+        self._lock    = threading.Lock()
+        self._thread  = None
+
+    def request(self, key):
+        with self._lock:
+            if key in self._queued:
+                return
+            self._queued.add(key)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="compaction", daemon=True)
+                self._thread.start()
+        self._queue.put(key)
+
+    def pending(self):
+        with self._lock:
+            return len(self._queued)
+
+    def _run(self):
+        while True:
+            key = self._queue.get()
+            with self._lock:
+                # Let turns that land during compaction re-queue the session
+                self._queued.discard(key)
+            try:
+                self._compact(key)
+            except Exception as e:
+                logger.error(f"Compaction error for {key}: {e}")
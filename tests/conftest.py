@@ -0,0 +1,84 @@
+"""
+Tests run against the SQL store on an in-memory SQLite database and the
+fake model backend, so they need neither Firestore nor OpenAI:
+
+    python -m pytest -q
+"""
+import itertools
+import json
+import os
+import sys
+
+os.environ.update(
+    STORAGE_BACKEND="sql",
+    DATABASE_URL="sqlite://",
+    LLM_BACKEND="fake",
+    FAKE_LLM_LATENCY="0",
+    FAKE_LLM_TOKEN_DELAY="0",
+    IMPORT_BATCH_SIZE="4",
+    EXPORT_PAGE_SIZE="3"
+)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+TAB    = "Rainmaker"
+STREAM = {"Accept": "text/event-stream"}
+
+_users = itertools.count()
+
+
+@pytest.fixture(scope="session")
+def app_module():
+    import main
+    return main
+
+
+@pytest.fixture
+def store(app_module):
+    return app_module.store.get()
+
+
+@pytest.fixture
+def login(app_module):
+    """`login()` signs up a fresh user and returns `(username, client)`."""
+    def login(username=None):
+        username = username or f"user{next(_users)}"
+        client = app_module.app.test_client()
+        client.environ_base["wsgi.url_scheme"] = "https"
+        client.post("/signup", data={"username": username, "password": "pw", "confirm_password": "pw"})
+        client.post("/", data={"username": username, "password": "pw"})
+        return username, client
+    return login
+
+
+def make_turn(username, tab, chat_id, *contents, at="2024-01-01T00:00:00"):
+    """A store turn dict with one message per content, alternating user/assistant."""
+    messages = [{"role": ("user", "assistant")[i % 2], "content": c, "timestamp": f"{at}.{i:06d}"}
+                for i, c in enumerate(contents)]
+    return {
+        "username": username,
+        "tab":      tab,
+        "chat_id":  chat_id,
+        "messages": messages,
+        "session":  {"last_message_at": messages[-1]["timestamp"], "created_at": at},
+        "usage":    {"turns": 1, "prompt_tokens": 10, "completion_tokens": 5},
+        "at":       at
+    }
+
+
+def chat(app_module, client, message, chat_id, tab=TAB):
+    """POST one /chat turn, check it succeeded and wait for it to be stored."""
+    response = client.post("/chat", json={"message": message, "tab": tab, "chat_id": chat_id})
+    assert response.status_code == 200, response.get_data(as_text=True)
+    app_module.write_queue.flush()
+    return response
+
+
+def events(body):
+    """`(event, data)` pairs of a Server-Sent Events body."""
+    parsed = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        parsed.append((fields["event"], json.loads(fields["data"])))
+    return parsed
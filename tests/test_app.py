@@ -0,0 +1,48 @@
+import pytest
+
+from conftest import TAB, chat
+from storage import StorageUnavailable
+
+
+def test_chat_round_trip(app_module, login):
+    _, client = login()
+    reply = chat(app_module, client, "hello there", "c1").json
+    assert "hello there" in reply["reply"]
+    history = client.get(f"/history/{TAB}/c1").json
+    assert [m["role"] for m in history] == ["user", "assistant"]
+
+
+def test_firestore_failure_is_unavailable_unless_fallback(app_module, monkeypatch):
+    def broken():
+        raise RuntimeError("no credentials")
+    monkeypatch.setattr(app_module, "STORAGE_BACKEND", "firestore")
+    monkeypatch.setattr(app_module, "open_firestore", broken)
+    with pytest.raises(StorageUnavailable):
+        app_module.open_store()
+    monkeypatch.setattr(app_module, "STORAGE_FALLBACK", "sql")
+    assert app_module.open_store().name == "sql"
+
+
+def test_requests_get_503_while_storage_is_down(app_module, login, monkeypatch):
+    _, client = login()
+
+    def unavailable():
+        raise StorageUnavailable("down")
+    monkeypatch.setattr(app_module.store, "get", unavailable)
+    response = client.get(f"/sessions/{TAB}")
+    assert response.status_code == 503 and response.headers["Retry-After"]
+    assert client.get("/healthz").status_code == 503
+
+
+def test_failed_json_turns_keep_the_message(app_module, login, store, monkeypatch):
+    username, client = login()
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("upstream down")
+    monkeypatch.setattr(app_module, "complete_chat", fail)
+    response = client.post("/chat", json={"message": "are you there?", "tab": "Rainmaker", "chat_id": "down"})
+    assert response.status_code == 500
+    response = client.post("/chat_with_file", data={"message": "and now?", "tab": "Rainmaker", "chat_id": "down"})
+    assert response.status_code == 500
+    app_module.write_queue.flush()
+    assert [m["content"] for m in store.messages(username, "Rainmaker", "down")] == ["are you there?", "and now?"]
@@ -0,0 +1,56 @@
+import gzip
+import json
+from collections import Counter
+
+from conftest import TAB, chat
+
+
+def test_export_import_round_trip(app_module, login):
+    _, alice = login()
+    for i in range(4):
+        chat(app_module, alice, f"note {i} ✓", f"c{i % 2}")
+    archive = alice.get("/export?gzip=1").get_data()
+    records = [json.loads(line) for line in gzip.decompress(archive).splitlines()]
+    assert records[0]["type"] == "export" and records[-1] == {"type": "end", "sessions": 2, "messages": 8}
+
+    _, bob = login()
+    imported = bob.post("/import", data=archive).json
+    assert imported["status"] == "ok" and imported["imported"]["message"] == 8
+
+    strip = lambda body: [{k: v for k, v in json.loads(line).items() if k not in ("username", "exported_at")}
+                          for line in body.splitlines()]
+    assert strip(bob.get("/export").get_data()) == strip(gzip.decompress(archive))
+
+
+def test_import_twice_adds_nothing(app_module, login):
+    _, alice = login()
+    for i in range(3):
+        chat(app_module, alice, f"hi {i}", "c1")
+    archive = alice.get("/export").get_data()
+
+    _, bob = login()
+    assert bob.post("/import", data=archive).json["imported"]["message"] == 6
+    again = bob.post("/import", data=archive).json["imported"]
+    assert again["message"] == 0 and again["duplicate"] == 6
+    assert len(bob.get(f"/history/{TAB}/c1").json) == 6
+    assert bob.get(f"/sessions/{TAB}").json["sessions"][0]["message_count"] == 6
+
+    # The exporting account already holds every message
+    assert alice.post("/import", data=archive).json["imported"]["duplicate"] == 6
+
+
+def test_bad_import_line_is_rejected(login):
+    _, client = login()
+    response = client.post("/import", data=b'{"type":"message","tab":"Nope","chat_id":"x"}\n')
+    assert response.status_code == 400
+
+
+def test_import_batches_count_session_writes(app_module, store, monkeypatch):
+    batches = []
+    monkeypatch.setattr(app_module.store, "import_records", lambda username, batch: batches.append(batch) or {})
+    records = [{"type": "message", "tab": TAB, "chat_id": f"c{i}", "role": "user",
+                "content": "hi", "timestamp": "2024-01-01T00:00:00"} for i in range(5)]
+    app_module.import_records("someone", records, Counter())
+    for batch in batches:
+        assert len(batch) + len({(r["tab"], r["chat_id"]) for r in batch}) <= app_module.IMPORT_BATCH_SIZE
+    assert sum(batches, []) == records
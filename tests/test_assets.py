@@ -0,0 +1,48 @@
+import json
+
+import pytest
+
+from assets import IMMUTABLE, AssetManifest
+
+
+@pytest.fixture
+def built(tmp_path):
+    manifest = {"assets": {
+        "chat.js":  {"file": "chat.0123456789.js", "encodings": ["br", "gzip"]},
+        "logo.png": {"file": "logo.abcdef0123.png", "variants": {"webp": [[320, "logo.abcdef0123-320.webp"]]}}
+    }}
+    (tmp_path / "manifest.json").write_text(json.dumps(manifest))
+    (tmp_path / "chat.0123456789.js").write_text("console.log(1)")
+    (tmp_path / "chat.0123456789.js.gz").write_bytes(b"gzipped")
+    (tmp_path / "chat.0123456789.js.br").write_bytes(b"brotli")
+    return AssetManifest(str(tmp_path))
+
+
+def test_resolve_prefers_an_accepted_precompressed_copy(built):
+    assert built.resolve("chat.0123456789.js", "gzip, deflate, br") == ("chat.0123456789.js.br", "br")
+    assert built.resolve("chat.0123456789.js", "gzip") == ("chat.0123456789.js.gz", "gzip")
+    assert built.resolve("chat.0123456789.js", "br;q=0, gzip") == ("chat.0123456789.js.gz", "gzip")
+    assert built.resolve("chat.0123456789.js", None) == ("chat.0123456789.js", None)
+
+
+def test_resolve_only_serves_build_outputs(built):
+    assert built.resolve("logo.abcdef0123-320.webp", "br") == ("logo.abcdef0123-320.webp", None)
+    assert built.resolve("chat.js", "br") is None
+    assert built.resolve("../main.py", "") is None
+
+
+def test_urls_fall_back_to_static_files_without_a_manifest(built, tmp_path):
+    assert built.url("chat.js", lambda n: f"/static/{n}") == "/assets/chat.0123456789.js"
+    assert built.srcset("logo.png", "webp") == "/assets/logo.abcdef0123-320.webp 320w"
+    bare = AssetManifest(str(tmp_path / "missing"))
+    assert bare.url("chat.js", lambda n: f"/static/{n}") == "/static/chat.js"
+
+
+def test_assets_are_served_immutable(app_module, built, monkeypatch):
+    monkeypatch.setattr(app_module, "assets", built)
+    client = app_module.app.test_client()
+    response = client.get("/assets/chat.0123456789.js", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200 and response.data == b"gzipped"
+    assert response.headers["Content-Encoding"] == "gzip" and response.headers["Vary"] == "Accept-Encoding"
+    assert response.headers["Cache-Control"] == IMMUTABLE
+    assert client.get("/assets/manifest.json").status_code == 404
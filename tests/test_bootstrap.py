@@ -0,0 +1,31 @@
+import json
+import re
+
+from conftest import TAB, chat
+
+
+def test_bootstrap_resumes_the_active_session(app_module, login):
+    _, client = login()
+    chat(app_module, client, "older", "c1")
+    chat(app_module, client, "newest", "c2")
+    tab = client.get(f"/bootstrap/{TAB}").json["tabs"][TAB]
+    assert tab["chat_id"] == "c2"
+    assert [s["chat_id"] for s in tab["sessions"]] == ["c2", "c1"] and tab["next_cursor"] is None
+    assert [m["content"] for m in tab["history"]][0] == "newest"
+    assert tab["more_history"] is False
+
+
+def test_prefetch_covers_every_tab(app_module, login):
+    _, client = login()
+    tabs = client.get(f"/bootstrap/{TAB}?prefetch=1").json["tabs"]
+    assert set(tabs) == set(app_module.bot_tabs)
+    assert all(t["chat_id"] is None and t["history"] == [] for t in tabs.values())
+
+
+def test_the_chat_page_inlines_the_first_tab(app_module, login):
+    _, client = login()
+    chat(app_module, client, "hi", "c1")
+    page = client.get("/chat").get_data(as_text=True)
+    inlined = re.search(r'<script id="bootstrap-data" type="application/json">(.*?)</script>', page, re.S)
+    tabs = json.loads(inlined.group(1))["tabs"]
+    assert tabs[app_module.bot_tabs[0]]["chat_id"] == "c1"
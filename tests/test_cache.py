@@ -0,0 +1,83 @@
+import time
+
+from cache import MemoryBackend, ResponseCache, SQLiteBackend, TTLCache
+
+
+def test_get_set_and_lru_eviction():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.evictions == 1
+
+
+def test_entries_expire():
+    cache = TTLCache(maxsize=2, ttl=0.01)
+    cache.set("a", 1)
+    time.sleep(0.02)
+    assert cache.get("a") is None
+
+
+def test_fill_after_reserve_stores_value():
+    cache = TTLCache()
+    token = cache.reserve("k")
+    assert cache.fill("k", [1], token)
+    assert cache.get("k") == [1]
+
+
+def test_update_cancels_a_reservation():
+    cache = TTLCache()
+    token = cache.reserve("k")
+    cache.update("k", lambda v: v + [2])
+    assert not cache.fill("k", [1], token)
+    assert cache.get("k") is None
+
+
+def test_pop_cancels_a_reservation():
+    cache = TTLCache()
+    token = cache.reserve("k")
+    cache.pop("k")
+    assert not cache.fill("k", [1], token)
+
+
+def test_update_is_a_noop_when_not_cached():
+    cache = TTLCache()
+    assert not cache.update("k", lambda v: v + [1])
+    cache.set("k", [0])
+    assert cache.update("k", lambda v: v + [1])
+    assert cache.get("k") == [0, 1]
+
+
+def prompt(*contents):
+    return [{"role": "user", "content": c} for c in contents]
+
+
+def test_response_keys_ignore_case_and_spacing():
+    key = ResponseCache.key("m", "tab", "system", prompt("What is  ACME's\nrevenue?"))
+    assert key == ResponseCache.key("m", "tab", "system", prompt("what is acme's revenue?"))
+    assert key != ResponseCache.key("other-model", "tab", "system", prompt("what is acme's revenue?"))
+    assert key != ResponseCache.key("m", "other tab", "system", prompt("what is acme's revenue?"))
+    assert key != ResponseCache.key("m", "tab", "system", prompt("earlier", "what is acme's revenue?"))
+
+
+def test_only_listed_tabs_are_cached():
+    cache = ResponseCache(MemoryBackend(), tabs=["Rainmaker"])
+    cache.put("Insight-Magus", "k", "reply")
+    assert cache.get("Insight-Magus", "k") is None
+    assert cache.get("Rainmaker", "k") is None
+    cache.put("Rainmaker", "k", "reply")
+    assert cache.get("Rainmaker", "k") == "reply"
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1 and cache.stats()["stores"] == 1
+    assert ResponseCache(MemoryBackend(), tabs=["*"]).enabled("anything")
+
+
+def test_sqlite_backend_is_shared_and_expires(tmp_path):
+    path = str(tmp_path / "responses.sqlite3")
+    SQLiteBackend(path).set("k", "reply")
+    assert SQLiteBackend(path).get("k") == "reply"
+    short = SQLiteBackend(path, ttl=0)
+    short.set("gone", "reply")
+    assert short.get("gone") is None
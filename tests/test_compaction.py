@@ -0,0 +1,62 @@
+import threading
+
+from conftest import TAB
+from summarizer import CompactionWorker, fold_summary
+
+
+def history(n, at="2024-01-01T00:00:00"):
+    return [{"role": ("user", "assistant")[i % 2], "content": f"message {i}", "timestamp": f"{at}.{i:06d}"}
+            for i in range(n)]
+
+
+def test_fold_sends_only_new_messages_a_chunk_at_a_time():
+    calls = []
+
+    def complete(messages, **kwargs):
+        calls.append(messages[1]["content"])
+        return f"summary {len(calls)}"
+    assert fold_summary("earlier", history(6), complete, chunk_tokens=12) == f"summary {len(calls)}"
+    assert len(calls) > 1
+    assert calls[0].startswith("Current summary:\nearlier")
+    # Each chunk is folded into the summary the previous one produced
+    assert calls[1].startswith("Current summary:\nsummary 1")
+    assert all("message 0" not in c for c in calls[1:])
+
+
+def test_a_queued_session_is_compacted_once():
+    started, release, done = threading.Event(), threading.Event(), threading.Event()
+    compacted = []
+
+    def compact(key):
+        compacted.append(key)
+        if key == "a":
+            started.set()
+            release.wait(5)
+        if key == "b":
+            done.set()
+    worker = CompactionWorker(compact)
+    worker.request("a")
+    assert started.wait(5)
+    worker.request("b")
+    worker.request("b")
+    assert worker.pending() == 1
+    release.set()
+    assert done.wait(5)
+    assert compacted == ["a", "b"]
+
+
+def test_compaction_folds_all_but_the_recent_tail(app_module, login, store):
+    username, _ = login()
+    turns = app_module.SUMMARY_KEEP_RECENT // 2 + 3
+    for i in range(turns):
+        app_module.save_turn(username, TAB, "long", [app_module.message_entry("user", f"q{i}")], f"a{i}")
+    app_module.write_queue.flush()
+
+    app_module.compact_session((username, TAB, "long"))
+    summary = store.get_summary(username, TAB, "long")
+    assert summary["content"] and summary["covered_count"] == 2 * turns - app_module.SUMMARY_KEEP_RECENT
+
+    messages, _ = app_module.build_prompt(username, TAB, "long", [app_module.message_entry("user", "next")])
+    assert any(m["content"].startswith("Summary of the earlier conversation") for m in messages)
+    assert not any(m["content"] == "q0" for m in messages)
+    assert messages[-1]["content"] == "next"
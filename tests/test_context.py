@@ -0,0 +1,38 @@
+from context import FILE_PREFIX, MESSAGE_OVERHEAD, build_context, count_tokens, truncate_tokens
+
+
+def history(*contents):
+    return [{"role": ("user", "assistant")[i % 2], "content": c} for i, c in enumerate(contents)]
+
+
+def test_keeps_the_newest_messages_that_fit():
+    messages, used = build_context(["system"], history("old " * 200, "middle", "newest"), 60, 1000)
+    assert [m["content"] for m in messages] == ["system", "middle", "newest"]
+    assert used == sum(count_tokens(m["content"]) + MESSAGE_OVERHEAD for m in messages)
+    assert used <= 60
+
+
+def test_newest_message_is_truncated_rather_than_dropped():
+    messages, used = build_context([], history("word " * 500), 50, 1000)
+    assert len(messages) == 1
+    assert "tokens omitted" in messages[0]["content"]
+    assert used <= 50 + MESSAGE_OVERHEAD
+
+
+def test_file_messages_are_cut_to_their_limit():
+    upload = FILE_PREFIX + "brief.txt]\n" + "fact " * 2000
+    messages, _ = build_context([], history(upload, "question"), 10000, 100)
+    assert count_tokens(messages[0]["content"]) <= 120
+    assert messages[0]["content"].startswith(FILE_PREFIX)
+
+
+def test_truncate_keeps_head_and_tail():
+    text = "start " + "x " * 1000 + " end"
+    short = truncate_tokens(text, 40)
+    assert short.startswith("start") and short.endswith("end")
+    assert truncate_tokens("short", 40) == "short"
+
+
+def test_empty_system_prompts_are_skipped():
+    messages, _ = build_context(["", None, "sys"], history("hi"), 100, 100)
+    assert [m["role"] for m in messages] == ["system", "user"]
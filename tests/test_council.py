@@ -0,0 +1,84 @@
+import threading
+from concurrent.futures import wait
+
+from conftest import STREAM, TAB, events
+
+OTHER = "Insight-Magus"
+
+
+def test_every_tab_answers_and_keeps_its_turn(app_module, login):
+    username, client = login()
+    response = client.post("/council", json={"message": "ask everyone", "tabs": [TAB, OTHER],
+                                             "chat_ids": {TAB: "c1"}})
+    assert response.status_code == 200
+    replies = response.get_json()["replies"]
+    assert set(replies) == {TAB, OTHER}
+    assert replies[TAB]["chat_id"] == "c1" and replies[OTHER]["chat_id"].startswith(f"{OTHER}_")
+    assert all(r["reply"] and r["context_tokens"] > 0 for r in replies.values())
+
+    app_module.write_queue.flush()
+    for tab, r in replies.items():
+        history = client.get(f"/history/{tab}/{r['chat_id']}").get_json()
+        assert [m["content"] for m in history] == ["ask everyone", r["reply"]]
+
+
+def test_council_streams_a_reply_per_tab(login):
+    username, client = login()
+    response = client.post("/council", json={"message": "hi", "tabs": [TAB, OTHER]}, headers=STREAM)
+    assert response.mimetype == "text/event-stream"
+    sent = events(response.get_data(as_text=True))
+    response.close()
+    assert sent[0][0] == "start" and set(sent[0][1]["members"]) == {TAB, OTHER}
+    assert sorted(d["tab"] for e, d in sent[1:-1] if e == "reply") == sorted([TAB, OTHER])
+    assert sent[-1][0] == "done" and set(sent[-1][1]["replies"]) == {TAB, OTHER}
+
+
+def test_unknown_tabs_are_rejected(login):
+    username, client = login()
+    response = client.post("/council", json={"message": "hi", "tabs": [TAB, "Nobody"]})
+    assert response.status_code == 400 and "Nobody" in response.get_json()["error"]
+
+
+def test_idempotency_keys_are_per_endpoint(login):
+    username, client = login()
+    headers = {"Idempotency-Key": "shared"}
+    chat = client.post("/chat", json={"message": "hi", "tab": "Rainmaker"}, headers=headers)
+    assert chat.status_code == 200
+    council = client.post("/council", json={"message": "hi", "tabs": ["Rainmaker"]}, headers=headers)
+    assert council.status_code == 200
+    assert "Idempotent-Replayed" not in council.headers
+    assert set(council.get_json()["replies"]) == {"Rainmaker"}
+
+
+def test_a_council_key_does_not_answer_chat(login):
+    username, client = login()
+    headers = {"Idempotency-Key": "shared"}
+    assert client.post("/council", json={"message": "hi", "tabs": ["Rainmaker"]}, headers=headers).status_code == 200
+    chat = client.post("/chat", json={"message": "hi", "tab": "Rainmaker"}, headers=headers)
+    assert chat.status_code == 200
+    assert "reply" in chat.get_json()
+
+
+def test_prompts_are_built_while_model_calls_fill_the_pool(app_module, login):
+    username, _ = login()
+    release = threading.Event()
+    busy = [app_module.council_pool.submit(release.wait, 5) for _ in range(app_module.LLM_MAX_CONCURRENCY)]
+    members = []
+    try:
+        builder = threading.Thread(target=lambda: members.extend(
+            app_module.council_members(username, "hi", ["Rainmaker"], {})))
+        builder.start()
+        builder.join(5)
+        assert members and members[0]["messages"]
+    finally:
+        release.set()
+        wait(busy)
+
+
+def test_malformed_fields_are_rejected(login):
+    username, client = login()
+    for body in ({"message": "hi", "tabs": "Rainmaker"},
+                 {"message": "hi", "tabs": [["Rainmaker"]]},
+                 {"message": "hi", "chat_ids": ["Rainmaker_1"]},
+                 {"message": "hi", "chat_ids": {"Rainmaker": 1}}):
+        assert client.post("/council", json=body).status_code == 400, body
@@ -0,0 +1,29 @@
+import time
+
+from conftest import TAB, chat
+from deletion import DeletionJobs
+
+
+def test_deletion_status_is_shared_between_workers(app_module, login, store):
+    username, client = login()
+    chat(app_module, client, "bye", "c1")
+    accepted = client.get(f"/delete_chat/{TAB}/c1?async=1")
+    assert accepted.status_code == 202
+    job_id = accepted.json["job_id"]
+
+    other_worker = DeletionJobs(store)
+    for _ in range(100):
+        job = other_worker.get(job_id, username)
+        if job and job["status"] == "done":
+            break
+        time.sleep(0.01)
+    assert job["status"] == "done" and job["deleted"] > 0
+    assert other_worker.get(job_id, "someone-else") is None
+
+
+def test_synchronous_delete_removes_the_session(app_module, login):
+    _, client = login()
+    chat(app_module, client, "bye", "c1")
+    assert client.get(f"/delete_chat/{TAB}/c1").status_code == 200
+    assert client.get(f"/history/{TAB}/c1").json == []
+    assert client.get(f"/sessions/{TAB}").json["sessions"] == []
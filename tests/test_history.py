@@ -0,0 +1,43 @@
+from conftest import TAB, chat, make_turn
+
+
+def test_history_sees_turns_written_by_another_worker(app_module, login, store):
+    username, client = login()
+    chat(app_module, client, "first", "c1")
+    first = client.get(f"/history/{TAB}/c1")
+    assert len(first.json) == 2
+
+    # Another gunicorn worker answers a turn: it goes straight to the store
+    # and never touches this process's history cache
+    store.commit_turn(make_turn(username, TAB, "c1", "from", "elsewhere", at="2999-01-01T00:00:00"))
+
+    again = client.get(f"/history/{TAB}/c1", headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 200
+    assert [m["content"] for m in again.json][-2:] == ["from", "elsewhere"]
+    assert app_module.load_history(username, TAB, "c1")[-1]["content"] == "elsewhere"
+
+
+def test_turns_are_written_through_to_the_cache(app_module, login):
+    username, client = login()
+    chat(app_module, client, "hi", "c1")
+    cached = app_module.history_cache.get(app_module.session_key(username, TAB, "c1"))
+    assert [m["role"] for m in cached] == ["user", "assistant"]
+
+
+def test_unchanged_history_is_not_modified(app_module, login):
+    _, client = login()
+    chat(app_module, client, "hi", "c1")
+    first = client.get(f"/history/{TAB}/c1")
+    again = client.get(f"/history/{TAB}/c1", headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 304
+
+
+def test_delta_and_scroll_back(app_module, login):
+    _, client = login()
+    for i in range(3):
+        chat(app_module, client, f"q{i}", "c1")
+    newest = client.get(f"/history/{TAB}/c1?limit=2").json
+    assert [m["content"] for m in newest][0] == "q2"
+    older = client.get(f"/history/{TAB}/c1?before={newest[0]['timestamp']}&limit=2").json
+    assert [m["content"] for m in older][0] == "q1"
+    assert client.get(f"/history/{TAB}/c1?since={newest[-1]['timestamp']}").json == []
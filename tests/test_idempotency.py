@@ -0,0 +1,109 @@
+import threading
+
+import pytest
+
+from idempotency import IdempotencyStore, InProgress
+
+
+def test_finished_results_are_replayed():
+    store = IdempotencyStore()
+    claim = store.claim("k")
+    assert claim.leader
+    claim.finish({"reply": "hi"})
+    again = store.claim("k")
+    assert not again.leader and again.result == {"reply": "hi"}
+    assert store.replayed == 1
+
+
+def test_duplicates_wait_for_the_leader():
+    store = IdempotencyStore()
+    leader = store.claim("k")
+    results = []
+    follower = threading.Thread(target=lambda: results.append(store.claim("k", wait=5)))
+    follower.start()
+    leader.finish("done")
+    follower.join(5)
+    assert results[0].result == "done"
+
+
+def test_abandoned_claims_hand_over_leadership():
+    store = IdempotencyStore()
+    store.claim("k").abandon()
+    assert store.claim("k").leader
+
+
+def test_in_progress_after_the_wait():
+    store = IdempotencyStore()
+    store.claim("k")
+    with pytest.raises(InProgress):
+        store.claim("k", wait=0.01)
+
+
+def test_claims_are_shared_through_the_store(store):
+    worker_a = IdempotencyStore(store, poll=0.01)
+    worker_b = IdempotencyStore(store, poll=0.01)
+    claim = worker_a.claim("shared")
+    assert claim.leader
+    with pytest.raises(InProgress):
+        worker_b.claim("shared", wait=0.05)
+    claim.finish({"reply": "hi"})
+    again = worker_b.claim("shared")
+    assert not again.leader and again.result == {"reply": "hi"}
+
+
+def test_abandoned_shared_claims_run_again(store):
+    worker_a = IdempotencyStore(store)
+    worker_b = IdempotencyStore(store)
+    worker_a.claim("given-up").abandon()
+    assert worker_b.claim("given-up", wait=0.05).leader
+
+
+def test_expired_leases_are_taken_over(store):
+    worker_a = IdempotencyStore(store, lease=0)
+    worker_b = IdempotencyStore(store)
+    assert worker_a.claim("crashed").leader
+    assert worker_b.claim("crashed", wait=0.05).leader
+
+
+def test_keyed_chat_replays_on_another_worker(app_module, login, monkeypatch):
+    username, client = login()
+    headers = {"Idempotency-Key": "send-1"}
+    first = client.post("/chat", json={"message": "hello", "tab": "Rainmaker"}, headers=headers)
+    assert first.status_code == 200
+    # A fresh IdempotencyStore stands in for another worker's memory
+    monkeypatch.setattr(app_module, "idempotency", IdempotencyStore(app_module.store))
+    again = client.post("/chat", json={"message": "hello", "tab": "Rainmaker"}, headers=headers)
+    assert again.headers["Idempotent-Replayed"] == "true"
+    assert again.get_json()["reply"] == first.get_json()["reply"]
+
+
+def test_keyed_turns_write_once(app_module, login, store):
+    username, _ = login()
+    app_module.write_queue.flush()
+    for _ in range(2):
+        app_module.history_cache.pop(app_module.session_key(username, "Rainmaker", "keyed"))
+        app_module.save_turn(username, "Rainmaker", "keyed", [app_module.message_entry("user", "hi")],
+                             "hello", turn_key="key-1")
+        app_module.write_queue.flush()
+    assert [m["content"] for m in store.messages(username, "Rainmaker", "keyed")] == ["hi", "hello"]
+
+
+def test_a_keyed_retry_completes_a_partly_stored_turn(app_module, login, store):
+    username, _ = login()
+    entries = [app_module.message_entry("user", "hi")]
+    app_module.save_turn(username, "Rainmaker", "retried", entries, "hel", partial=True, turn_key="key-2")
+    app_module.save_turn(username, "Rainmaker", "retried", entries, "hello", turn_key="key-2")
+    app_module.write_queue.flush()
+    assert [m["content"] for m in store.messages(username, "Rainmaker", "retried")] == ["hi", "hel", "hello"]
+    assert store.list_sessions(username, "Rainmaker", 1)[0]["message_count"] == 3
+
+
+def test_a_duplicate_of_a_running_turn_gets_409(app_module, login, monkeypatch):
+    _, client = login()
+
+    def running(key, wait):
+        raise InProgress(retry_after=3)
+    monkeypatch.setattr(app_module.idempotency, "claim", running)
+    response = client.post("/chat", json={"message": "hi", "tab": "Rainmaker"}, headers={"Idempotency-Key": "k"})
+    assert response.status_code == 409 and response.headers["Retry-After"] == "3"
+    assert client.post("/chat", json={"message": "hi", "tab": "Rainmaker"}).status_code == 200
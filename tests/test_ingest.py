@@ -0,0 +1,67 @@
+import io
+import zipfile
+
+from werkzeug.datastructures import FileStorage
+
+from ingest import detect_kind, extract_text, normalize_whitespace
+
+WORD = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+DRAW = "http://schemas.openxmlformats.org/drawingml/2006/main"
+
+
+def upload(data, filename):
+    return FileStorage(stream=io.BytesIO(data), filename=filename)
+
+
+def ooxml(parts):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        for name, xml in parts.items():
+            zf.writestr(name, xml)
+    return buf.getvalue()
+
+
+def test_normalize_whitespace():
+    assert normalize_whitespace("  a \t b \r\n\r\n\r\n\n c  ") == "a b\n\nc"
+
+
+def test_detect_kind():
+    assert detect_kind(b"%PDF-1.7", "x.bin") == "pdf"
+    assert detect_kind(b"PK\x03\x04", "deck.pptx") == "pptx"
+    assert detect_kind(b"PK\x03\x04", "a.zip") == "zip"
+    assert detect_kind(b"\x00\x01", "a.bin") == "binary"
+    assert detect_kind(b"hello", "a.txt") == "text"
+
+
+def test_plain_text_stops_at_the_budget():
+    result = extract_text(upload(("line one\n" * 10000).encode(), "notes.txt"), 100)
+    assert result.kind == "text" and result.truncated
+    assert len(result.text) == 100
+
+
+def test_utf16_text():
+    result = extract_text(upload("héllo wörld".encode("utf-16"), "a.txt"), 1000)
+    assert result.text == "héllo wörld" and not result.truncated
+
+
+def test_docx():
+    document = (f'<w:document xmlns:w="{WORD}"><w:body>'
+                '<w:p><w:r><w:t>First</w:t><w:tab/><w:t>para</w:t></w:r></w:p>'
+                '<w:p><w:r><w:t>Second</w:t></w:r></w:p></w:body></w:document>')
+    result = extract_text(upload(ooxml({"word/document.xml": document}), "brief.docx"), 1000)
+    assert result.kind == "docx"
+    assert result.text == "First para\nSecond"
+
+
+def test_pptx_slides_in_order():
+    slide = lambda text: f'<p:sld xmlns:p="p" xmlns:a="{DRAW}"><a:p><a:r><a:t>{text}</a:t></a:r></a:p></p:sld>'
+    data = ooxml({"ppt/slides/slide10.xml": slide("ten"), "ppt/slides/slide2.xml": slide("two")})
+    result = extract_text(upload(data, "deck.pptx"), 1000)
+    assert result.kind == "pptx"
+    assert result.text.index("two") < result.text.index("ten")
+    assert "[Slide 2]" in result.text
+
+
+def test_corrupt_documents_do_not_raise():
+    result = extract_text(upload(b"PK\x03\x04 not really a zip", "broken.docx"), 1000)
+    assert result.text == ""
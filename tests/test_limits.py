@@ -0,0 +1,95 @@
+import pytest
+
+from limits import AdmissionControl, Saturated, TokenBucket
+
+
+def test_per_user_limit():
+    control = AdmissionControl(max_upstream=10, per_user=1, queue_wait=0)
+    permit = control.admit("alice", 10)
+    with pytest.raises(Saturated):
+        control.admit("alice", 10)
+    control.admit("bob", 10).release()
+    permit.release()
+    permit.release()                    # releasing twice is harmless
+    control.admit("alice", 10).release()
+    assert control.stats()["in_flight"] == 0
+    assert control.rejected["user"] == 1
+
+
+def test_upstream_slots():
+    control = AdmissionControl(max_upstream=2, per_user=0, queue_wait=0.01)
+    with control.admit("a", 1, calls=2):
+        with pytest.raises(Saturated) as e:
+            control.admit("b", 1)
+        assert e.value.retry_after == 1
+    control.admit("b", 1, calls=2).release()
+    assert control.rejected["upstream"] == 1
+
+
+def test_a_refused_multi_call_permit_gives_back_its_slots():
+    control = AdmissionControl(max_upstream=3, per_user=0, queue_wait=0.01)
+    held = control.admit("a", 1, calls=2)
+    with pytest.raises(Saturated):
+        control.admit("b", 1, calls=2)
+    held.release()
+    control.admit("b", 1, calls=3).release()
+
+
+def test_token_budget():
+    control = AdmissionControl(max_upstream=4, tokens_per_minute=600, per_user=0, queue_wait=0)
+    control.admit("a", 600).release()
+    with pytest.raises(Saturated) as e:
+        control.admit("a", 600)
+    assert e.value.retry_after >= 1
+    assert control.stats()["in_flight"] == 0
+
+
+def test_token_bucket_caps_requests_at_capacity():
+    bucket = TokenBucket(rate=1.0, capacity=5)
+    assert bucket.take(50) == 0.0       # larger than capacity: takes all of it
+    assert bucket.take(1) > 0
+
+
+def test_background_work_has_no_user_limit():
+    control = AdmissionControl(max_upstream=4, per_user=1, queue_wait=0)
+    held = [control.admit(None, 1) for _ in range(3)]
+    control.admit("alice", 1).release()
+    for permit in held:
+        permit.release()
+    assert control.stats()["in_flight"] == 0
+
+
+def saturate(app_module, monkeypatch):
+    def refuse(*args, **kwargs):
+        raise Saturated("Model capacity is saturated", 1)
+    monkeypatch.setattr(app_module.admission, "admit", refuse)
+
+
+def test_cached_replies_need_no_permit(app_module, login, monkeypatch):
+    monkeypatch.setattr(app_module.response_cache, "tabs", {"*"})
+    username, client = login()
+    body = {"message": "cache me", "tab": "Rainmaker"}
+    first = client.post("/chat", json=body)
+    saturate(app_module, monkeypatch)
+    again = client.post("/chat", json=body)
+    assert again.status_code == 200
+    assert again.get_json()["reply"] == first.get_json()["reply"]
+    assert client.post("/chat", json={"message": "not cached", "tab": "Rainmaker"}).status_code == 429
+
+
+def test_saturated_compaction_waits_for_a_later_turn(app_module, login, monkeypatch, store):
+    username, _ = login()
+    for i in range(app_module.SUMMARY_KEEP_RECENT + 4):
+        app_module.save_turn(username, "Rainmaker", "compact", [app_module.message_entry("user", f"q{i}")], f"a{i}")
+    saturate(app_module, monkeypatch)
+    app_module.compact_session((username, "Rainmaker", "compact"))
+    app_module.write_queue.flush()
+    assert not store.get_summary(username, "Rainmaker", "compact")
+
+
+def test_refused_chats_get_429_with_retry_after(app_module, login, monkeypatch):
+    _, client = login()
+    saturate(app_module, monkeypatch)
+    response = client.post("/chat", json={"message": "hi", "tab": "Rainmaker"})
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1" and response.json["retry_after"] == 1
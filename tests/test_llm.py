@@ -0,0 +1,95 @@
+import json
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+import llm
+from llm import LLMClient, LLMError, OpenAIBackend
+
+PROMPT = [{"role": "user", "content": "hi"}]
+
+
+def openai(*responses):
+    """OpenAIBackend answering each request with the next `(status, headers, body)`."""
+    replies = iter(responses)
+    requests = []
+
+    def handler(request):
+        requests.append(json.loads(request.content))
+        status, headers, body = next(replies)
+        return httpx.Response(status, headers=headers, content=body)
+    backend = OpenAIBackend("key")
+    backend._client = httpx.Client(base_url="https://llm.test/v1", transport=httpx.MockTransport(handler))
+    return backend, requests
+
+
+def completion(text):
+    return 200, {}, json.dumps({"choices": [{"message": {"content": text}}]})
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    # Only llm.py's clock: other threads keep the real time.sleep
+    slept = []
+    monkeypatch.setattr(llm, "time", SimpleNamespace(sleep=slept.append, monotonic=time.monotonic))
+    return slept
+
+
+def test_rate_limits_are_retried_after_retry_after(sleeps):
+    backend, requests = openai((429, {"Retry-After": "3"}, '{"error": {"message": "slow down"}}'),
+                               completion(" hello "))
+    client = LLMClient(backend, backoff=0.001)
+    assert client.complete(PROMPT) == "hello"
+    assert len(requests) == 2 and sleeps == [3.0]
+
+
+def test_client_errors_are_not_retried(sleeps):
+    backend, requests = openai((400, {}, '{"error": {"message": "bad request"}}'))
+    with pytest.raises(LLMError) as e:
+        LLMClient(backend).complete(PROMPT)
+    assert e.value.status == 400 and "bad request" in str(e.value)
+    assert len(requests) == 1 and sleeps == []
+
+
+def test_retries_give_up_after_max_retries(sleeps):
+    backend, requests = openai(*[(503, {}, "unavailable")] * 3)
+    with pytest.raises(LLMError):
+        LLMClient(backend, max_retries=2, backoff=0.001).complete(PROMPT)
+    assert len(requests) == 3
+
+
+def test_retry_after_accepts_http_dates():
+    later = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+    assert 25 < llm._retry_after({"retry-after": later}) <= 30
+    assert llm._retry_after({"retry-after": "soon"}) is None
+    assert llm._retry_after({}) is None
+
+
+def test_streams_are_retried_until_the_first_fragment(sleeps):
+    chunks = "".join(f'data: {json.dumps({"choices": [{"delta": {"content": w}}]})}\n\n' for w in ("a", "b"))
+    backend, requests = openai((502, {}, "bad gateway"), (200, {}, chunks + "data: [DONE]\n\n"))
+    assert "".join(LLMClient(backend, backoff=0.001).stream(PROMPT)) == "ab"
+    assert len(requests) == 2 and requests[1]["stream"] is True
+
+
+def test_a_slow_call_is_hedged():
+    calls = []
+    lock = threading.Lock()
+
+    class Backend:
+        def complete(self, messages, model, max_tokens, temperature, timeout):
+            with lock:
+                calls.append(1)
+                first = len(calls) == 1
+            if first:
+                time.sleep(1.0)
+                return "slow"
+            return "fast"
+    started = time.monotonic()
+    assert LLMClient(Backend(), hedge_after=0.05, hedge_workers=2).complete(PROMPT) == "fast"
+    assert time.monotonic() - started < 0.9 and len(calls) == 2
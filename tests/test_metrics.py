@@ -0,0 +1,40 @@
+import re
+
+from conftest import TAB
+from metrics import Histogram, server_timing
+
+
+def test_chat_responses_carry_server_timing(login):
+    _, client = login()
+    response = client.post("/chat", json={"message": "hi", "tab": TAB, "chat_id": "m1"})
+    stages = dict(re.findall(r"(\w+);dur=([\d.]+)", response.headers["Server-Timing"]))
+    assert {"prompt", "llm", "persist", "total"} <= set(stages)
+    assert float(stages["total"]) >= float(stages["llm"])
+
+
+def test_metrics_are_exposed_for_prometheus(login):
+    _, client = login()
+    client.post("/chat", json={"message": "hi", "tab": TAB, "chat_id": "m1"})
+    response = client.get("/metrics")
+    assert response.mimetype == "text/plain"
+    body = response.get_data(as_text=True)
+    assert 'http_request_duration_seconds_count{route="/chat",method="POST",status="200"}' in body
+    assert 'chat_stage_duration_seconds_bucket{stage="llm",le="+Inf"}' in body
+    assert re.search(r'storage_operations_total\{backend="sql",op="\w+",outcome="ok"\} \d+', body)
+    assert 'llm_tokens_total{kind="completion"}' in body
+    assert "process_startup_seconds" in body
+
+
+def test_histogram_buckets_are_cumulative():
+    h = Histogram("latency", "Latency.", ["route"], buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        h.observe(value, route="/x")
+    lines = h.render()
+    assert 'latency_bucket{route="/x",le="0.1"} 1' in lines
+    assert 'latency_bucket{route="/x",le="1.0"} 2' in lines
+    assert 'latency_bucket{route="/x",le="+Inf"} 3' in lines
+    assert 'latency_count{route="/x"} 3' in lines
+
+
+def test_server_timing_format():
+    assert server_timing([("llm", 0.25)], 0.3) == "llm;dur=250.0, total;dur=300.0"
@@ -0,0 +1,73 @@
+import io
+
+from retrieval import BM25Index, chunk_text, tokenize
+
+
+def test_chunks_cover_the_text_with_overlap():
+    text = " ".join(f"word{i}" for i in range(1000))
+    chunks = chunk_text(text, size=200, overlap=50)
+    assert all(len(c) <= 200 for c in chunks)
+    assert chunks[0].startswith("word0") and chunks[-1].endswith("word999")
+    # Consecutive chunks share words
+    assert set(chunks[0].split()) & set(chunks[1].split())
+
+
+def test_chunks_prefer_paragraph_breaks():
+    text = "a" * 150 + "\n\n" + "b" * 150
+    assert chunk_text(text, size=200, overlap=0)[0] == "a" * 150
+
+
+def test_short_and_empty_text():
+    assert chunk_text("", 100, 10) == []
+    assert chunk_text("tiny", 100, 10) == ["tiny"]
+
+
+def test_tokenize_drops_stopwords():
+    assert tokenize("What is the Revenue of ACME?") == ["revenue", "acme"]
+
+
+def test_search_ranks_matching_chunks_first():
+    chunks = [{"text": t, "source": "f", "position": i} for i, t in enumerate([
+        "pricing tiers and discounts",
+        "the revenue grew by ten percent in the second quarter",
+        "revenue revenue revenue forecast",
+        "team offsite agenda"
+    ])]
+    index = BM25Index(chunks)
+    hits = index.search("revenue forecast", k=2)
+    assert [h["position"] for h in hits] == [2, 1]
+    assert index.search("nothing matches", k=2) == []
+    assert index.search("the", k=2) == []
+
+
+def test_extended_returns_a_new_index():
+    index = BM25Index([{"text": "alpha", "source": "f", "position": 0}])
+    bigger = index.extended([{"text": "beta", "source": "g", "position": 0}])
+    assert len(index) == 1 and len(bigger) == 2
+    assert bigger.search("beta")[0]["source"] == "g"
+
+
+def test_warm_index_picks_up_files_attached_elsewhere(app_module, login, store):
+    username, _ = login()
+    assert not len(app_module.load_file_index(username, "Rainmaker", "files"))
+    # Another worker stores and attaches a file behind this worker's cache
+    at = "2024-01-01T00:00:00"
+    store.put_file(username, "d" * 64, {"kind": "text", "chars": 20, "chunks": ["quarterly revenue report"],
+                                        "preview": "quarterly revenue report", "created_at": at, "last_used_at": at})
+    store.attach_file(username, "Rainmaker", "files", "d" * 64, "report.txt", at)
+    index = app_module.load_file_index(username, "Rainmaker", "files")
+    assert [c["source"] for c in index.search("revenue", 1)] == ["report.txt"]
+
+
+def test_prompts_carry_only_the_matching_excerpts(app_module, login, monkeypatch):
+    username, client = login()
+    monkeypatch.setattr(app_module, "RETRIEVAL_TOP_K", 1)
+    paragraphs = ["Pricing tiers and discounts for partners."] * 3 + ["Churn rose among small customers."]
+    text = "\n\n".join(p + " " + "filler " * 60 for p in paragraphs)
+    client.post("/chat_with_file", data={"tab": "Rainmaker", "chat_id": "r1",
+                                         "file": (io.BytesIO(text.encode("utf-8")), "brief.txt")})
+    app_module.write_queue.flush()
+    messages, _ = app_module.build_prompt(username, "Rainmaker", "r1",
+                                          [app_module.message_entry("user", "why did churn rise?")])
+    [excerpts] = [m["content"] for m in messages if m["content"].startswith("Relevant excerpts")]
+    assert "Churn rose" in excerpts and "Pricing" not in excerpts
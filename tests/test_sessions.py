@@ -0,0 +1,29 @@
+import pytest
+
+from conftest import TAB, chat
+
+
+def test_sessions_paging(app_module, login):
+    _, client = login()
+    for i in range(3):
+        chat(app_module, client, f"hi {i}", f"c{i}")
+    seen, cursor = [], None
+    while True:
+        page = client.get(f"/sessions/{TAB}?limit=2" + (f"&cursor={cursor}" if cursor else "")).json
+        seen += [s["chat_id"] for s in page["sessions"]]
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    assert seen == ["c2", "c1", "c0"]
+
+
+@pytest.mark.parametrize("limit", [0, -5])
+def test_non_positive_limits_are_clamped(app_module, login, limit):
+    _, client = login()
+    for i in range(3):
+        chat(app_module, client, f"hi {i}", f"c{i}")
+    sessions = client.get(f"/sessions/{TAB}?limit={limit}")
+    assert sessions.status_code == 200
+    assert len(sessions.json["sessions"]) == 1 and sessions.json["next_cursor"]
+    history = client.get(f"/history/{TAB}/c0?limit={limit}")
+    assert history.status_code == 200 and len(history.json) == 1
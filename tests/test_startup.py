@@ -0,0 +1,44 @@
+import threading
+
+from startup import Lazy, StartupProfile
+
+
+def test_lazy_builds_once_on_first_use():
+    built   = []
+    profile = StartupProfile()
+    lazy    = Lazy("thing", lambda: built.append(1) or "built", profile)
+    assert not lazy.ready and built == []
+    threads = [threading.Thread(target=lazy.get) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert lazy.ready and built == [1]
+    assert lazy.upper() == "BUILT"
+    assert "init:thing" in profile.report()["phases"]
+
+
+def test_lazy_retries_after_a_failed_build():
+    attempts = []
+
+    def factory():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("backend down")
+        return "ok"
+
+    lazy = Lazy("flaky", factory)
+    try:
+        lazy.get()
+    except RuntimeError:
+        pass
+    assert not lazy.ready
+    assert lazy.get() == "ok" and len(attempts) == 2
+
+
+def test_warmup_hook_builds_clients_and_reports_phases(app_module):
+    response = app_module.app.test_client().get("/_ah/warmup")
+    assert response.status_code == 200
+    report = response.get_json()
+    assert "warmup" in report["phases"] and "init:storage" in report["phases"]
+    assert app_module.store.ready
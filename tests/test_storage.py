@@ -0,0 +1,124 @@
+import pytest
+
+from conftest import TAB, make_turn
+from storage import SQLStore, create_engine, message_id
+from write_queue import WriteBehindQueue
+
+
+@pytest.fixture
+def sql():
+    store = SQLStore(create_engine("sqlite://"))
+    store.create_user("alice", {"password": "x", "created_at": "2024-01-01T00:00:00"})
+    return store
+
+
+def test_commit_turn_writes_messages_session_and_usage(sql):
+    sql.commit_turn(make_turn("alice", TAB, "c1", "hi", "hello"))
+    assert [m["content"] for m in sql.messages("alice", TAB, "c1")] == ["hi", "hello"]
+    [session] = sql.list_sessions("alice", TAB, 10)
+    assert session["chat_id"] == "c1" and session["message_count"] == 2
+    assert sql.active_session("alice", TAB) == "c1"
+    assert sql.get_user("alice")["usage"] == {"turns": 1, "prompt_tokens": 10, "completion_tokens": 5}
+
+
+def test_retried_turn_is_not_duplicated(sql):
+    turn = make_turn("alice", TAB, "c1", "hi", "hello")
+    sql.commit_turn(turn)
+    sql.commit_turn(turn)
+    assert len(sql.messages("alice", TAB, "c1")) == 2
+    assert sql.list_sessions("alice", TAB, 10)[0]["message_count"] == 2
+    assert sql.get_user("alice")["usage"]["turns"] == 1
+
+
+def test_write_queue_retry_after_a_lost_commit_does_not_duplicate(sql):
+    # The commit lands but the job still fails (e.g. the ack was lost), so
+    # the queue runs it again
+    turn = make_turn("alice", TAB, "c1", "hi", "hello")
+    attempts = []
+
+    def job():
+        sql.commit_turn(turn)
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ConnectionError("lost ack")
+    queue = WriteBehindQueue(backoff=0.001)
+    queue.submit(job)
+    assert queue.flush(timeout=5)
+    assert len(attempts) == 2
+    assert len(sql.messages("alice", TAB, "c1")) == 2
+
+
+def test_message_ids_are_stable():
+    m = {"role": "user", "content": "hi", "timestamp": "t"}
+    assert message_id(TAB, "c1", m) == message_id(TAB, "c1", dict(m))
+    assert message_id(TAB, "c1", m) != message_id(TAB, "c2", m)
+    assert message_id(TAB, "c1", m) != message_id(TAB, "c1", dict(m, content="hi!"))
+
+
+def test_messages_paging(sql):
+    sql.commit_turn(make_turn("alice", TAB, "c1", *[f"m{i}" for i in range(6)]))
+    newest = sql.messages("alice", TAB, "c1", limit=2, newest_first=True)
+    assert [m["content"] for m in newest] == ["m4", "m5"]
+    older = sql.messages("alice", TAB, "c1", before=newest[0]["timestamp"], limit=2, newest_first=True)
+    assert [m["content"] for m in older] == ["m2", "m3"]
+    assert [m["content"] for m in sql.messages("alice", TAB, "c1", since=newest[0]["timestamp"])] == ["m5"]
+
+
+def test_list_sessions_cursor(sql):
+    for i in range(5):
+        sql.commit_turn(make_turn("alice", TAB, f"c{i}", "hi", at=f"2024-01-0{i + 1}T00:00:00"))
+    first = sql.list_sessions("alice", TAB, 2)
+    rest = sql.list_sessions("alice", TAB, 10, cursor=first[-1]["chat_id"])
+    assert [s["chat_id"] for s in first] == ["c4", "c3"]
+    assert [s["chat_id"] for s in rest] == ["c2", "c1", "c0"]
+
+
+def test_summaries(sql):
+    sql.set_summary("alice", TAB, "c1", {"content": "s", "covered_until": "t", "covered_count": 2,
+                                         "updated_at": "u"})
+    assert sql.get_summary("alice", TAB, "c1")["covered_count"] == 2
+    assert sql.get_summary("alice", TAB, "c2") == {}
+
+
+def test_import_is_idempotent(sql):
+    records = [
+        {"type": "session", "tab": TAB, "chat_id": "c1", "title": "t"},
+        {"type": "message", "tab": TAB, "chat_id": "c1", "role": "user", "content": "a", "timestamp": "2024-01-01"},
+        {"type": "message", "tab": TAB, "chat_id": "c1", "role": "assistant", "content": "b", "timestamp": "2024-01-02"},
+        {"type": "message", "tab": TAB, "chat_id": "c2", "role": "user", "content": "c", "timestamp": "2024-01-03"}
+    ]
+    assert sql.import_records("alice", records) == {"session": 1, "message": 3}
+    assert sql.import_records("alice", records) == {"session": 1, "message": 0, "duplicate": 3}
+    sessions = {s["chat_id"]: s for s in sql.list_sessions("alice", TAB, 10)}
+    assert sessions["c1"]["message_count"] == 2 and sessions["c2"]["message_count"] == 1
+    # Sessions without a created_at are dated so that they are listed
+    assert sessions["c1"]["created_at"] and sessions["c2"]["created_at"] == "2024-01-03"
+
+
+def test_deletes(sql):
+    sql.commit_turn(make_turn("alice", TAB, "c1", "hi"))
+    sql.commit_turn(make_turn("alice", TAB, "c2", "hi"))
+    assert sql.delete_session("alice", TAB, "c1") > 0
+    assert [s["chat_id"] for s in sql.list_sessions("alice", TAB, 10)] == ["c2"]
+    sql.delete_user("alice")
+    assert sql.get_user("alice") is None
+    assert sql.list_sessions("alice", TAB, 10) == []
+
+
+def test_jobs(sql):
+    sql.put_job("j1", {"job_id": "j1", "status": "running", "expires_at": "9999"})
+    sql.put_job("j1", {"job_id": "j1", "status": "done", "expires_at": "9999"})
+    assert sql.get_job("j1")["status"] == "done"
+    assert sql.get_job("nope") is None
+
+
+def test_files_in_use_are_not_evicted(sql):
+    for i in range(3):
+        sql.put_file("alice", f"d{i}", {"kind": "text", "chars": 1, "chunks": ["x"], "preview": "x",
+                                        "created_at": f"2024-01-0{i + 1}", "last_used_at": f"2024-01-0{i + 1}"})
+    sql.attach_file("alice", TAB, "c1", "d0", "old.txt", "2024-01-01")
+    # d0 is the least recently used but still referenced by a session
+    assert sql.evict_files("alice", keep=1) == ["d1"]
+    assert sql.get_file("alice", "d0") is not None
+    sql.touch_file("alice", "d0", "2024-02-01")
+    assert sql.get_file("alice", "d0")["last_used_at"] == "2024-02-01"
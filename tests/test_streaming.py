@@ -0,0 +1,54 @@
+import json
+
+from conftest import STREAM, TAB, events
+
+
+def test_chat_streams_tokens_then_done(app_module, login):
+    _, client = login()
+    response = client.post("/chat", json={"message": "stream this reply", "tab": TAB, "chat_id": "s1"},
+                           headers=STREAM)
+    assert response.mimetype == "text/event-stream"
+    assert response.headers["Cache-Control"] == "no-cache"
+    sent = events(response.get_data(as_text=True))
+    response.close()
+    assert sent[0] == ("start", {"chat_id": "s1", "context_tokens": sent[0][1]["context_tokens"]})
+    done = sent[-1]
+    assert done[0] == "done"
+    assert "".join(d["text"] for e, d in sent if e == "token").strip() == done[1]["reply"]
+
+    app_module.write_queue.flush()
+    history = client.get(f"/history/{TAB}/s1").json
+    assert [m["content"] for m in history] == ["stream this reply", done[1]["reply"]]
+    assert app_module.admission.stats()["in_flight"] == 0
+
+
+def test_json_is_the_default(login):
+    _, client = login()
+    response = client.post("/chat", json={"message": "hi", "tab": TAB, "chat_id": "s1"})
+    assert response.mimetype == "application/json" and response.json["reply"]
+
+
+def test_a_client_that_leaves_keeps_the_partial_reply(app_module, login):
+    _, client = login()
+    response = client.post("/chat", json={"message": "one two three four five six", "tab": TAB, "chat_id": "s2"},
+                           headers=STREAM, buffered=False)
+    body = iter(response.response)
+    assert b"event: start" in next(body)
+    assert b"event: token" in next(body)
+    response.close()
+
+    assert app_module.admission.stats()["in_flight"] == 0
+
+    app_module.write_queue.flush()
+    archive = [json.loads(line) for line in client.get("/export").get_data().splitlines()]
+    user, reply = [r for r in archive if r["type"] == "message" and r["chat_id"] == "s2"]
+    assert user["content"] == "one two three four five six"
+    assert reply["content"] and reply["partial"]
+
+
+def test_chat_with_file_streams_too(login):
+    _, client = login()
+    response = client.post("/chat_with_file", data={"message": "hi", "tab": TAB, "chat_id": "s3"},
+                           headers=STREAM)
+    sent = [event for event, _ in events(response.get_data(as_text=True))]
+    assert sent[0] == "start" and sent[-1] == "done" and "token" in sent
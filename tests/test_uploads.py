@@ -0,0 +1,45 @@
+import io
+
+from conftest import TAB
+
+
+def send(client, data, filename="notes.txt", message="what does it say?", chat_id="f1"):
+    return client.post("/chat_with_file", data={"message": message, "tab": TAB, "chat_id": chat_id,
+                                                "file": (io.BytesIO(data), filename)})
+
+
+def test_an_upload_is_indexed_and_answered(app_module, login):
+    _, client = login()
+    response = send(client, "The quarterly revenue grew by ten percent.".encode("utf-8"))
+    assert response.status_code == 200 and response.json["reply"]
+    app_module.write_queue.flush()
+    history = client.get(f"/history/{TAB}/f1").json
+    assert [m["role"] for m in history] == ["user", "user", "assistant"]
+    assert history[1]["content"].startswith("[File: notes.txt] (1 sections indexed) The quarterly revenue")
+
+
+def test_unreadable_uploads_are_still_answered(app_module, login):
+    _, client = login()
+    response = send(client, b"\x00\x01\x02 not a document", filename="blob.bin")
+    assert response.status_code == 200
+    app_module.write_queue.flush()
+    assert "no readable text" in client.get(f"/history/{TAB}/f1").json[1]["content"]
+
+
+def test_oversized_uploads_get_413(app_module, login, monkeypatch):
+    _, client = login()
+    monkeypatch.setitem(app_module.app.config, "MAX_CONTENT_LENGTH", 1024)
+    response = send(client, b"x" * 4096)
+    assert response.status_code == 413 and "too large" in response.json["reply"]
+
+
+def test_the_same_content_is_extracted_once(app_module, login, store, monkeypatch):
+    username, client = login()
+    extracted = []
+    extract_text = app_module.extract_text
+    monkeypatch.setattr(app_module, "extract_text", lambda *args: extracted.append(1) or extract_text(*args))
+    for chat_id in ("f1", "f2"):
+        assert send(client, b"Same brief, uploaded twice.", chat_id=chat_id).status_code == 200
+    app_module.write_queue.flush()
+    assert len(extracted) == 1
+    assert [name for _, name in store.session_files(username, TAB, "f2")] == ["notes.txt"]
@@ -0,0 +1,75 @@
+import threading
+import time
+
+from write_queue import WriteBehindQueue
+
+
+def test_jobs_run_in_order():
+    queue = WriteBehindQueue()
+    seen = []
+    for i in range(20):
+        queue.submit(lambda i=i: seen.append(i), key="k")
+    assert queue.flush(timeout=5)
+    assert seen == list(range(20))
+    assert queue.depth() == 0
+
+
+def test_wait_blocks_until_the_key_has_landed():
+    queue = WriteBehindQueue()
+    release = threading.Event()
+    done = []
+    queue.submit(lambda: (release.wait(5), done.append("a")), key="a")
+    assert not queue.wait("a", timeout=0.05)
+    assert queue.wait("b", timeout=0.05)
+    release.set()
+    assert queue.wait("a", timeout=5)
+    assert done == ["a"]
+
+
+def test_a_job_with_several_keys_holds_each_of_them():
+    queue = WriteBehindQueue()
+    release = threading.Event()
+    queue.submit(lambda: release.wait(5), key=["a", "b"])
+    assert not queue.wait("b", timeout=0.05)
+    release.set()
+    assert queue.wait("a", timeout=5) and queue.wait("b", timeout=5)
+
+
+def test_failures_are_retried_then_dropped():
+    queue = WriteBehindQueue(max_retries=2, backoff=0.001)
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 2:
+            raise RuntimeError("transient")
+    queue.submit(flaky)
+
+    def broken():
+        raise RuntimeError("permanent")
+    queue.submit(broken)
+
+    assert queue.flush(timeout=5)
+    assert len(attempts) == 2
+    assert queue.failed == 1
+
+
+def test_closed_queue_runs_jobs_inline():
+    queue = WriteBehindQueue()
+    queue.close(timeout=1)
+    thread = []
+    queue.submit(lambda: thread.append(threading.current_thread()))
+    assert thread == [threading.current_thread()]
+
+
+def test_full_queue_commits_inline():
+    queue = WriteBehindQueue(maxsize=1, put_timeout=0.01)
+    release = threading.Event()
+    queue.submit(lambda: release.wait(5))
+    time.sleep(0.05)
+    queue.submit(lambda: None)          # fills the queue
+    ran = []
+    queue.submit(lambda: ran.append(threading.current_thread()))
+    assert ran == [threading.current_thread()]
+    release.set()
+    assert queue.flush(timeout=5)
@@ -0,0 +1,140 @@
+import logging
+import queue
+import random
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger("chat-service")
+
+
+class WriteBehindQueue:
+    """
+    Bounded in-process queue that runs persistence jobs off the request path.
+
+    Jobs are plain callables (usually a Firestore batch commit). A single
+    background thread executes them in submission order and retries failures
+    with jittered exponential backoff. Each job may carry a `key` so readers
+    can wait until everything queued for, say, one chat session has landed
+    before they read it back.
+    """
+
+    def __init__(self, maxsize=1000, max_retries=5, backoff=0.5, put_timeout=2.0):
+        self._queue       = queue.Queue(maxsize)
+        self._max_retries = max_retries
+        self._backoff     = backoff
+        self._put_timeout = put_timeout
+        self._pending     = Counter()
+        self._inflight    = 0
+        self._cond        = threading.Condition()
+        self._thread      = None
+        self._closed      = False
+        self.failed       = 0
+
+    # ─── Producer side ──────────────────────────────────────────────────────────
+    def submit(self, job, key=None):
+        """
+        Queue `job` for background execution.
+
+        When the queue stays full for `put_timeout` seconds (the backend is
+        down or far behind) the job runs inline instead, which slows the
+        caller down rather than dropping the write. A job that writes
+        several sessions passes a list of keys as `key`.
+        """
+        if self._closed:
+            self._execute(job)
+            return
+
+        keys = key if isinstance(key, list) else [key]
+        self._ensure_worker()
+        with self._cond:
+            for k in keys:
+                self._pending[k] += 1
+            self._inflight += 1
+        try:
+            self._queue.put((job, keys), timeout=self._put_timeout)
+        except queue.Full:
+            logger.warning("Write queue full; committing inline")
+            try:
+                self._execute(job)
+            finally:
+                self._done(keys)
+
+    def depth(self):
+        """Jobs queued or currently executing."""
+        with self._cond:
+            return self._inflight
+
+    def wait(self, key, timeout=5.0):
+        """Block until no job for `key` is pending. Returns False on timeout."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._pending[key]:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def flush(self, timeout=None):
+        """Block until the queue is empty. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._inflight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout=None):
+        """Flush outstanding jobs; later submissions run inline."""
+        drained = self.flush(timeout)
+        self._closed = True
+        if not drained:
+            logger.error(f"Write queue closed with {self.depth()} job(s) unflushed")
+        return drained
+
+    # ─── Worker side ────────────────────────────────────────────────────────────
+    def _ensure_worker(self):
+        # Started lazily so a process that forks after import (gunicorn with
+        # preload) still gets a live thread in every worker.
+        if self._thread is None or not self._thread.is_alive():
+            with self._cond:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(
+                        target=self._run, name="write-behind", daemon=True
+                    )
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            job, keys = self._queue.get()
+            try:
+                self._execute(job)
+            finally:
+                self._done(keys)
+                self._queue.task_done()
+
+    def _execute(self, job):
+        for attempt in range(self._max_retries + 1):
+            try:
+                job()
+                return
+            except Exception as e:
+                if attempt == self._max_retries:
+                    self.failed += 1
+                    logger.error(f"Write-behind job dropped after {attempt + 1} attempts: {e}")
+                    return
+                delay = self._backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+                logger.warning(f"Write-behind job failed ({e}); retrying in {delay:.2f}s")
+                time.sleep(delay)
+
+    def _done(self, keys):
+        with self._cond:
+            for key in keys:
+                self._pending[key] -= 1
+                if self._pending[key] <= 0:
+                    del self._pending[key]
+            self._inflight -= 1
+            self._cond.notify_all()